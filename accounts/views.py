@@ -18,6 +18,8 @@ from authentication.serializers import PublicUserSerializer
 from classifieds.models import Item
 from classifieds.serializers import ItemLSerializer
 
+from backend.pagination import LimitOffsetPagination
+
 from pure_pagination import Paginator, EmptyPage, PageNotAnInteger
 
 
@@ -71,12 +73,13 @@ class PasswordChangeView(DjangoPasswordChangeView):
     form_class = PasswordChangeForm
 
 
-class Pagination(pagination.LimitOffsetPagination):
+class Pagination(LimitOffsetPagination):
     def get_paginated_response(self, data):
         return Response(
             OrderedDict(
                 [
                     ("count", self.count),
+                    ("count_type", self.get_count_type()),
                     ("offset", self.offset + self.limit),
                     ("results", data),
                 ]
@@ -106,10 +109,8 @@ class UsersViewSet(viewsets.ModelViewSet):
 
     @action(["get"], detail=True)
     def items(self, request, *args, **kwargs):
-        queryset = (
-            Item.objects.select_related("category", "location")
-            .prefetch_related("image_set")
-            .filter(author=self.get_object())
+        queryset = Item.objects.select_related("category", "location").filter(
+            author=self.get_object()
         )
 
         page = self.paginate_queryset(queryset)
@@ -1,12 +1,13 @@
-from django.core.files.base import ContentFile
-from django.db import models
+from django.db import models, transaction
 from django.db.models.signals import post_delete
 from django.dispatch import receiver
 from django.contrib.auth.models import BaseUserManager, AbstractBaseUser
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
-from sorl.thumbnail import get_thumbnail, delete
+from sorl.thumbnail import delete
+
+from backend.images import delete_renditions, needs_renditions
 
 
 class UserManager(BaseUserManager):
@@ -75,27 +76,21 @@ class User(AbstractBaseUser):
 class Image(models.Model):
     user = models.OneToOneField("authentication.User", on_delete=models.CASCADE)
     file = models.ImageField(null=True, blank=True)
+    renditions = models.JSONField(default=dict, blank=True)
 
     def save(self, *args, **kwargs):
         super().save(*args, **kwargs)
 
-        if self.file:
-            tmp_file_name = self.file.name
-            if self.file.width > 600 or self.file.height > 600:
-                new_width = 600
-                new_height = 600
+        if needs_renditions(self):
+            from .tasks import process_user_image
 
-                resized = get_thumbnail(
-                    self.file, "{}x{}".format(new_width, new_height)
-                )
-                name = resized.name.split("/")[-1]
-                self.file.save(name, ContentFile(resized.read()), True)
-                delete(tmp_file_name)
+            transaction.on_commit(lambda: process_user_image.delay(self.id))
 
 
 @receiver(post_delete, sender=Image)
 def delete_image(sender, instance, **kwargs):
     delete(instance.file.name)
+    delete_renditions(instance.renditions)
 
 
 class Bookmark(models.Model):
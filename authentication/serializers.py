@@ -10,15 +10,18 @@ from rest_framework.exceptions import ValidationError
 from .models import Image, Bookmark
 from .utils import decode_uid
 
+from backend.images import RenditionsField
 from classifieds.serializers import ItemLSerializer
 
 User = get_user_model()
 
 
 class ImageSerializer(serializers.ModelSerializer):
+    renditions = RenditionsField()
+
     class Meta:
         model = Image
-        fields = ("file",)
+        fields = ("file", "renditions")
 
 
 class BookmarkSerializer(serializers.ModelSerializer):
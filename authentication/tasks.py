@@ -0,0 +1,17 @@
+from authentication.models import Image
+
+from backend.images import process_image
+from classifieds.documents import schedule_documents
+from classifieds.models import Item
+
+from celery import shared_task
+
+
+@shared_task
+def process_user_image(image_id, force=False):
+    if process_image(Image, image_id, force) is None:
+        return False
+    schedule_documents(
+        Item.objects.filter(author__image__id=image_id).values_list("id", flat=True)
+    )
+    return True
@@ -1,3 +1,48 @@
+from django.contrib.auth import get_user_model
 from django.test import TestCase
 
-# Create your tests here.
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from .views import UserBookmarkViewSet
+
+from classifieds.models import Category, Item
+from locations.models import Location
+
+User = get_user_model()
+
+
+class BookmarkTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("user@example.com", "user")
+        self.item = Item.objects.create(
+            author=self.user,
+            category=Category.objects.create(name="category"),
+            location=Location.objects.create(name="location"),
+            title="title",
+            description="description",
+            attributes={},
+        )
+
+    def post(self, action):
+        request = APIRequestFactory().post("/")
+        force_authenticate(request, self.user)
+        view = UserBookmarkViewSet.as_view({"post": action})
+        return view(request, item=self.item.id).data
+
+    def get_count(self):
+        self.item.refresh_from_db()
+        return self.item.bookmarks
+
+    def test_counter_follows_bookmarks(self):
+        self.assertEqual(self.post("bookmark"), {"bookmarked": True})
+        self.assertEqual(self.post("bookmark"), {"bookmarked": False})
+        self.assertEqual(self.get_count(), 1)
+        self.assertEqual(self.post("unbookmark"), {"unbookmarked": True})
+        self.assertEqual(self.post("unbookmark"), {"unbookmarked": False})
+        self.assertEqual(self.get_count(), 0)
+
+    def test_full_save_keeps_the_counter(self):
+        self.post("bookmark")
+        self.item.title = "other"
+        self.item.save()
+        self.assertEqual(self.get_count(), 1)
@@ -1,7 +1,5 @@
 from collections import OrderedDict
 
-from django.conf import settings
-from django.core.mail import send_mail
 from django.contrib.auth import login, logout, get_user_model, update_session_auth_hash
 from django.contrib.auth.tokens import default_token_generator
 from django.contrib.auth.views import (
@@ -13,6 +11,8 @@ from django.contrib.auth.views import (
     PasswordResetCompleteView as DjangoPasswordResetCompleteView
 )
 from django.contrib.sites.shortcuts import get_current_site
+from django.db import transaction
+from django.db.models import F
 from django.template.loader import render_to_string
 from django.urls import reverse_lazy
 from django.utils import timezone
@@ -38,8 +38,16 @@ from .serializers import (
 )
 from .utils import encode_uid
 
-from classifieds.models import Item
-from classifieds.serializers import ManageItemLSerializer
+from backend.pagination import LimitOffsetPagination
+
+from classifieds.counters import add_pending_views
+from classifieds.engagement import get_item_stats, record_event
+from classifieds.models import Item, ItemEvent
+from classifieds.serializers import ItemStatSerializer, ManageItemLSerializer
+
+from direct.unread import get_unread, reset_unread
+
+from outbox.mail import queue_mail
 
 from promotion.models import PaymentHistory
 from promotion.serializers import PaymentHistorySerializer
@@ -81,12 +89,13 @@ class PasswordResetCompleteView(DjangoPasswordResetCompleteView):
     template_name = 'authentication/password_reset_complete.html'
 
 
-class Pagination(pagination.LimitOffsetPagination):
+class Pagination(LimitOffsetPagination):
     def get_paginated_response(self, data):
         return Response(
             OrderedDict(
                 [
                     ("count", self.count),
+                    ("count_type", self.get_count_type()),
                     ("offset", self.offset + self.limit),
                     ("results", data),
                 ]
@@ -142,20 +151,19 @@ class UserViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
 
-        user = serializer.save()
-        login(self.request, user)
+        with transaction.atomic():
+            user = serializer.save()
 
-        context = {
-            "user": user,
-            "protocol": self.request.scheme,
-            "domain": get_current_site(self.request).domain,
-            "uid": encode_uid(user.pk),
-            "token": default_token_generator.make_token(user),
-        }
-        message = render_to_string("email/activation_message.txt", context)
-        send_mail(
-            "メールアドレスを認証してください", message, settings.DEFAULT_FROM_EMAIL, [user.email]
-        )
+            context = {
+                "user": user,
+                "protocol": self.request.scheme,
+                "domain": get_current_site(self.request).domain,
+                "uid": encode_uid(user.pk),
+                "token": default_token_generator.make_token(user),
+            }
+            message = render_to_string("email/activation_message.txt", context)
+            queue_mail("メールアドレスを認証してください", message, [user.email])
+        login(self.request, user)
 
         return Response(
             data=AuthUserSerializer(user).data, status=status.HTTP_201_CREATED
@@ -165,23 +173,22 @@ class UserViewSet(viewsets.ModelViewSet):
         old_user = self.get_instance()
         new_email = serializer.validated_data.get("email")
 
-        if old_user.email != new_email:
-            context = {
-                "user": old_user,
-                "protocol": self.request.scheme,
-                "domain": get_current_site(self.request).domain,
-                "uid": encode_uid(old_user.pk),
-                "token": default_token_generator.make_token(old_user),
-            }
-            message = render_to_string("email/activation_message.txt", context)
-            send_mail(
-                "メールアドレスを認証してください", message, settings.DEFAULT_FROM_EMAIL, [new_email]
-            )
-            serializer.save(email_confirmed=False)
-        else:
-            serializer.save()
+        with transaction.atomic():
+            if old_user.email != new_email:
+                context = {
+                    "user": old_user,
+                    "protocol": self.request.scheme,
+                    "domain": get_current_site(self.request).domain,
+                    "uid": encode_uid(old_user.pk),
+                    "token": default_token_generator.make_token(old_user),
+                }
+                message = render_to_string("email/activation_message.txt", context)
+                queue_mail("メールアドレスを認証してください", message, [new_email])
+                serializer.save(email_confirmed=False)
+            else:
+                serializer.save()
 
-        serializer.save()
+            serializer.save()
 
     @action(["get", "put", "patch", "delete"], detail=False)
     def me(self, request, *args, **kwargs):
@@ -218,9 +225,7 @@ class UserViewSet(viewsets.ModelViewSet):
             "token": default_token_generator.make_token(user),
         }
         message = render_to_string("email/activation_message.txt", context)
-        send_mail(
-            "メールアドレスを認証してください", message, settings.DEFAULT_FROM_EMAIL, [user.email]
-        )
+        queue_mail("メールアドレスを認証してください", message, [user.email])
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(["post"], detail=False, url_path="set-password")
@@ -250,7 +255,7 @@ class UserViewSet(viewsets.ModelViewSet):
                 "token": default_token_generator.make_token(user),
             }
             message = render_to_string("email/password_reset_message.txt", context)
-            send_mail("パスワードの再設定", message, settings.DEFAULT_FROM_EMAIL, [user.email])
+            queue_mail("パスワードの再設定", message, [user.email])
 
         return Response(status=status.HTTP_204_NO_CONTENT)
 
@@ -267,10 +272,13 @@ class UserViewSet(viewsets.ModelViewSet):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(["post"], detail=False, url_path="confirm-direct")
+    @transaction.atomic
     def confirm_direct(self, request, *args, **kwargs):
         user = self.get_instance()
         user.direct_confirmed_at = timezone.now()
-        user.save()
+        user.save(update_fields=["direct_confirmed_at"])
+        if get_unread(user)[0]:
+            reset_unread(user.id)
         return Response(status=status.HTTP_200_OK)
 
 
@@ -304,11 +312,24 @@ class UserItemViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         if self.action == "list":
-            return self.queryset.prefetch_related(
-                "image_set", "bookmark_set", "promotion_set__type"
-            ).filter(author=self.request.user)
+            return self.queryset.filter(author=self.request.user)
         return super().get_queryset()
 
+    @action(["get"], detail=True)
+    def stats(self, request, *args, **kwargs):
+        instance = self.get_object()
+        if instance.author != self.request.user:
+            raise exceptions.PermissionDenied()
+        stats = get_item_stats(instance)
+        return Response(
+            {
+                "views": add_pending_views(instance),
+                "bookmarks": instance.bookmarks,
+                "hourly": ItemStatSerializer(stats["hourly"], many=True).data,
+                "daily": ItemStatSerializer(stats["daily"], many=True).data,
+            }
+        )
+
 
 class UserBookmarkViewSet(viewsets.ModelViewSet):
     serializer_class = BookmarkSerializer
@@ -325,24 +346,31 @@ class UserBookmarkViewSet(viewsets.ModelViewSet):
     @action(["post"], detail=True)
     def bookmark(self, request, *args, **kwargs):
         bookmarked = False
-        _, created = Bookmark.objects.get_or_create(
-            user=self.request.user, item_id=self.kwargs["item"]
-        )
-        if created:
-            bookmarked = True
+        with transaction.atomic():
+            _, created = Bookmark.objects.get_or_create(
+                user=self.request.user, item_id=self.kwargs["item"]
+            )
+            if created:
+                Item.objects.filter(id=self.kwargs["item"]).update(
+                    bookmarks=F("bookmarks") + 1
+                )
+                record_event(self.kwargs["item"], ItemEvent.Type.BOOKMARK)
+                bookmarked = True
         return Response({"bookmarked": bookmarked})
 
     @action(["post"], detail=True)
     def unbookmark(self, request, *args, **kwargs):
         unbookmarked = False
-        try:
-            bookmark = Bookmark.objects.get(
+        with transaction.atomic():
+            deleted, _ = Bookmark.objects.filter(
                 user=self.request.user, item_id=self.kwargs["item"]
-            )
-            bookmark.delete()
-            unbookmarked = True
-        except Bookmark.DoesNotExist:
-            pass
+            ).delete()
+            if deleted:
+                Item.objects.filter(id=self.kwargs["item"]).update(
+                    bookmarks=F("bookmarks") - 1
+                )
+                record_event(self.kwargs["item"], ItemEvent.Type.BOOKMARK, -1)
+                unbookmarked = True
         return Response({"unbookmarked": unbookmarked})
 
     @action(["get"], detail=False)
@@ -352,7 +380,6 @@ class UserBookmarkViewSet(viewsets.ModelViewSet):
             .prefetch_related(
                 "item__category",
                 "item__location",
-                "item__image_set",
             )
             .filter(user=self.request.user)
         )
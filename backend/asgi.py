@@ -13,4 +13,14 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from direct.stream import DIRECT_EVENTS_PATH, application as events_application
+
+
+async def application(scope, receive, send):
+    # The direct message event stream is long-lived, so it bypasses Django's
+    # request handling instead of holding a request thread per connection.
+    if scope["type"] == "http" and scope["path"] == DIRECT_EVENTS_PATH:
+        return await events_application(scope, receive, send)
+    return await django_application(scope, receive, send)
@@ -0,0 +1,134 @@
+from functools import wraps
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.http import HttpResponse
+
+from rest_framework.renderers import JSONRenderer
+
+import hashlib
+
+
+RESULT_CACHE_TIMEOUT = getattr(settings, "RESULT_CACHE_TIMEOUT", 300)
+
+registry = []
+
+
+def is_shared_cache():
+    return not isinstance(caches[DEFAULT_CACHE_ALIAS], (LocMemCache, DummyCache))
+
+
+@checks.register(checks.Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """
+    The result cache tags, the count generations, the buffered item views,
+    the category snapshot version, the direct message events and the task
+    locks all live in the default cache, so every process has to see the
+    same one. Only the single-process development server may run without.
+    """
+    if is_shared_cache():
+        return []
+    message = "The default cache is local to each process."
+    hint = "Set CACHE_URL to memcached, redis or a file cache."
+    if settings.DEBUG:
+        return [checks.Warning(message, hint=hint, id="backend.W001")]
+    return [checks.Error(message, hint=hint, id="backend.E001")]
+
+
+def get_tag_key(tag):
+    return "result-cache:tag:%s" % tag
+
+
+def invalidate_tags(tags):
+    for tag in tags:
+        try:
+            cache.incr(get_tag_key(tag))
+        except ValueError:
+            cache.set(get_tag_key(tag), 1, None)
+
+
+def get_tag_versions(tags):
+    keys = [get_tag_key(tag) for tag in tags]
+    versions = cache.get_many(keys)
+    missing = {key: 1 for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+def canonicalize(query_params, params):
+    """
+    Returns the query parameters the view depends on as a sorted list, with
+    the keyword's whitespace collapsed and unknown or empty parameters dropped.
+    """
+    canonical = []
+    for param in sorted(params):
+        value = query_params.get(param)
+        if param == "keyword" and value:
+            value = " ".join(value.split())
+        if value:
+            canonical.append((param, value))
+    return canonical
+
+
+def record(name, result):
+    key = "result-cache:%s:%s" % (result, name)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+
+
+def get_metrics():
+    metrics = {}
+    for name in registry:
+        counts = cache.get_many(
+            ["result-cache:hits:%s" % name, "result-cache:misses:%s" % name]
+        )
+        metrics[name] = {
+            "hits": counts.get("result-cache:hits:%s" % name, 0),
+            "misses": counts.get("result-cache:misses:%s" % name, 0),
+        }
+    return metrics
+
+
+def cache_result(name, params, get_tags):
+    """
+    Caches the rendered JSON of an anonymous GET response, keyed by the
+    canonical query parameters and the current versions of the tags returned
+    by get_tags(query_params). Bumping any of the tags retires the entry.
+    """
+    registry.append(name)
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(self, request, *args, **kwargs):
+            if request.user.is_authenticated:
+                return func(self, request, *args, **kwargs)
+
+            canonical = canonicalize(request.query_params, params)
+            tags = get_tags(request.query_params)
+            digest = hashlib.md5(
+                ("%r%r" % (canonical, get_tag_versions(tags))).encode()
+            ).hexdigest()
+            key = "result-cache:%s:%s" % (name, digest)
+
+            content = cache.get(key)
+            if content is not None:
+                record(name, "hits")
+                return HttpResponse(content, content_type="application/json")
+
+            record(name, "misses")
+            response = func(self, request, *args, **kwargs)
+            if response.status_code == 200:
+                content = JSONRenderer().render(response.data)
+                cache.set(key, content, RESULT_CACHE_TIMEOUT)
+            return response
+
+        return wrapper
+
+    return decorator
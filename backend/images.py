@@ -0,0 +1,202 @@
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+from rest_framework import serializers
+
+from PIL import Image, ImageOps
+
+import io
+import os
+import uuid
+
+
+RENDITIONS = {
+    "thumb": (300, 300, True),
+    "detail": (600, 600, False),
+    "full": (1600, 1600, False),
+}
+
+FORMATS = (
+    ("webp", "WEBP", {"quality": 80, "method": 4}),
+    ("jpg", "JPEG", {"quality": 85, "optimize": True, "progressive": True}),
+)
+
+
+ORIENTATION = 0x0112
+
+METADATA_INFO_KEYS = ("xmp", "XML:com.adobe.xmp", "comment", "photoshop")
+
+# Formats whose originals are rewritten without metadata, with their save
+# options. GIFs carry no EXIF and are left alone.
+STRIP_FORMATS = {
+    "JPEG": {"quality": "keep", "optimize": True},
+    "PNG": {"optimize": True},
+    "WEBP": {"quality": 90, "method": 4},
+}
+# Pillow can only reuse the quantization tables of a plain JPEG, so the
+# JPEGs it reads as MPO are written with this quality instead.
+MPO_QUALITY = 95
+
+
+def get_format(image):
+    # Phone cameras often write multi-picture JPEGs, which Pillow reads as MPO.
+    return "JPEG" if image.format == "MPO" else image.format
+
+
+def has_metadata(image):
+    if any(tag != ORIENTATION for tag in image.getexif()):
+        return True
+    if any(key in image.info for key in METADATA_INFO_KEYS):
+        return True
+    if get_format(image) == "JPEG":
+        # XMP (APP1 without the Exif header) and IPTC (APP13) segments.
+        for marker, data in image.applist:
+            if marker == "APP13" or (marker == "APP1" and data[:4] != b"Exif"):
+                return True
+    if image.format == "PNG" and image.text:
+        return True
+    return False
+
+
+def strip_metadata(file):
+    """
+    Writes a copy of the original image file without its metadata (EXIF with
+    the GPS position, XMP, IPTC, comments) and returns its name, or None when
+    there is nothing to strip. Only the orientation and the color profile are
+    kept, and JPEGs are written with their own quantization tables (MPOs with
+    MPO_QUALITY).
+    """
+    file.open("rb")
+    try:
+        with Image.open(file) as image:
+            format = get_format(image)
+            if format not in STRIP_FORMATS or not has_metadata(image):
+                return None
+            options = dict(STRIP_FORMATS[format])
+            if image.format == "MPO":
+                options["quality"] = MPO_QUALITY
+            orientation = image.getexif().get(ORIENTATION)
+            if orientation:
+                exif = Image.Exif()
+                exif[ORIENTATION] = orientation
+                options["exif"] = exif.tobytes()
+            if image.info.get("icc_profile"):
+                options["icc_profile"] = image.info["icc_profile"]
+            buffer = io.BytesIO()
+            image.save(buffer, format, **options)
+    finally:
+        file.close()
+
+    directory, name = os.path.split(file.name)
+    name = "%s%s" % (uuid.uuid4(), os.path.splitext(name)[1])
+    return default_storage.save(
+        os.path.join(directory, name), ContentFile(buffer.getvalue())
+    )
+
+
+def render(image, width, height, crop):
+    if crop:
+        return ImageOps.fit(image, (width, height), Image.LANCZOS)
+    image = image.copy()
+    image.thumbnail((width, height), Image.LANCZOS)
+    return image
+
+
+def generate_renditions(file):
+    """
+    Writes every rendition of the image file in every format and returns a
+    {"source": name, rendition: {extension: name}} dict. The orientation is
+    applied to the pixels and no metadata is written, so EXIF is stripped.
+    """
+    file.open("rb")
+    try:
+        with Image.open(file) as source:
+            source = ImageOps.exif_transpose(source).convert("RGB")
+            key = uuid.uuid4().hex
+            renditions = {"source": file.name}
+            for rendition, (width, height, crop) in RENDITIONS.items():
+                image = render(source, width, height, crop)
+                renditions[rendition] = {}
+                for extension, format, options in FORMATS:
+                    buffer = io.BytesIO()
+                    image.save(buffer, format, **options)
+                    renditions[rendition][extension] = default_storage.save(
+                        "renditions/%s/%s.%s" % (key, rendition, extension),
+                        ContentFile(buffer.getvalue()),
+                    )
+    finally:
+        file.close()
+    return renditions
+
+
+def get_rendition_names(renditions):
+    return [
+        name
+        for rendition in RENDITIONS
+        for name in (renditions or {}).get(rendition, {}).values()
+    ]
+
+
+def delete_renditions(renditions):
+    for name in get_rendition_names(renditions):
+        default_storage.delete(name)
+
+
+def needs_renditions(instance):
+    if not instance.file:
+        return False
+    return instance.renditions.get("source") != instance.file.name
+
+
+def process_image(model, image_id, force=False):
+    """
+    Replaces the original of an image with a copy without metadata, generates
+    its renditions and publishes both with a single UPDATE that only applies
+    while the source file is still the same. Returns the published
+    renditions, or None when there was nothing to do.
+    """
+    instance = model.objects.filter(id=image_id).first()
+    if instance is None or not instance.file:
+        return None
+    if not force and not needs_renditions(instance):
+        return None
+
+    source = instance.file.name
+    stripped = strip_metadata(instance.file)
+    if stripped:
+        instance.file = stripped
+    renditions = generate_renditions(instance.file)
+    published = model.objects.filter(id=image_id, file=source).update(
+        file=instance.file.name, renditions=renditions
+    )
+    if not published:
+        delete_renditions(renditions)
+        if stripped:
+            default_storage.delete(stripped)
+        return None
+    delete_renditions(instance.renditions)
+    if stripped:
+        default_storage.delete(source)
+    return renditions
+
+
+def get_rendition_urls(renditions):
+    return {
+        rendition: {
+            extension: default_storage.url(name)
+            for extension, name in renditions[rendition].items()
+        }
+        for rendition in RENDITIONS
+        if rendition in (renditions or {})
+    }
+
+
+class RenditionsField(serializers.ReadOnlyField):
+    def to_representation(self, value):
+        urls = get_rendition_urls(value)
+        request = self.context.get("request", None)
+        if request is not None:
+            for formats in urls.values():
+                for extension, url in formats.items():
+                    formats[extension] = request.build_absolute_uri(url)
+        return urls
@@ -0,0 +1,252 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import InvalidPage, Page, Paginator
+from django.db import connections
+from django.db.models.signals import post_delete, post_save
+from django.utils.functional import cached_property
+
+from rest_framework import pagination
+from rest_framework.exceptions import NotFound
+from rest_framework.utils.urls import replace_query_param
+
+import hashlib
+
+
+COUNT_EXACT = "exact"
+COUNT_ESTIMATE = "estimate"
+COUNT_NONE = "none"
+
+COUNT_CACHE_TIMEOUT = getattr(settings, "COUNT_CACHE_TIMEOUT", 60)
+COUNT_ESTIMATE_THRESHOLD = getattr(settings, "COUNT_ESTIMATE_THRESHOLD", 100000)
+# The models whose listings are paginated; saving or deleting one of them
+# invalidates the cached counts of its listings.
+COUNT_MODELS = getattr(
+    settings,
+    "COUNT_MODELS",
+    [
+        "authentication.User",
+        "authentication.Bookmark",
+        "classifieds.Item",
+        "direct.Participant",
+        "promotion.PaymentHistory",
+    ],
+)
+
+
+def get_generation_key(label):
+    return "count-generation:%s" % label
+
+
+def get_generation(label):
+    return cache.get_or_set(get_generation_key(label), 1, None)
+
+
+def bump_generation(sender, **kwargs):
+    key = get_generation_key(sender._meta.label_lower)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+
+
+for label in COUNT_MODELS:
+    post_save.connect(bump_generation, sender=label)
+    post_delete.connect(bump_generation, sender=label)
+
+
+def get_count_cache_key(queryset):
+    sql, params = queryset.query.sql_with_params()
+    digest = hashlib.md5(("%s%r" % (sql, params)).encode()).hexdigest()
+    return "count:%s:%s:%s" % (
+        queryset.model._meta.label_lower,
+        get_generation(queryset.model._meta.label_lower),
+        digest,
+    )
+
+
+def get_cached_count(queryset):
+    key = get_count_cache_key(queryset)
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, COUNT_CACHE_TIMEOUT)
+    return count
+
+
+def get_estimated_count(queryset):
+    """
+    Returns the number of rows the MySQL optimizer expects the queryset to
+    match, estimated from the index statistics with EXPLAIN, or None when the
+    backend has no cheap estimate or the set is too small to need one.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != "mysql" or queryset.query.distinct:
+        return None
+    sql, params = queryset.order_by().values("pk").query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute("EXPLAIN " + sql, params)
+        columns = [column[0] for column in cursor.description]
+        plan = [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    # The rows the outer query produces are the product of the rows each of
+    # its tables contributes to the join after its conditions are applied.
+    count = 1
+    for step in plan:
+        if step["id"] == 1 and step["rows"] is not None:
+            count *= step["rows"] * (step["filtered"] or 100) / 100
+    count = int(count)
+    if count < COUNT_ESTIMATE_THRESHOLD:
+        return None
+    return count
+
+
+def get_count(queryset, count_mode):
+    """
+    Returns a (count, count_type) tuple. count_type is "exact", "estimated" or
+    None when the client asked to skip counting.
+    """
+    if count_mode == COUNT_NONE:
+        return None, None
+    if count_mode == COUNT_ESTIMATE:
+        count = get_estimated_count(queryset)
+        if count is not None:
+            return count, "estimated"
+    return get_cached_count(queryset), "exact"
+
+
+class CountPage(Page):
+    def __init__(self, object_list, number, paginator, has_next=None):
+        super().__init__(object_list, number, paginator)
+        self._has_next = has_next
+
+    def has_next(self):
+        if self._has_next is not None:
+            return self._has_next
+        return super().has_next()
+
+
+class CountPaginator(Paginator):
+    def __init__(self, *args, count_mode=COUNT_EXACT, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.count_mode = count_mode
+        self.count_type = None
+
+    @cached_property
+    def count(self):
+        count, self.count_type = get_count(self.object_list, self.count_mode)
+        return count
+
+    @cached_property
+    def num_pages(self):
+        if self.count is None:
+            return None
+        return super().num_pages
+
+    def validate_number(self, number):
+        if self.count is not None:
+            return super().validate_number(number)
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise InvalidPage()
+        if number < 1:
+            raise InvalidPage()
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if self.count is not None:
+            return super().page(number)
+
+        bottom = (number - 1) * self.per_page
+        object_list = list(self.object_list[bottom : bottom + self.per_page + 1])
+        if not object_list and number > 1:
+            raise InvalidPage()
+        return CountPage(
+            object_list[: self.per_page],
+            number,
+            self,
+            has_next=len(object_list) > self.per_page,
+        )
+
+
+class CountMixin:
+    count_query_param = "count"
+
+    def get_count_mode(self, request):
+        count_mode = request.query_params.get(self.count_query_param)
+        if count_mode in (COUNT_EXACT, COUNT_ESTIMATE, COUNT_NONE):
+            return count_mode
+        return COUNT_EXACT
+
+
+class PageNumberPagination(CountMixin, pagination.PageNumberPagination):
+    """
+    Page number pagination whose count is cached, estimated from index
+    statistics with `?count=estimate`, or skipped with `?count=none`.
+    """
+
+    django_paginator_class = CountPaginator
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        paginator = self.django_paginator_class(
+            queryset, page_size, count_mode=self.get_count_mode(request)
+        )
+        page_number = request.query_params.get(self.page_query_param, 1)
+        if page_number in self.last_page_strings and paginator.count is not None:
+            page_number = paginator.num_pages
+
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            msg = self.invalid_page_message.format(
+                page_number=page_number, message=str(exc)
+            )
+            raise NotFound(msg)
+
+        return list(self.page)
+
+    def get_count_type(self):
+        return self.page.paginator.count_type
+
+
+class LimitOffsetPagination(CountMixin, pagination.LimitOffsetPagination):
+    """
+    Limit/offset pagination with the same count modes as PageNumberPagination.
+    """
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+
+        self.offset = self.get_offset(request)
+        self.request = request
+        self.count, self.count_type = get_count(queryset, self.get_count_mode(request))
+
+        if self.count is None:
+            results = list(queryset[self.offset : self.offset + self.limit + 1])
+            self.has_next = len(results) > self.limit
+            return results[: self.limit]
+
+        self.has_next = self.offset + self.limit < self.count
+        if self.count == 0 or self.offset > self.count:
+            return []
+        return list(queryset[self.offset : self.offset + self.limit])
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.limit_query_param, self.limit)
+        return replace_query_param(
+            url, self.offset_query_param, self.offset + self.limit
+        )
+
+    def get_count_type(self):
+        return self.count_type
@@ -54,6 +54,7 @@ INSTALLED_APPS = [
     "direct",
     "promotion",
     "help",
+    "outbox",
 ]
 
 SITE_ID = 1
@@ -107,6 +108,18 @@ DATABASES = {
 }
 
 
+# Cache
+
+CACHES = {"default": env.cache("CACHE_URL")}
+
+COUNT_CACHE_TIMEOUT = 60
+COUNT_ESTIMATE_THRESHOLD = 100000
+
+RESULT_CACHE_TIMEOUT = 300
+
+VIEW_FLUSH_INTERVAL = 60
+
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -157,6 +170,16 @@ STATIC_ROOT = BASE_DIR / "static_cdn"
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
+IMAGE_UPLOAD_TEMP_DIR = BASE_DIR / "uploads"
+IMAGE_UPLOAD_MAX_SIZE = 20 * 1024 * 1024
+IMAGE_UPLOAD_CHUNK_SIZE = 1024 * 1024
+IMAGE_UPLOAD_MAX_PIXELS = 50000000
+
+MEDIA_GC_AGE = 60 * 60 * 24
+MEDIA_GC_BATCH_SIZE = 100
+MEDIA_GC_PAUSE = 1
+MEDIA_GC_LIMIT = 10000
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
@@ -188,6 +211,20 @@ SERVER_EMAIL = "no-reply@telopea.net"
 EMAIL_SUBJECT_PREFIX = ""
 ADMIN_EMAIL = "admin@telopea.net"
 
+OUTBOX_BATCH_SIZE = 100
+OUTBOX_MAX_ATTEMPTS = 8
+OUTBOX_RETRY_DELAY = 60
+OUTBOX_DEDUPE_WINDOW = 60 * 10
+
+
+# Direct message events
+
+DIRECT_EVENTS_PATH = "/api/v1/direct/events/"
+DIRECT_EVENT_TIMEOUT = 60 * 10
+DIRECT_EVENT_POLL_INTERVAL = 1
+DIRECT_LONG_POLL_TIMEOUT = 25
+DIRECT_SHORT_POLL_INTERVAL = 10
+
 
 # Rest
 
@@ -218,6 +255,36 @@ CORS_ALLOW_CREDENTIALS = True
 
 CELERY_TIMEZONE = "Asia/Tokyo"
 CELERY_RESULT_BACKEND = "django-db"
+CELERY_BEAT_SCHEDULE = {
+    "reconcile-bookmark-counts": {
+        "task": "classifieds.tasks.reconcile_bookmark_counts",
+        "schedule": 60 * 60 * 24,
+    },
+    "flush-view-counts": {
+        "task": "classifieds.tasks.flush_view_counts",
+        "schedule": 60,
+    },
+    "aggregate-item-events": {
+        "task": "classifieds.tasks.aggregate_item_events",
+        "schedule": 60 * 15,
+    },
+    "update-related-item-lists": {
+        "task": "classifieds.tasks.update_related_item_lists",
+        "schedule": 60 * 60,
+    },
+    "collect-media-garbage": {
+        "task": "classifieds.tasks.collect_media_garbage",
+        "schedule": 60 * 60 * 6,
+    },
+    "send-queued-emails": {
+        "task": "outbox.tasks.send_queued_emails",
+        "schedule": 60,
+    },
+    "purge-sent-emails": {
+        "task": "outbox.tasks.purge_sent_emails",
+        "schedule": 60 * 60 * 24,
+    },
+}
 
 
 # Stripe
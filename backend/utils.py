@@ -10,3 +10,56 @@ class BrowsableAPIRendererWithoutHTMLForms(BrowsableAPIRenderer):
 
     def get_raw_data_form(self, data, view, method, request):
         return None
+
+
+def rebuild_closure(model, closure_model, batch_size=1000):
+    parents = dict(model.objects.values_list("id", "parent_id"))
+
+    closures = []
+    for node_id in parents:
+        ancestor_id = node_id
+        depth = 0
+        while ancestor_id is not None and depth <= len(parents):
+            closures.append(
+                closure_model(
+                    ancestor_id=ancestor_id, descendant_id=node_id, depth=depth
+                )
+            )
+            ancestor_id = parents.get(ancestor_id)
+            depth += 1
+
+    closure_model.objects.all().delete()
+    closure_model.objects.bulk_create(closures, batch_size=batch_size)
+
+
+def update_closure(node, closure_model):
+    subtree = dict(
+        closure_model.objects.filter(ancestor_id=node.id).values_list(
+            "descendant_id", "depth"
+        )
+    )
+    subtree[node.id] = 0
+
+    closure_model.objects.filter(descendant_id__in=subtree).exclude(
+        ancestor_id__in=subtree
+    ).delete()
+    closure_model.objects.get_or_create(
+        ancestor_id=node.id, descendant_id=node.id, defaults={"depth": 0}
+    )
+
+    if node.parent_id is not None:
+        ancestors = closure_model.objects.filter(
+            descendant_id=node.parent_id
+        ).values_list("ancestor_id", "depth")
+        closure_model.objects.bulk_create(
+            [
+                closure_model(
+                    ancestor_id=ancestor_id,
+                    descendant_id=descendant_id,
+                    depth=ancestor_depth + 1 + descendant_depth,
+                )
+                for ancestor_id, ancestor_depth in ancestors
+                if ancestor_id not in subtree
+                for descendant_id, descendant_depth in subtree.items()
+            ]
+        )
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ClassifiedsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'classifieds'
+
+    def ready(self):
+        from . import documents  # noqa: F401
+        from backend import pagination  # noqa: F401
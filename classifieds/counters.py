@@ -0,0 +1,113 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+
+from .models import Item, ItemEvent
+
+from datetime import datetime, timezone
+import time
+
+
+VIEW_FLUSH_INTERVAL = getattr(settings, "VIEW_FLUSH_INTERVAL", 60)
+
+
+def get_views_key(item_id):
+    return "item-views:%s" % item_id
+
+
+def get_slot(timestamp=None):
+    return int((timestamp or time.time()) // VIEW_FLUSH_INTERVAL)
+
+
+def get_slot_key(slot):
+    return "item-views:slot:%s" % slot
+
+
+def get_slot_entry_key(slot, index):
+    return "item-views:slot:%s:%s" % (slot, index)
+
+
+def mark_dirty(item_id):
+    """
+    Appends the item to the dirty list of the current time slot. Entries are
+    separate keys indexed by an atomic counter, so concurrent writers never
+    overwrite each other.
+    """
+    slot = get_slot()
+    cache.add("item-views:flushed-slot", slot, None)
+    cache.add(get_slot_key(slot), 0, None)
+    index = cache.incr(get_slot_key(slot))
+    cache.set(get_slot_entry_key(slot, index), item_id, None)
+
+
+def record_view(item_id):
+    """
+    Adds one view to the item's pending counter. The first pending view
+    marks the item dirty so that flush_views() picks it up.
+    """
+    key = get_views_key(item_id)
+    cache.add(key, 0, None)
+    if cache.incr(key) == 1:
+        mark_dirty(item_id)
+
+
+def get_pending_views(item_ids):
+    keys = {get_views_key(item_id): item_id for item_id in item_ids}
+    pending = cache.get_many(keys)
+    return {item_id: pending.get(key, 0) for key, item_id in keys.items()}
+
+
+def add_pending_views(item):
+    return item.views + get_pending_views([item.id])[item.id]
+
+
+def flush_slot(slot):
+    count = cache.get(get_slot_key(slot)) or 0
+    entry_keys = [get_slot_entry_key(slot, index) for index in range(1, count + 1)]
+
+    created_at = datetime.fromtimestamp(slot * VIEW_FLUSH_INTERVAL, timezone.utc)
+    events = []
+    flushed = 0
+    for item_id in set(cache.get_many(entry_keys).values()):
+        key = get_views_key(item_id)
+        delta = cache.get(key)
+        if not delta:
+            continue
+        if cache.decr(key, delta) > 0:
+            mark_dirty(item_id)
+        if Item.objects.filter(id=item_id).update(views=F("views") + delta):
+            events.append(
+                ItemEvent(
+                    item_id=item_id,
+                    type=ItemEvent.Type.VIEW,
+                    count=delta,
+                    created_at=created_at,
+                )
+            )
+        flushed += delta
+
+    ItemEvent.objects.bulk_create(events)
+    cache.delete_many(entry_keys + [get_slot_key(slot)])
+    return flushed
+
+
+def flush_views():
+    """
+    Writes the pending counters of the items marked dirty in the completed
+    time slots to the database with F() increments, and returns the number
+    of views written.
+    """
+    if not cache.add("item-views:flush-lock", 1, VIEW_FLUSH_INTERVAL * 5):
+        return 0
+
+    try:
+        current_slot = get_slot()
+        slot = cache.get("item-views:flushed-slot", current_slot - 1)
+        flushed = 0
+        while slot < current_slot:
+            flushed += flush_slot(slot)
+            slot += 1
+            cache.set("item-views:flushed-slot", slot, None)
+        return flushed
+    finally:
+        cache.delete("item-views:flush-lock")
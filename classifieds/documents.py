@@ -0,0 +1,149 @@
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .counters import get_pending_views
+from .models import Category, Image, Item, ItemDocument
+from .serializers import ItemRSerializer
+
+from authentication.models import User, Image as AuthImage
+from locations.models import Location
+
+import copy
+
+
+BUILD_BATCH_SIZE = 500
+
+
+def get_document_queryset():
+    return Item.objects.select_related(
+        "author", "author__image", "category__parent", "location"
+    ).prefetch_related("image_set", "category__children")
+
+
+def build_documents(item_ids):
+    """
+    Serializes the items with ItemRSerializer and stores the results as
+    their detail documents. Documents of items that no longer exist are
+    removed by the cascade.
+    """
+    items = list(get_document_queryset().filter(id__in=item_ids))
+    documents = [
+        ItemDocument(item=item, data=ItemRSerializer(item).data) for item in items
+    ]
+    with transaction.atomic():
+        ItemDocument.objects.filter(item__in=[item.id for item in items]).delete()
+        ItemDocument.objects.bulk_create(documents)
+    return len(documents)
+
+
+def schedule_documents(item_ids):
+    """
+    Rebuilds the documents of the items in the background once the current
+    transaction commits.
+    """
+    from .tasks import build_item_documents
+
+    item_ids = sorted(set(item_ids))
+    for start in range(0, len(item_ids), BUILD_BATCH_SIZE):
+        batch = item_ids[start : start + BUILD_BATCH_SIZE]
+        transaction.on_commit(lambda batch=batch: build_item_documents.delay(batch))
+
+
+def get_document(item_id):
+    """
+    Returns the stored document with the live view count merged in, or None
+    when the item has no document yet.
+    """
+    row = (
+        ItemDocument.objects.filter(item_id=item_id)
+        .values_list("data", "item__views")
+        .first()
+    )
+    if row is None:
+        return None
+    data, views = row
+    data["views"] = views + get_pending_views([data["id"]])[data["id"]]
+    return data
+
+
+def build_absolute_urls(data, request):
+    """
+    Documents are built without a request, so file URLs are stored relative
+    to the site and made absolute per request like the serializer does.
+    """
+    data = copy.deepcopy(data)
+    images = list(data["images"])
+    if data["author"]["image"]:
+        images.append(data["author"]["image"])
+    for image in images:
+        if image["file"]:
+            image["file"] = request.build_absolute_uri(image["file"])
+        for formats in image.get("renditions", {}).values():
+            for extension, url in formats.items():
+                formats[extension] = request.build_absolute_uri(url)
+    return data
+
+
+@receiver(post_save, sender=Item)
+def save_item_document(sender, instance, created, **kwargs):
+    if created:
+        schedule_documents(
+            Item.objects.filter(author_id=instance.author_id).values_list(
+                "id", flat=True
+            )
+        )
+    else:
+        schedule_documents([instance.id])
+
+
+@receiver(post_delete, sender=Item)
+def delete_item_document(sender, instance, **kwargs):
+    schedule_documents(
+        Item.objects.filter(author_id=instance.author_id).values_list("id", flat=True)
+    )
+
+
+@receiver(post_save, sender=Image)
+@receiver(post_delete, sender=Image)
+def save_image_document(sender, instance, **kwargs):
+    if instance.item_id:
+        schedule_documents([instance.item_id])
+
+
+@receiver(post_save, sender=User)
+def save_author_documents(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or "username" in update_fields:
+        schedule_documents(
+            Item.objects.filter(author=instance).values_list("id", flat=True)
+        )
+
+
+@receiver(post_save, sender=AuthImage)
+@receiver(post_delete, sender=AuthImage)
+def save_author_image_documents(sender, instance, **kwargs):
+    schedule_documents(
+        Item.objects.filter(author_id=instance.user_id).values_list("id", flat=True)
+    )
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def save_category_documents(sender, instance, **kwargs):
+    """
+    A detail document embeds the item's category with its parent and its
+    children, so a category change touches the items of the category itself,
+    of its children and of its parent.
+    """
+    query = Q(category_id=instance.id) | Q(category__parent_id=instance.id)
+    if instance.parent_id:
+        query |= Q(category_id=instance.parent_id)
+    schedule_documents(Item.objects.filter(query).values_list("id", flat=True))
+
+
+@receiver(post_save, sender=Location)
+def save_location_documents(sender, instance, **kwargs):
+    schedule_documents(
+        Item.objects.filter(location=instance).values_list("id", flat=True)
+    )
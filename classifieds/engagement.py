@@ -0,0 +1,115 @@
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ItemEvent, ItemStat
+
+
+STAT_FIELDS = {
+    ItemEvent.Type.VIEW: "views",
+    ItemEvent.Type.BOOKMARK: "bookmarks",
+    ItemEvent.Type.CONTACT: "contacts",
+}
+
+
+def record_event(item_id, type, count=1):
+    ItemEvent.objects.create(item_id=item_id, type=type, count=count)
+
+
+def get_period_start(period, created_at):
+    started_at = timezone.localtime(created_at).replace(
+        minute=0, second=0, microsecond=0
+    )
+    if period == ItemStat.Period.DAY:
+        started_at = started_at.replace(hour=0)
+    return started_at
+
+
+def add_to_stats(period, deltas):
+    """
+    Adds the {(item_id, started_at): Counter(field=count)} deltas to the
+    rollup rows of the period, creating the missing ones.
+    """
+    item_ids = {item_id for item_id, started_at in deltas}
+    started_ats = {started_at for item_id, started_at in deltas}
+    stats = {
+        (stat.item_id, stat.started_at): stat
+        for stat in ItemStat.objects.select_for_update().filter(
+            period=period, item_id__in=item_ids, started_at__in=started_ats
+        )
+    }
+
+    created = []
+    for (item_id, started_at), counts in deltas.items():
+        stat = stats.get((item_id, started_at))
+        if stat is None:
+            stat = ItemStat(item_id=item_id, period=period, started_at=started_at)
+            created.append(stat)
+        for field, count in counts.items():
+            setattr(stat, field, getattr(stat, field) + count)
+
+    ItemStat.objects.bulk_update(list(stats.values()), list(STAT_FIELDS.values()))
+    ItemStat.objects.bulk_create(created)
+
+
+def aggregate_events(batch_size=1000):
+    """
+    Rolls the raw events up into the hourly and daily ItemStat rows and
+    deletes them, one batch per transaction. Returns the number of events
+    aggregated.
+
+    The batch is claimed with SELECT ... FOR UPDATE SKIP LOCKED, so a run
+    that overlaps another one (after the lock expired or was evicted) skips
+    the events the other run is aggregating instead of counting them twice.
+    """
+    if not cache.add("item-events:aggregate-lock", 1, 60 * 60):
+        return 0
+
+    aggregated = 0
+    try:
+        while True:
+            with transaction.atomic():
+                events = list(
+                    ItemEvent.objects.select_for_update(skip_locked=True)
+                    .order_by("id")
+                    .values_list("id", "item_id", "type", "count", "created_at")[
+                        :batch_size
+                    ]
+                )
+                if not events:
+                    break
+
+                for period in ItemStat.Period.values:
+                    deltas = defaultdict(Counter)
+                    for id, item_id, type, count, created_at in events:
+                        key = (item_id, get_period_start(period, created_at))
+                        deltas[key][STAT_FIELDS[type]] += count
+                    add_to_stats(period, deltas)
+
+                ItemEvent.objects.filter(id__in=[event[0] for event in events]).delete()
+                aggregated += len(events)
+    finally:
+        cache.delete("item-events:aggregate-lock")
+    return aggregated
+
+
+def get_item_stats(item, hours=48, days=30):
+    now = timezone.now()
+    stats = ItemStat.objects.filter(item=item)
+    return {
+        "hourly": stats.filter(
+            period=ItemStat.Period.HOUR,
+            started_at__gt=get_period_start(
+                ItemStat.Period.HOUR, now - timedelta(hours=hours)
+            ),
+        ),
+        "daily": stats.filter(
+            period=ItemStat.Period.DAY,
+            started_at__gt=get_period_start(
+                ItemStat.Period.DAY, now - timedelta(days=days)
+            ),
+        ),
+    }
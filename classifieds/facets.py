@@ -0,0 +1,191 @@
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Count
+
+from .models import (
+    FACET_BUCKETS,
+    Attribute,
+    AttributeFacet,
+    AttributeValue,
+    Category,
+    CategoryClosure,
+    Item,
+    ItemFacet,
+    count_facet_buckets,
+)
+
+from locations.models import LocationClosure
+
+
+AGGREGATED_PARAMS = ("category_id", "location_id", "sort", "page", "cursor", "count")
+
+
+def rebuild_facets():
+    with transaction.atomic():
+        ItemFacet.objects.all().delete()
+        AttributeFacet.objects.all().delete()
+
+        ItemFacet.objects.bulk_create(
+            [
+                ItemFacet(
+                    category_id=row["category_id"],
+                    location_id=row["location_id"],
+                    count=row["count"],
+                )
+                for row in Item.objects.order_by()
+                .values("category_id", "location_id")
+                .annotate(count=Count("id"))
+            ]
+        )
+
+        slugs = Attribute.objects.filter(
+            filter_type=Attribute.FilterType.RANGE_INPUT
+        ).values("slug")
+        pairs = defaultdict(list)
+        for category_id, location_id, slug, value in AttributeValue.objects.filter(
+            slug__in=slugs
+        ).values_list("item__category_id", "item__location_id", "slug", "value"):
+            pairs[(category_id, location_id)].append((slug, value))
+
+        AttributeFacet.objects.bulk_create(
+            [
+                AttributeFacet(
+                    category_id=category_id,
+                    location_id=location_id,
+                    slug=slug,
+                    bucket=bucket,
+                    count=count,
+                )
+                for (category_id, location_id), values in pairs.items()
+                for (slug, bucket), count in count_facet_buckets(values).items()
+            ],
+            batch_size=1000,
+        )
+
+
+def roll_up(rows, closure_model):
+    ids = {node_id for node_id, count in rows if node_id is not None}
+    ancestors = defaultdict(list)
+    for ancestor_id, descendant_id in closure_model.objects.filter(
+        descendant_id__in=ids
+    ).values_list("ancestor_id", "descendant_id"):
+        ancestors[descendant_id].append(ancestor_id)
+
+    counts = Counter()
+    for node_id, count in rows:
+        for ancestor_id in ancestors[node_id]:
+            counts[ancestor_id] += count
+    return [
+        {"id": node_id, "count": counts[node_id]}
+        for node_id in sorted(counts)
+        if counts[node_id]
+    ]
+
+
+def get_histograms(rows, slugs):
+    histograms = {slug: Counter() for slug in slugs}
+    for slug, bucket, count in rows:
+        if slug in histograms:
+            histograms[slug][bucket] += count
+
+    data = {}
+    for slug, buckets in histograms.items():
+        data[slug] = []
+        for bucket, start in enumerate(FACET_BUCKETS):
+            end = None
+            if bucket + 1 < len(FACET_BUCKETS):
+                end = FACET_BUCKETS[bucket + 1]
+            data[slug].append({"min": start, "max": end, "count": buckets[bucket]})
+    return data
+
+
+def get_range_slugs(category_id):
+    attributes = Attribute.objects.filter(filter_type=Attribute.FilterType.RANGE_INPUT)
+    if category_id:
+        category = Category.objects.filter(id=category_id).first()
+        if category:
+            attributes = category.filter_attributes.filter(
+                filter_type=Attribute.FilterType.RANGE_INPUT
+            )
+    return list(attributes.values_list("slug", flat=True).distinct())
+
+
+def without(query, *params):
+    query = query.copy()
+    for param in params:
+        query.pop(param, None)
+    return query
+
+
+def filter_by_tree(queryset, category_id=None, location_id=None):
+    if category_id:
+        queryset = queryset.filter(
+            category__in=CategoryClosure.objects.filter(ancestor_id=category_id).values(
+                "descendant_id"
+            )
+        )
+    if location_id:
+        queryset = queryset.filter(
+            location__in=LocationClosure.objects.filter(ancestor_id=location_id).values(
+                "descendant_id"
+            )
+        )
+    return queryset
+
+
+def get_facets(query):
+    """
+    Returns item counts per category and per location (every level) and
+    histograms of the range filter attributes for the given search query.
+
+    Category counts ignore the category filter and location counts ignore the
+    location filter, so that the sidebar can show the alternatives. Queries
+    that only filter by category and location are answered from the
+    ItemFacet/AttributeFacet tables, other queries count the filtered items.
+    """
+    category_id = query.get("category_id")
+    location_id = query.get("location_id")
+    slugs = get_range_slugs(category_id)
+
+    if all(param in AGGREGATED_PARAMS or not query.get(param) for param in query):
+        facets = ItemFacet.objects.all()
+        category_rows = filter_by_tree(facets, location_id=location_id)
+        location_rows = filter_by_tree(facets, category_id=category_id)
+        bucket_rows = filter_by_tree(
+            AttributeFacet.objects.filter(slug__in=slugs), category_id, location_id
+        )
+
+        categories = category_rows.values_list("category_id", "count")
+        locations = location_rows.values_list("location_id", "count")
+        buckets = bucket_rows.values_list("slug", "bucket", "count")
+    else:
+        query = without(query, "sort")
+        categories = (
+            Item.objects.filter_by_query(without(query, "category_id"))
+            .order_by()
+            .values("category_id")
+            .annotate(count=Count("id"))
+            .values_list("category_id", "count")
+        )
+        locations = (
+            Item.objects.filter_by_query(without(query, "location_id"))
+            .order_by()
+            .values("location_id")
+            .annotate(count=Count("id"))
+            .values_list("location_id", "count")
+        )
+        values = AttributeValue.objects.filter(
+            item__in=Item.objects.filter_by_query(query).order_by().values("id"),
+            slug__in=slugs,
+        ).values_list("slug", "value")
+        buckets = [
+            (slug, bucket, count)
+            for (slug, bucket), count in count_facet_buckets(values).items()
+        ]
+
+    return {
+        "categories": roll_up(list(categories), CategoryClosure),
+        "locations": roll_up(list(locations), LocationClosure),
+        "histograms": get_histograms(buckets, slugs),
+    }
@@ -3,10 +3,10 @@ from django.contrib.auth.forms import (
     SetPasswordForm as DjangoSetPasswordForm,
     PasswordChangeForm as DjangoPasswordChangeForm,
 )
-from django.shortcuts import get_object_or_404
 from django.utils.translation import gettext, gettext_lazy as _
 
-from .models import Category, Item
+from .models import Item
+from .snapshot import get_category_or_404
 
 
 class ItemForm(forms.ModelForm):
@@ -16,9 +16,9 @@ class ItemForm(forms.ModelForm):
         category_id = kwargs.pop("category_id")
         super().__init__(*args, **kwargs)
 
-        category = get_object_or_404(Category, id=category_id)
+        category = get_category_or_404(category_id)
 
-        for attribute in category.field_attributes.all():
+        for attribute in category["field_attributes"]:
             if attribute.slug == "rent":
                 self.fields["attributes_rent"] = forms.DecimalField()
 
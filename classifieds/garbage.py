@@ -0,0 +1,245 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.default import kvstore
+
+from .models import Image, ImageUpload, Item
+from .uploads import IMAGE_UPLOAD_TEMP_DIR, delete_upload, get_part_path
+
+from authentication.models import Image as AuthImage
+from backend.images import get_rendition_names
+
+import os
+import posixpath
+import time
+
+
+MEDIA_GC_AGE = getattr(settings, "MEDIA_GC_AGE", 60 * 60 * 24)
+MEDIA_GC_BATCH_SIZE = getattr(settings, "MEDIA_GC_BATCH_SIZE", 100)
+MEDIA_GC_PAUSE = getattr(settings, "MEDIA_GC_PAUSE", 1)
+MEDIA_GC_LIMIT = getattr(settings, "MEDIA_GC_LIMIT", 10000)
+
+# Only the directories written by the image models are collected; anything
+# else under MEDIA_ROOT (markdownx uploads for example) is left alone.
+MANAGED_PATHS = (
+    ("", False),
+    ("renditions", True),
+    (thumbnail_settings.THUMBNAIL_PREFIX.rstrip("/"), True),
+)
+
+
+def get_size(name):
+    try:
+        return default_storage.size(name)
+    except OSError:
+        return 0
+
+
+def get_image_size(image):
+    names = get_rendition_names(image.renditions)
+    if image.file:
+        names.append(image.file.name)
+    return sum(get_size(name) for name in names)
+
+
+def collect_images(cutoff, dry_run, batch_size, pause, limit):
+    """
+    Deletes the images that were uploaded before the cutoff but never
+    attached to an item. Their files go with them through the pre_delete
+    receiver.
+    """
+    report = Counter()
+    last_id = 0
+    while report["images"] < limit:
+        images = list(
+            Image.objects.filter(
+                item__isnull=True, created_at__lt=cutoff, id__gt=last_id
+            )
+            .order_by("id")
+            .only("id", "file", "renditions")[
+                : min(batch_size, limit - report["images"])
+            ]
+        )
+        if not images:
+            break
+        report["images"] += len(images)
+        report["bytes"] += sum(get_image_size(image) for image in images)
+        if not dry_run:
+            Image.objects.filter(id__in=[image.id for image in images]).delete()
+        last_id = images[-1].id
+        time.sleep(pause)
+    return report
+
+
+def collect_uploads(cutoff, dry_run, batch_size, pause, limit):
+    """
+    Deletes the upload sessions started before the cutoff and the part files
+    left behind without a session.
+    """
+    report = Counter()
+    for upload in ImageUpload.objects.filter(created_at__lt=cutoff).order_by(
+        "created_at"
+    )[:limit]:
+        path = get_part_path(upload)
+        report["uploads"] += 1
+        report["bytes"] += os.path.getsize(path) if os.path.exists(path) else 0
+        if not dry_run:
+            delete_upload(upload)
+        if report["uploads"] % batch_size == 0:
+            time.sleep(pause)
+
+    if not os.path.isdir(IMAGE_UPLOAD_TEMP_DIR):
+        return report
+    upload_ids = {
+        str(id) for id in ImageUpload.objects.values_list("id", flat=True).iterator()
+    }
+    for entry in os.scandir(IMAGE_UPLOAD_TEMP_DIR):
+        if report["uploads"] >= limit:
+            break
+        upload_id, extension = os.path.splitext(entry.name)
+        if extension != ".part" or upload_id in upload_ids:
+            continue
+        stat = entry.stat()
+        if stat.st_mtime >= cutoff.timestamp():
+            continue
+        report["uploads"] += 1
+        report["bytes"] += stat.st_size
+        if not dry_run:
+            os.remove(entry.path)
+    return report
+
+
+def collect_thumbnails(dry_run, batch_size, pause, limit):
+    """
+    A throttled version of the sorl-thumbnail kvstore cleanup. Removes the
+    entries of files that no longer exist along with their thumbnails, and
+    the thumbnail lists of sources that are gone.
+    """
+    report = Counter()
+    for count, key in enumerate(list(kvstore._find_keys(identity="image")), 1):
+        if report["thumbnails"] >= limit:
+            return report
+        image_file = kvstore._get(key)
+        if image_file and not image_file.exists():
+            report["thumbnails"] += 1
+            if not dry_run:
+                kvstore.delete(image_file)
+        if count % batch_size == 0:
+            time.sleep(pause)
+
+    for count, key in enumerate(list(kvstore._find_keys(identity="thumbnails")), 1):
+        if report["thumbnails"] >= limit:
+            return report
+        thumbnail_keys = kvstore._get(key, identity="thumbnails") or []
+        existing = [
+            thumbnail_key
+            for thumbnail_key in thumbnail_keys
+            if kvstore._get(thumbnail_key)
+        ]
+        if not kvstore._get(key) or not existing:
+            report["thumbnails"] += 1
+            if not dry_run:
+                kvstore._delete(key, identity="thumbnails")
+        elif len(existing) != len(thumbnail_keys) and not dry_run:
+            kvstore._set(key, existing, identity="thumbnails")
+        if count % batch_size == 0:
+            time.sleep(pause)
+    return report
+
+
+def get_referenced_names():
+    names = set()
+    for model in (Image, AuthImage):
+        for file, renditions in model.objects.values_list(
+            "file", "renditions"
+        ).iterator():
+            if file:
+                names.add(file)
+            names.update(get_rendition_names(renditions))
+    for primary_image, thumbnail in Item.objects.values_list(
+        "primary_image", "thumbnail"
+    ).iterator():
+        names.update([primary_image, thumbnail])
+    for key in kvstore._find_keys(identity="image"):
+        image_file = kvstore._get(key)
+        if image_file:
+            names.add(image_file.name)
+    names.discard(None)
+    names.discard("")
+    return names
+
+
+def walk(path, recursive):
+    try:
+        directories, files = default_storage.listdir(path)
+    except FileNotFoundError:
+        return
+    for name in files:
+        yield posixpath.join(path, name) if path else name
+    if recursive:
+        for directory in directories:
+            yield from walk(posixpath.join(path, directory), recursive)
+
+
+def collect_files(cutoff, dry_run, batch_size, pause, limit):
+    """
+    Deletes the files of the managed directories that no image, item or
+    thumbnail entry references. Files modified after the cutoff are kept so
+    that a file saved just before its row is committed survives.
+    """
+    report = Counter()
+    referenced = get_referenced_names()
+    for path, recursive in MANAGED_PATHS:
+        for name in walk(path, recursive):
+            if report["files"] >= limit:
+                return report
+            if name in referenced:
+                continue
+            try:
+                if default_storage.get_modified_time(name) >= cutoff:
+                    continue
+            except OSError:
+                continue
+            report["files"] += 1
+            report["bytes"] += get_size(name)
+            if not dry_run:
+                default_storage.delete(name)
+            if report["files"] % batch_size == 0:
+                time.sleep(pause)
+    return report
+
+
+def collect_garbage(
+    dry_run=False,
+    age=MEDIA_GC_AGE,
+    batch_size=MEDIA_GC_BATCH_SIZE,
+    pause=MEDIA_GC_PAUSE,
+    limit=MEDIA_GC_LIMIT,
+):
+    """
+    Removes unattached images, stale upload sessions, stale thumbnail
+    entries and unreferenced media files older than age seconds, in that
+    order. At most limit objects of each kind are removed per run, sleeping
+    pause seconds after every batch. Returns a report of what was (or with
+    dry_run=True, would have been) removed, or None when another collection
+    is running.
+    """
+    if not cache.add("media-gc:lock", 1, 60 * 60 * 6):
+        return None
+
+    cutoff = timezone.now() - timedelta(seconds=age)
+    report = Counter(images=0, uploads=0, thumbnails=0, files=0, bytes=0)
+    try:
+        report.update(collect_images(cutoff, dry_run, batch_size, pause, limit))
+        report.update(collect_uploads(cutoff, dry_run, batch_size, pause, limit))
+        report.update(collect_thumbnails(dry_run, batch_size, pause, limit))
+        report.update(collect_files(cutoff, dry_run, batch_size, pause, limit))
+    finally:
+        cache.delete("media-gc:lock")
+    return dict(report)
@@ -0,0 +1,128 @@
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from classifieds.models import Item
+
+
+WORDS = [
+    "シェアハウス",
+    "ルームシェア",
+    "アルバイト",
+    "日本食レストラン",
+    "キッチンハンド",
+    "自転車",
+    "冷蔵庫",
+    "ソファー",
+    "語学学校",
+    "引っ越し",
+    "sydney",
+    "melbourne",
+    "brisbane",
+    "iphone",
+    "ikea",
+    "bond",
+    "barista",
+    "cleaner",
+]
+
+KEYWORDS = ["シェアハウス", "自転車 sydney", "バリスタ", "iphone", "冷蔵庫 ikea"]
+
+KANA = "アイウエオカキクケコサシスセソタチツテトナニヌネノハヒフヘホマミムメモラリルレロ"
+
+
+def generate_vocabulary(size):
+    vocabulary = list(WORDS)
+    for i in range(size):
+        if i % 2:
+            vocabulary.append("".join(random.choices(KANA, k=random.randint(3, 6))))
+        else:
+            vocabulary.append(
+                "".join(random.choices("abcdefghijklmnopqrstuvwxyz", k=6))
+            )
+    return vocabulary
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures keyword search latency with and without the search index "
+        "against generated items. Everything is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", type=int, nargs="+", default=[100000, 1000000])
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--vocabulary", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            author = get_user_model().objects.create_user(
+                "benchmark-search@example.com", "benchmark"
+            )
+
+            vocabulary = generate_vocabulary(options["vocabulary"])
+
+            created = 0
+            for size in sorted(options["sizes"]):
+                self.create_items(
+                    author, vocabulary, size - created, options["batch_size"]
+                )
+                created = size
+                call_command(
+                    "rebuild_search_index",
+                    batch_size=options["batch_size"],
+                    stdout=self.stdout,
+                )
+
+                self.stdout.write("items: %s" % size)
+                for keyword in KEYWORDS:
+                    legacy = self.measure(
+                        self.legacy_queryset(keyword), options["repeat"]
+                    )
+                    indexed = self.measure(
+                        Item.objects.filter_by_query({"keyword": keyword}),
+                        options["repeat"],
+                    )
+                    self.stdout.write(
+                        "  %-20s legacy %8.1f ms  indexed %8.1f ms"
+                        % (keyword, legacy, indexed)
+                    )
+
+            transaction.set_rollback(True)
+
+    def create_items(self, author, vocabulary, count, batch_size):
+        items = []
+        for i in range(count):
+            words = random.sample(vocabulary, 12)
+            items.append(
+                Item(
+                    author=author,
+                    title=" ".join(words[:3]),
+                    description="%s です。" % "、".join(words[3:]),
+                )
+            )
+            if len(items) >= batch_size:
+                Item.objects.bulk_create(items)
+                items = []
+        Item.objects.bulk_create(items)
+
+    def legacy_queryset(self, keyword):
+        title_query = Q()
+        description_query = Q()
+        for k in keyword.split():
+            title_query = title_query & Q(title__icontains=k)
+            description_query = description_query & Q(description__icontains=k)
+        return Item.objects.filter(title_query | description_query)
+
+    def measure(self, queryset, repeat):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            queryset.count()
+            list(queryset.values_list("id", flat=True)[:30])
+        return (time.perf_counter() - started) * 1000 / repeat
@@ -0,0 +1,69 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from classifieds.garbage import (
+    MEDIA_GC_AGE,
+    MEDIA_GC_BATCH_SIZE,
+    MEDIA_GC_LIMIT,
+    MEDIA_GC_PAUSE,
+    collect_garbage,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Deletes unattached images, stale uploads and thumbnail entries and "
+        "unreferenced media files."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report what would be deleted without deleting anything.",
+        )
+        parser.add_argument(
+            "--older-than",
+            type=int,
+            default=MEDIA_GC_AGE,
+            help="Only collect objects older than this many seconds.",
+        )
+        parser.add_argument("--batch-size", type=int, default=MEDIA_GC_BATCH_SIZE)
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=MEDIA_GC_PAUSE,
+            help="Seconds to pause after every batch.",
+        )
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=MEDIA_GC_LIMIT,
+            help="Maximum number of objects of each kind to delete.",
+        )
+
+    def handle(self, *args, **options):
+        report = collect_garbage(
+            dry_run=options["dry_run"],
+            age=options["older_than"],
+            batch_size=options["batch_size"],
+            pause=options["sleep"],
+            limit=options["limit"],
+        )
+        if report is None:
+            raise CommandError("Another collection is running.")
+
+        prefix = "Would delete" if options["dry_run"] else "Deleted"
+        self.stdout.write(
+            self.style.SUCCESS(
+                "%s %s images, %s uploads, %s thumbnail entries and %s files "
+                "(%.1f MB)."
+                % (
+                    prefix,
+                    report["images"],
+                    report["uploads"],
+                    report["thumbnails"],
+                    report["files"],
+                    report["bytes"] / 1024 / 1024,
+                )
+            )
+        )
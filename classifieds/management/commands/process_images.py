@@ -0,0 +1,57 @@
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from authentication.models import Image as AuthImage
+from authentication.tasks import process_user_image
+from backend.images import needs_renditions
+from classifieds.models import Image
+from classifieds.tasks import process_item_image
+
+import django
+import os
+
+
+TASKS = {
+    "item": (Image, process_item_image),
+    "user": (AuthImage, process_user_image),
+}
+
+
+def process(job):
+    name, image_id, force = job
+    model, task = TASKS[name]
+    return bool(task(image_id, force))
+
+
+class Command(BaseCommand):
+    help = "Generates the image renditions of the uploads with a pool of processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=os.cpu_count())
+        parser.add_argument(
+            "--all", action="store_true", help="Regenerate existing renditions too."
+        )
+
+    def handle(self, *args, **options):
+        jobs = []
+        for name, (model, task) in TASKS.items():
+            for image in (
+                model.objects.exclude(file="")
+                .exclude(file=None)
+                .only("id", "file", "renditions")
+            ):
+                if options["all"] or needs_renditions(image):
+                    jobs.append((name, image.id, options["all"]))
+
+        # Worker processes must open their own database connections.
+        connections.close_all()
+        with ProcessPoolExecutor(
+            max_workers=options["workers"], initializer=django.setup
+        ) as executor:
+            processed = sum(executor.map(process, jobs, chunksize=10))
+
+        self.stdout.write(
+            self.style.SUCCESS("Processed %s of %s images." % (processed, len(jobs)))
+        )
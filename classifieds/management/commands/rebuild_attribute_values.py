@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from classifieds.models import (
+    Category,
+    Item,
+    get_materialized_attribute_slugs,
+    update_attribute_values,
+)
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the typed attribute values used by range filters and sorts."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        slugs = {
+            category.id: list(get_materialized_attribute_slugs(category))
+            for category in Category.objects.all()
+        }
+
+        count = 0
+        queryset = Item.objects.order_by("id").only("id", "category_id", "attributes")
+        with transaction.atomic():
+            for item in queryset.iterator(chunk_size=options["batch_size"]):
+                update_attribute_values(item, slugs.get(item.category_id, []))
+                count += 1
+
+        self.stdout.write(self.style.SUCCESS("Updated %s items." % count))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from backend.utils import rebuild_closure
+
+from classifieds.models import Category, CategoryClosure
+from locations.models import Location, LocationClosure
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the ancestor/descendant closures of categories and locations."
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            rebuild_closure(Category, CategoryClosure)
+            rebuild_closure(Location, LocationClosure)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Built %s category and %s location closures."
+                % (CategoryClosure.objects.count(), LocationClosure.objects.count())
+            )
+        )
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from classifieds.facets import rebuild_facets
+from classifieds.models import AttributeFacet, ItemFacet
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the category/location counts and histograms of the facets."
+
+    def handle(self, *args, **options):
+        rebuild_facets()
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Built %s item facets and %s attribute facets."
+                % (ItemFacet.objects.count(), AttributeFacet.objects.count())
+            )
+        )
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from classifieds.documents import BUILD_BATCH_SIZE, build_documents
+from classifieds.models import Item
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the pre-serialized detail documents of every item."
+
+    def handle(self, *args, **options):
+        item_ids = list(Item.objects.order_by("id").values_list("id", flat=True))
+        count = 0
+        for start in range(0, len(item_ids), BUILD_BATCH_SIZE):
+            count += build_documents(item_ids[start : start + BUILD_BATCH_SIZE])
+        self.stdout.write(self.style.SUCCESS("Built %s item documents." % count))
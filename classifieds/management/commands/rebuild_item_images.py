@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from classifieds.models import Item, update_item_image
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the primary image, list thumbnail and image count of every item."
+
+    def handle(self, *args, **options):
+        count = 0
+        for item_id in Item.objects.order_by("id").values_list("id", flat=True):
+            update_item_image(item_id)
+            count += 1
+        self.stdout.write(self.style.SUCCESS("Updated the images of %s items." % count))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from classifieds.related import update_related_items
+
+
+class Command(BaseCommand):
+    help = "Recomputes the related items of every item."
+
+    def handle(self, *args, **options):
+        count = update_related_items(full=True)
+        self.stdout.write(
+            self.style.SUCCESS("Computed related items of %s items." % count)
+        )
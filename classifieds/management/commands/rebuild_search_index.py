@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from classifieds.models import Item, SearchToken
+from classifieds.search import index_tokens
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the keyword search index of all items."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+
+        with transaction.atomic():
+            SearchToken.objects.all().delete()
+
+            count = 0
+            tokens = []
+            queryset = Item.objects.order_by("id").values_list(
+                "id", "title", "description"
+            )
+            for item_id, title, description in queryset.iterator(chunk_size=batch_size):
+                for token in index_tokens(title, description):
+                    tokens.append(SearchToken(item_id=item_id, token=token))
+                if len(tokens) >= batch_size:
+                    SearchToken.objects.bulk_create(tokens, batch_size=batch_size)
+                    tokens = []
+                count += 1
+            SearchToken.objects.bulk_create(tokens, batch_size=batch_size)
+
+        self.stdout.write(self.style.SUCCESS("Indexed %s items." % count))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from backend.cache import get_metrics
+
+import classifieds.views  # noqa: F401
+import locations.views  # noqa: F401
+
+
+class Command(BaseCommand):
+    help = "Shows hit and miss counts of the search result cache."
+
+    def handle(self, *args, **options):
+        for name, counts in get_metrics().items():
+            total = counts["hits"] + counts["misses"]
+            ratio = counts["hits"] / total * 100 if total else 0
+            self.stdout.write(
+                "%-16s hits %8s  misses %8s  hit ratio %5.1f%%"
+                % (name, counts["hits"], counts["misses"], ratio)
+            )
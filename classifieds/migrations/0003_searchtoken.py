@@ -0,0 +1,44 @@
+# Generated by Django 3.2.7 on 2026-10-18 10:34
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+from classifieds.search import index_tokens
+
+
+def build_search_tokens(apps, schema_editor):
+    Item = apps.get_model("classifieds", "Item")
+    SearchToken = apps.get_model("classifieds", "SearchToken")
+
+    tokens = []
+    queryset = Item.objects.order_by("id").values_list("id", "title", "description")
+    for item_id, title, description in queryset.iterator(chunk_size=1000):
+        for token in index_tokens(title, description):
+            tokens.append(SearchToken(item_id=item_id, token=token))
+        if len(tokens) >= 1000:
+            SearchToken.objects.bulk_create(tokens)
+            tokens = []
+    SearchToken.objects.bulk_create(tokens)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('classifieds', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=32)),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='classifieds.item')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='searchtoken',
+            index=models.Index(fields=['token', 'item'], name='classifieds_token_8a375d_idx'),
+        ),
+        migrations.RunPython(build_search_tokens, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 3.2.7 on 2026-10-18 10:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Q
+
+from classifieds.models import to_attribute_value
+
+
+def build_attribute_values(apps, schema_editor):
+    Category = apps.get_model("classifieds", "Category")
+    Item = apps.get_model("classifieds", "Item")
+    AttributeValue = apps.get_model("classifieds", "AttributeValue")
+
+    slugs = {
+        category.id: list(
+            category.field_attributes.filter(
+                Q(filter_type="range_input") | Q(field_type="boolean")
+            ).values_list("slug", flat=True)
+        )
+        for category in Category.objects.all()
+    }
+
+    values = []
+    queryset = Item.objects.order_by("id").only("id", "category_id", "attributes")
+    for item in queryset.iterator(chunk_size=1000):
+        attributes = item.attributes or {}
+        for slug in slugs.get(item.category_id, []):
+            if slug in attributes:
+                values.append(
+                    AttributeValue(
+                        item_id=item.id,
+                        slug=slug,
+                        value=to_attribute_value(attributes[slug]),
+                    )
+                )
+        if len(values) >= 1000:
+            AttributeValue.objects.bulk_create(values)
+            values = []
+    AttributeValue.objects.bulk_create(values)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('classifieds', '0003_searchtoken'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttributeValue',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slug', models.CharField(max_length=255)),
+                ('value', models.DecimalField(decimal_places=2, max_digits=14, null=True)),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='classifieds.item')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='attributevalue',
+            index=models.Index(fields=['slug', 'value', 'item'], name='classifieds_slug_e1ad77_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='attributevalue',
+            unique_together={('item', 'slug')},
+        ),
+        migrations.RunPython(build_attribute_values, migrations.RunPython.noop),
+    ]
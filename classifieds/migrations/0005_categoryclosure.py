@@ -0,0 +1,35 @@
+# Generated by Django 3.2.7 on 2026-10-18 10:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+from backend.utils import rebuild_closure
+
+
+def build_closure(apps, schema_editor):
+    rebuild_closure(
+        apps.get_model("classifieds", "Category"), apps.get_model("classifieds", "CategoryClosure")
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('classifieds', '0004_attributevalue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryClosure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.IntegerField()),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descendant_closures', to='classifieds.category')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_closures', to='classifieds.category')),
+            ],
+            options={
+                'unique_together': {('ancestor', 'descendant')},
+            },
+        ),
+        migrations.RunPython(build_closure, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.7 on 2026-10-18 10:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('classifieds', '0005_categoryclosure'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['updated_at', 'id'], name='classifieds_updated_a3c91e_idx'),
+        ),
+    ]
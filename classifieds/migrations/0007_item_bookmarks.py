@@ -0,0 +1,41 @@
+# Generated by Django 3.2.7 on 2026-10-18 10:43
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def count_bookmarks(apps, schema_editor):
+    Item = apps.get_model("classifieds", "Item")
+    Bookmark = apps.get_model("authentication", "Bookmark")
+    counts = (
+        Bookmark.objects.filter(item=OuterRef("pk"))
+        .order_by()
+        .values("item")
+        .annotate(count=Count("id"))
+        .values("count")
+    )
+    Item.objects.update(
+        bookmarks=Coalesce(Subquery(counts, output_field=IntegerField()), Value(0))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0002_initial'),
+        ('classifieds', '0006_item_classifieds_updated_a3c91e_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='bookmarks',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['bookmarks', 'id'], name='classifieds_bookmar_7652b7_idx'),
+        ),
+        migrations.RunPython(count_bookmarks, migrations.RunPython.noop),
+    ]
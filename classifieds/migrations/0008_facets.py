@@ -0,0 +1,87 @@
+# Generated by Django 3.2.7 on 2026-10-18 10:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count
+
+from classifieds.models import count_facet_buckets
+
+
+def build_facets(apps, schema_editor):
+    Attribute = apps.get_model("classifieds", "Attribute")
+    AttributeFacet = apps.get_model("classifieds", "AttributeFacet")
+    AttributeValue = apps.get_model("classifieds", "AttributeValue")
+    Item = apps.get_model("classifieds", "Item")
+    ItemFacet = apps.get_model("classifieds", "ItemFacet")
+
+    ItemFacet.objects.bulk_create(
+        [
+            ItemFacet(
+                category_id=row["category_id"],
+                location_id=row["location_id"],
+                count=row["count"],
+            )
+            for row in Item.objects.order_by()
+            .values("category_id", "location_id")
+            .annotate(count=Count("id"))
+        ],
+        batch_size=1000,
+    )
+
+    values = {}
+    for category_id, location_id, slug, value in AttributeValue.objects.filter(
+        slug__in=Attribute.objects.filter(filter_type="range_input").values("slug")
+    ).values_list("item__category_id", "item__location_id", "slug", "value"):
+        values.setdefault((category_id, location_id), []).append((slug, value))
+    AttributeFacet.objects.bulk_create(
+        [
+            AttributeFacet(
+                category_id=category_id,
+                location_id=location_id,
+                slug=slug,
+                bucket=bucket,
+                count=count,
+            )
+            for (category_id, location_id), pairs in values.items()
+            for (slug, bucket), count in count_facet_buckets(pairs).items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('locations', '0002_locationclosure'),
+        ('classifieds', '0007_item_bookmarks'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ItemFacet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.IntegerField(default=0)),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='classifieds.category')),
+                ('location', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='locations.location')),
+            ],
+            options={
+                'unique_together': {('category', 'location')},
+            },
+        ),
+        migrations.CreateModel(
+            name='AttributeFacet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slug', models.CharField(max_length=255)),
+                ('bucket', models.IntegerField()),
+                ('count', models.IntegerField(default=0)),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='classifieds.category')),
+                ('location', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='locations.location')),
+            ],
+            options={
+                'unique_together': {('category', 'location', 'slug', 'bucket')},
+            },
+        ),
+        migrations.RunPython(build_facets, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 3.2.7 on 2026-10-18 10:46
+
+from collections import defaultdict
+
+from django.db import migrations, models
+
+
+def set_promotions(apps, schema_editor):
+    Item = apps.get_model("classifieds", "Item")
+    Promotion = apps.get_model("classifieds", "Promotion")
+
+    slugs = defaultdict(set)
+    for item_id, slug in Promotion.objects.filter(type__isnull=False).values_list(
+        "item_id", "type__slug"
+    ):
+        slugs[item_id].add(slug)
+
+    for item_id, item_slugs in slugs.items():
+        Item.objects.filter(id=item_id).update(
+            promotions=sorted(item_slugs),
+            is_fixed="fixed" in item_slugs,
+            is_highlighted="highlight" in item_slugs,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('classifieds', '0008_facets'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='is_fixed',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='is_highlighted',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='promotions',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['is_fixed', 'updated_at'], name='classifieds_is_fixe_7c22ce_idx'),
+        ),
+        migrations.RunPython(set_promotions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 3.2.7 on 2026-10-18 10:51
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('classifieds', '0009_item_promotions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ItemEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type', models.CharField(choices=[('view', 'VIEW'), ('bookmark', 'BOOKMARK'), ('contact', 'CONTACT')], max_length=20)),
+                ('count', models.IntegerField(default=1)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='classifieds.item')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ItemStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('hour', 'HOUR'), ('day', 'DAY')], max_length=10)),
+                ('started_at', models.DateTimeField()),
+                ('views', models.IntegerField(default=0)),
+                ('bookmarks', models.IntegerField(default=0)),
+                ('contacts', models.IntegerField(default=0)),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='classifieds.item')),
+            ],
+            options={
+                'ordering': ['started_at'],
+                'unique_together': {('item', 'period', 'started_at')},
+            },
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 3.2.7 on 2026-10-18 10:55
+
+from django.db import migrations, models
+
+
+def set_primary_images(apps, schema_editor):
+    Item = apps.get_model("classifieds", "Item")
+    Image = apps.get_model("classifieds", "Image")
+
+    images = {}
+    for item_id, file in (
+        Image.objects.filter(item__isnull=False)
+        .exclude(file="")
+        .exclude(file=None)
+        .order_by("-index")
+        .values_list("item_id", "file")
+    ):
+        images[item_id] = file
+    counts = dict(
+        Image.objects.filter(item__isnull=False)
+        .order_by()
+        .values("item_id")
+        .annotate(count=models.Count("id"))
+        .values_list("item_id", "count")
+    )
+
+    for item_id, count in counts.items():
+        Item.objects.filter(id=item_id).update(
+            primary_image=images.get(item_id), image_count=count
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('classifieds', '0012_itemdocument'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='image_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='primary_image',
+            field=models.ImageField(blank=True, editable=False, max_length=255, null=True, upload_to=''),
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='thumbnail',
+            field=models.ImageField(blank=True, editable=False, max_length=255, null=True, upload_to=''),
+        ),
+        migrations.RunPython(set_primary_images, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 3.2.7 on 2026-10-18 11:01
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('classifieds', '0015_imageupload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
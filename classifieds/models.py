@@ -1,15 +1,36 @@
 from audioop import reverse
-from django.core.files.base import ContentFile
 from django.core.serializers.json import DjangoJSONEncoder
-from django.db import models
-from django.db.models import Q, Count
-from django.db.models.signals import pre_delete
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, F, FilteredRelation, Q, Value, When
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_init,
+    post_save,
+    pre_delete,
+)
 from django.dispatch import receiver
 from django.urls import reverse
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
-from sorl.thumbnail import get_thumbnail, delete
+from sorl.thumbnail import delete
+
+from .search import index_tokens, query_tokens
+
+from backend.cache import invalidate_tags
+from backend.images import delete_renditions, needs_renditions
+from backend.utils import update_closure
+from locations.models import (
+    DEFAULT_RADIUS_KM,
+    LocationClosure,
+    get_nearby_locations,
+)
+from promotion.models import Option as PromotionOption, Type
+
+from bisect import bisect_right
+from collections import Counter, defaultdict
+from decimal import Decimal, InvalidOperation
 
 import uuid
 
@@ -38,6 +59,24 @@ class Category(models.Model):
         return self.name
 
 
+class CategoryClosure(models.Model):
+    ancestor = models.ForeignKey(
+        Category, on_delete=models.CASCADE, related_name="descendant_closures"
+    )
+    descendant = models.ForeignKey(
+        Category, on_delete=models.CASCADE, related_name="ancestor_closures"
+    )
+    depth = models.IntegerField()
+
+    class Meta:
+        unique_together = ["ancestor", "descendant"]
+
+
+@receiver(post_save, sender=Category)
+def save_category(sender, instance, **kwargs):
+    update_closure(instance, CategoryClosure)
+
+
 class Attribute(models.Model):
     class FieldType(models.TextChoices):
         TEXT = "text", "TEXT"
@@ -90,19 +129,35 @@ class ItemQuerySet(models.QuerySet):
 
         category_id = query.get("category_id")
         if category_id:
-            queryset = queryset.filter(
-                Q(category=category_id) | Q(category__parent=category_id)
-            )
+            queryset = queryset.filter_by_category(category_id)
 
         location_id = query.get("location_id")
         if location_id:
-            queryset = queryset.filter(
-                Q(location=location_id) | Q(location__parent=location_id)
-            )
+            queryset = queryset.filter_by_location(location_id)
+
+        nearby = None
+        near = query.get("near")
+        if near and near.isdigit():
+            radius_km = DEFAULT_RADIUS_KM
+            try:
+                radius_km = float(query.get("radius_km") or DEFAULT_RADIUS_KM)
+            except ValueError:
+                pass
+            if not radius_km > 0:
+                radius_km = DEFAULT_RADIUS_KM
+            nearby = get_nearby_locations(int(near), radius_km)
+            queryset = queryset.filter(location__in=list(nearby))
 
         keyword = query.get("keyword")
         if keyword:
             valid_keyword = keyword.strip().split()
+            for k in valid_keyword:
+                for token, is_prefix in query_tokens(k):
+                    if is_prefix:
+                        tokens = SearchToken.objects.filter(token__istartswith=token)
+                    else:
+                        tokens = SearchToken.objects.filter(token=token)
+                    queryset = queryset.filter(id__in=tokens.values("item_id"))
             title_query = Q()
             for k in valid_keyword:
                 title_query = title_query & Q(title__icontains=k)
@@ -114,63 +169,133 @@ class ItemQuerySet(models.QuerySet):
         min_deposit = query.get("min_deposit")
         if min_deposit and min_deposit.isdigit():
             if int(min_deposit) > 0:
-                queryset = queryset.filter(attributes__deposit__gte=int(min_deposit))
+                queryset = queryset.filter_by_attribute(
+                    "deposit", "gte", int(min_deposit)
+                )
         max_deposit = query.get("max_deposit")
         if max_deposit and max_deposit.isdigit():
             if int(max_deposit) > 0:
-                queryset = queryset.filter(attributes__deposit__lte=int(max_deposit))
+                queryset = queryset.filter_by_attribute(
+                    "deposit", "lte", int(max_deposit)
+                )
             else:
-                queryset = queryset.filter(attributes__no_deposit=True)
+                queryset = queryset.filter_by_attribute("no_deposit", "exact", 1)
 
         min_rent = query.get("min_rent")
         if min_rent and min_rent.isdigit():
             if int(min_rent) > 0:
-                queryset = queryset.filter(attributes__rent__gte=int(min_rent))
+                queryset = queryset.filter_by_attribute("rent", "gte", int(min_rent))
         max_rent = query.get("max_rent")
         if max_rent and max_rent.isdigit():
             if int(max_rent) > 0:
-                queryset = queryset.filter(attributes__rent__lte=int(max_rent))
+                queryset = queryset.filter_by_attribute("rent", "lte", int(max_rent))
 
         min_price = query.get("min_price")
         if min_price and min_price.isdigit():
             if int(min_price) > 0:
-                queryset = queryset.filter(attributes__price__gte=int(min_price))
+                queryset = queryset.filter_by_attribute("price", "gte", int(min_price))
         max_price = query.get("max_price")
         if max_price and max_price.isdigit():
             if int(max_price) > 0:
-                queryset = queryset.filter(attributes__price__lte=int(max_price))
+                queryset = queryset.filter_by_attribute("price", "lte", int(max_price))
             else:
-                queryset = queryset.filter(attributes__no_price=True)
+                queryset = queryset.filter_by_attribute("no_price", "exact", 1)
 
         sort = query.get("sort")
         if sort:
             if sort == "recommended":
-                queryset = queryset.annotate(count=Count("bookmark")).order_by("-count")
+                queryset = queryset.order_by("-bookmarks")
             elif sort == "deposit_asc":
-                queryset = queryset.order_by("attributes__deposit")
+                queryset = queryset.order_by_attribute("deposit")
             elif sort == "deposit_desc":
-                queryset = queryset.order_by("-attributes__deposit")
+                queryset = queryset.order_by_attribute("deposit", descending=True)
             elif sort == "rent_asc":
-                queryset = queryset.order_by("attributes__rent")
+                queryset = queryset.order_by_attribute("rent")
             elif sort == "rent_desc":
-                queryset = queryset.order_by("-attributes__rent")
+                queryset = queryset.order_by_attribute("rent", descending=True)
             elif sort == "price_asc":
-                queryset = queryset.order_by("attributes__price")
+                queryset = queryset.order_by_attribute("price")
             elif sort == "price_desc":
-                queryset = queryset.order_by("-attributes__price")
+                queryset = queryset.order_by_attribute("price", descending=True)
+            elif sort == "distance" and nearby is not None:
+                queryset = queryset.order_by_distance(nearby)
 
         return queryset
 
+    def filter_by_category(self, category_id, min_depth=0):
+        descendants = CategoryClosure.objects.filter(
+            ancestor_id=category_id, depth__gte=min_depth
+        )
+        return self.filter(category__in=descendants.values("descendant_id"))
+
+    def filter_by_location(self, location_id, min_depth=0):
+        descendants = LocationClosure.objects.filter(
+            ancestor_id=location_id, depth__gte=min_depth
+        )
+        return self.filter(location__in=descendants.values("descendant_id"))
+
+    def filter_by_attribute(self, slug, lookup, value):
+        values = AttributeValue.objects.filter(
+            slug=slug, **{"value__%s" % lookup: value}
+        )
+        return self.filter(id__in=values.values("item_id"))
+
+    def order_by_attribute(self, slug, descending=False):
+        queryset = self.annotate(
+            sort_attribute=FilteredRelation(
+                "attributevalue", condition=Q(attributevalue__slug=slug)
+            ),
+            sort_value=F("sort_attribute__value"),
+        )
+        if descending:
+            return queryset.order_by("-sort_value")
+        return queryset.order_by("sort_value")
+
+    def order_by_distance(self, nearby):
+        """
+        Orders by the distance (in whole kilometres) of the item's location,
+        taken from the {location_id: distance_km} dict of get_nearby_locations.
+        """
+        rings = defaultdict(list)
+        for location_id, distance in nearby.items():
+            rings[int(distance)].append(location_id)
+        if not rings:
+            return self
+        queryset = self.annotate(
+            distance=Case(
+                *[
+                    When(location_id__in=ids, then=Value(km))
+                    for km, ids in sorted(rings.items())
+                ],
+                output_field=models.IntegerField(),
+            )
+        )
+        return queryset.order_by("distance", "-updated_at")
+
     def filter_by_fixed(self):
-        return self.filter(promotion__type__slug="fixed").order_by("-updated_at")
+        return self.filter(is_fixed=True).order_by("-updated_at")
 
     def filter_by_unfixed(self):
-        return self.exclude(promotion__type__slug="fixed")
+        return self.filter(is_fixed=False)
+
+    def filter_by_ids(self, ids):
+        if not ids:
+            return self.none()
+        return self.filter(id__in=ids).order_by(
+            Case(
+                *[When(id=id, then=Value(rank)) for rank, id in enumerate(ids)],
+                output_field=models.IntegerField(),
+            )
+        )
 
     def filter_by_related(self, instance):
+        related = RelatedItems.objects.filter(item_id=instance.id).first()
+        if related is not None:
+            return self.filter_by_ids(related.item_ids)
+
         queryset = (
-            self.filter(category__parent=instance.category.parent)
-            .filter(location__parent_id=instance.location.parent)
+            self.filter_by_category(instance.category.parent_id, min_depth=1)
+            .filter_by_location(instance.location.parent_id, min_depth=1)
             .exclude(id=instance.id)[:8]
         )
         return queryset
@@ -197,18 +322,284 @@ class Item(models.Model):
     updated_at = models.DateTimeField(_("更新日"), default=timezone.now)
 
     views = models.IntegerField(default=0)
+    bookmarks = models.IntegerField(default=0)
+
+    promotions = models.JSONField(default=list, blank=True)
+    is_fixed = models.BooleanField(default=False)
+    is_highlighted = models.BooleanField(default=False)
+
+    primary_image = models.ImageField(
+        max_length=255, null=True, blank=True, editable=False
+    )
+    thumbnail = models.ImageField(max_length=255, null=True, blank=True, editable=False)
+    image_count = models.IntegerField(default=0)
 
     objects = ItemQuerySet.as_manager()
 
+    # Columns maintained with atomic updates that a full save must not
+    # overwrite with stale values.
+    denormalized_fields = (
+        "views",
+        "bookmarks",
+        "promotions",
+        "is_fixed",
+        "is_highlighted",
+        "primary_image",
+        "thumbnail",
+        "image_count",
+    )
+
     class Meta:
         ordering = ["-updated_at"]
+        indexes = [
+            models.Index(fields=["updated_at", "id"]),
+            models.Index(fields=["bookmarks", "id"]),
+            models.Index(fields=["is_fixed", "updated_at"]),
+        ]
 
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        if not self._state.adding and not args and kwargs.get("update_fields") is None:
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.denormalized_fields
+            ]
+        super().save(*args, **kwargs)
+
     def get_absolute_url(self):
         return reverse('classifieds:detail', kwargs={'id': self.id})
 
+    @property
+    def list_image_url(self):
+        if self.thumbnail:
+            return self.thumbnail.url
+        if self.primary_image:
+            return self.primary_image.url
+        return None
+
+
+@receiver(post_init, sender=Item)
+def init_item(sender, instance, **kwargs):
+    instance._initial_tree = (
+        instance.__dict__.get("category_id"),
+        instance.__dict__.get("location_id"),
+    )
+
+
+class SearchToken(models.Model):
+    item = models.ForeignKey(Item, on_delete=models.CASCADE)
+    token = models.CharField(max_length=32)
+
+    class Meta:
+        indexes = [models.Index(fields=["token", "item"])]
+
+
+def update_search_tokens(item):
+    SearchToken.objects.filter(item=item).delete()
+    SearchToken.objects.bulk_create(
+        [
+            SearchToken(item=item, token=token)
+            for token in index_tokens(item.title, item.description)
+        ]
+    )
+
+
+class AttributeValue(models.Model):
+    item = models.ForeignKey(Item, on_delete=models.CASCADE)
+    slug = models.CharField(max_length=255)
+    value = models.DecimalField(max_digits=14, decimal_places=2, null=True)
+
+    class Meta:
+        unique_together = ["item", "slug"]
+        indexes = [models.Index(fields=["slug", "value", "item"])]
+
+
+ATTRIBUTE_VALUE_FIELD = AttributeValue._meta.get_field("value")
+ATTRIBUTE_VALUE_LIMIT = Decimal(10) ** (
+    ATTRIBUTE_VALUE_FIELD.max_digits - ATTRIBUTE_VALUE_FIELD.decimal_places
+)
+ATTRIBUTE_VALUE_QUANTUM = Decimal(10) ** -ATTRIBUTE_VALUE_FIELD.decimal_places
+
+
+def get_materialized_attribute_slugs(category):
+    from .snapshot import get_schema
+
+    return [
+        slug for slug, field in get_schema(category).items() if field["materialized"]
+    ]
+
+
+def is_attribute_value_in_range(value):
+    return abs(value) < ATTRIBUTE_VALUE_LIMIT
+
+
+def to_attribute_value(value):
+    """
+    Converts an attribute to the AttributeValue column, or None when it isn't
+    a number or doesn't fit in the column.
+    """
+    if isinstance(value, bool):
+        return int(value)
+    if value is None or value == "":
+        return None
+    try:
+        value = Decimal(str(value))
+    except InvalidOperation:
+        return None
+    if not value.is_finite() or not is_attribute_value_in_range(value):
+        return None
+    value = value.quantize(ATTRIBUTE_VALUE_QUANTUM)
+    if not is_attribute_value_in_range(value):
+        return None
+    return value
+
+
+def update_attribute_values(item, slugs=None):
+    if slugs is None:
+        slugs = get_materialized_attribute_slugs(item.category)
+    attributes = item.attributes or {}
+
+    AttributeValue.objects.filter(item=item).delete()
+    AttributeValue.objects.bulk_create(
+        [
+            AttributeValue(
+                item=item, slug=slug, value=to_attribute_value(attributes[slug])
+            )
+            for slug in slugs
+            if slug in attributes
+        ]
+    )
+
+
+class ItemFacet(models.Model):
+    category = models.ForeignKey(
+        Category, on_delete=models.CASCADE, null=True, blank=True
+    )
+    location = models.ForeignKey(
+        "locations.Location", on_delete=models.CASCADE, null=True, blank=True
+    )
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ["category", "location"]
+
+
+class AttributeFacet(models.Model):
+    category = models.ForeignKey(
+        Category, on_delete=models.CASCADE, null=True, blank=True
+    )
+    location = models.ForeignKey(
+        "locations.Location", on_delete=models.CASCADE, null=True, blank=True
+    )
+    slug = models.CharField(max_length=255)
+    bucket = models.IntegerField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ["category", "location", "slug", "bucket"]
+
+
+FACET_BUCKETS = [0, 100, 200, 300, 500, 1000, 2000, 5000, 10000, 50000]
+
+
+def get_facet_bucket(value):
+    return max(bisect_right(FACET_BUCKETS, value) - 1, 0)
+
+
+def count_facet_buckets(values):
+    counts = Counter()
+    for slug, value in values:
+        if value is not None:
+            counts[(slug, get_facet_bucket(value))] += 1
+    return counts
+
+
+def get_facet_buckets(item_id):
+    return set(
+        count_facet_buckets(
+            AttributeValue.objects.filter(
+                item_id=item_id,
+                slug__in=Attribute.objects.filter(
+                    filter_type=Attribute.FilterType.RANGE_INPUT
+                ).values("slug"),
+            ).values_list("slug", "value")
+        )
+    )
+
+
+def add_facet_count(model, delta, **fields):
+    """
+    Adds delta to the count of the facet row with the given fields, creating
+    the row when it is missing. NULL keys aren't unique in the database, so
+    concurrent inserts may leave duplicate rows behind; the facets sum them,
+    so a delta only has to land on one of them.
+    """
+    row_id = model.objects.filter(**fields).values_list("id", flat=True).first()
+    if row_id is None:
+        try:
+            with transaction.atomic():
+                model.objects.create(count=delta, **fields)
+            return
+        except IntegrityError:
+            row_id = model.objects.filter(**fields).values_list("id", flat=True)[0]
+    model.objects.filter(id=row_id).update(count=F("count") + delta)
+
+
+def update_facets(tree, buckets, delta):
+    """
+    Adds delta to the ItemFacet and AttributeFacet counts an item with the
+    given (category_id, location_id) and attribute buckets counts in.
+    """
+    category_id, location_id = tree
+    add_facet_count(ItemFacet, delta, category_id=category_id, location_id=location_id)
+    for slug, bucket in buckets:
+        add_facet_count(
+            AttributeFacet,
+            delta,
+            category_id=category_id,
+            location_id=location_id,
+            slug=slug,
+            bucket=bucket,
+        )
+
+
+@receiver(post_save, sender=Item)
+def save_item(sender, instance, created, update_fields=None, **kwargs):
+    facets_changed = update_fields is None or {
+        "category",
+        "location",
+        "attributes",
+    } & set(update_fields)
+    if facets_changed and not created:
+        initial_buckets = get_facet_buckets(instance.id)
+
+    if update_fields is None or {"title", "description"} & set(update_fields):
+        update_search_tokens(instance)
+    if update_fields is None or {"category", "attributes"} & set(update_fields):
+        update_attribute_values(instance)
+
+    if facets_changed:
+        tree = (instance.category_id, instance.location_id)
+        buckets = get_facet_buckets(instance.id)
+        if created:
+            update_facets(tree, buckets, 1)
+        elif (instance._initial_tree, initial_buckets) != (tree, buckets):
+            update_facets(instance._initial_tree, initial_buckets, -1)
+            update_facets(tree, buckets, 1)
+
+
+@receiver(pre_delete, sender=Item)
+def collect_item_facets(sender, instance, **kwargs):
+    instance._initial_buckets = get_facet_buckets(instance.id)
+
+
+@receiver(post_delete, sender=Item)
+def delete_item(sender, instance, **kwargs):
+    update_facets(instance._initial_tree, instance._initial_buckets, -1)
+
 
 class Promotion(models.Model):
     item = models.ForeignKey(Item, on_delete=models.CASCADE)
@@ -218,6 +609,126 @@ class Promotion(models.Model):
     disabled_at = models.DateTimeField(null=True, blank=True)
 
 
+class ItemEvent(models.Model):
+    class Type(models.TextChoices):
+        VIEW = "view", "VIEW"
+        BOOKMARK = "bookmark", "BOOKMARK"
+        CONTACT = "contact", "CONTACT"
+
+    item = models.ForeignKey(Item, on_delete=models.CASCADE)
+    type = models.CharField(max_length=20, choices=Type.choices)
+    count = models.IntegerField(default=1)
+    created_at = models.DateTimeField(default=timezone.now)
+
+
+class ItemStat(models.Model):
+    class Period(models.TextChoices):
+        HOUR = "hour", "HOUR"
+        DAY = "day", "DAY"
+
+    item = models.ForeignKey(Item, on_delete=models.CASCADE)
+    period = models.CharField(max_length=10, choices=Period.choices)
+    started_at = models.DateTimeField()
+    views = models.IntegerField(default=0)
+    bookmarks = models.IntegerField(default=0)
+    contacts = models.IntegerField(default=0)
+
+    class Meta:
+        ordering = ["started_at"]
+        unique_together = ["item", "period", "started_at"]
+
+
+class RelatedItems(models.Model):
+    item = models.OneToOneField(
+        Item, on_delete=models.CASCADE, primary_key=True, related_name="related"
+    )
+    item_ids = models.JSONField(default=list)
+    computed_at = models.DateTimeField()
+
+
+class ItemDocument(models.Model):
+    item = models.OneToOneField(
+        Item, on_delete=models.CASCADE, primary_key=True, related_name="document"
+    )
+    data = models.JSONField(encoder=DjangoJSONEncoder)
+    built_at = models.DateTimeField(auto_now=True)
+
+
+def get_item_cache_tags(category_id, location_id):
+    tags = ["items"]
+    if category_id:
+        for ancestor_id in CategoryClosure.objects.filter(
+            descendant_id=category_id
+        ).values_list("ancestor_id", flat=True):
+            tags.append("category:%s" % ancestor_id)
+    if location_id:
+        for ancestor_id in LocationClosure.objects.filter(
+            descendant_id=location_id
+        ).values_list("ancestor_id", flat=True):
+            tags.append("location:%s" % ancestor_id)
+    return tags
+
+
+@receiver(post_save, sender=Item)
+@receiver(post_delete, sender=Item)
+def invalidate_item_results(sender, instance, **kwargs):
+    trees = {instance._initial_tree, (instance.category_id, instance.location_id)}
+    for category_id, location_id in trees:
+        invalidate_tags(get_item_cache_tags(category_id, location_id))
+    instance._initial_tree = (instance.category_id, instance.location_id)
+
+
+def update_item_promotions(item_id):
+    slugs = sorted(
+        set(
+            Promotion.objects.filter(item_id=item_id, type__isnull=False).values_list(
+                "type__slug", flat=True
+            )
+        )
+    )
+    Item.objects.filter(id=item_id).update(
+        promotions=slugs,
+        is_fixed=Type.SlugType.FIXED in slugs,
+        is_highlighted=Type.SlugType.HIGHLIGHT in slugs,
+    )
+
+
+@receiver(post_save, sender=Promotion)
+@receiver(post_delete, sender=Promotion)
+def save_promotion(sender, instance, **kwargs):
+    update_item_promotions(instance.item_id)
+
+
+@receiver(post_save, sender=Promotion)
+@receiver(post_delete, sender=Promotion)
+def invalidate_promotion_results(sender, instance, **kwargs):
+    for category_id, location_id in Item.objects.filter(
+        id=instance.item_id
+    ).values_list("category_id", "location_id"):
+        invalidate_tags(get_item_cache_tags(category_id, location_id))
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Attribute)
+@receiver(post_delete, sender=Attribute)
+@receiver(post_save, sender=Option)
+@receiver(post_delete, sender=Option)
+@receiver(m2m_changed, sender=Category.field_attributes.through)
+@receiver(m2m_changed, sender=Category.filter_attributes.through)
+@receiver(m2m_changed, sender=Category.promotions.through)
+@receiver(post_save, sender=Type)
+@receiver(post_delete, sender=Type)
+@receiver(post_save, sender=PromotionOption)
+@receiver(post_delete, sender=PromotionOption)
+def invalidate_category_results(sender, **kwargs):
+    """
+    The tag also versions the category snapshot of every process, so it is
+    bumped only once the change is visible to a process that reloads it.
+    """
+    transaction.on_commit(lambda: invalidate_tags(["categories"]))
+
+
 def image_directory_path(instance, filename):
     return "{}.{}".format(str(uuid.uuid4()), filename.split(".")[-1])
 
@@ -227,6 +738,8 @@ class Image(models.Model):
     index = models.IntegerField(null=True, blank=True)
     file = models.ImageField(upload_to=image_directory_path, null=True, blank=True)
     temp_id = models.UUIDField(default=uuid.uuid4, null=True, blank=True)
+    renditions = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
 
     class Meta:
         ordering = ["index"]
@@ -234,20 +747,51 @@ class Image(models.Model):
     def save(self, *args, **kwargs):
         super().save(*args, **kwargs)
 
-        if self.file:
-            tmp_file_name = self.file.name
-            if self.file.width > 600 or self.file.height > 600:
-                new_width = 600
-                new_height = 600
+        if needs_renditions(self):
+            from .tasks import process_item_image
+
+            transaction.on_commit(lambda: process_item_image.delay(self.id))
 
-                resized = get_thumbnail(
-                    self.file, "{}x{}".format(new_width, new_height)
-                )
-                name = resized.name.split("/")[-1]
-                self.file.save(name, ContentFile(resized.read()), True)
-                delete(tmp_file_name)
+
+class ImageUpload(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey("authentication.User", on_delete=models.CASCADE)
+    filename = models.CharField(max_length=255)
+    size = models.PositiveIntegerField()
+    offset = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(default=timezone.now)
 
 
 @receiver(pre_delete, sender=Image)
 def delete_image(sender, instance, **kwargs):
-    delete(instance.file.name)
+    """
+    The files are removed once the deletion commits, so a rolled back
+    delete keeps its files.
+    """
+    name, renditions = instance.file.name, instance.renditions
+
+    def delete_files():
+        delete(name)
+        delete_renditions(renditions)
+
+    transaction.on_commit(delete_files)
+
+
+def update_item_image(item_id):
+    """
+    Stores the first image of the item, its list thumbnail rendition and the
+    number of images on the item, so that lists never query the images.
+    """
+    images = Image.objects.filter(item_id=item_id)
+    primary = images.exclude(file="").exclude(file=None).first()
+    primary_image = thumbnail = None
+    if primary is not None:
+        primary_image = primary.file.name
+        thumbnail = primary.renditions.get("thumb", {}).get("jpg")
+    Item.objects.filter(id=item_id).update(
+        primary_image=primary_image, thumbnail=thumbnail, image_count=images.count()
+    )
+
+    row = Item.objects.filter(id=item_id).values("category_id", "location_id").first()
+    if row is not None:
+        invalidate_tags(get_item_cache_tags(row["category_id"], row["location_id"]))
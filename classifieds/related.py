@@ -0,0 +1,135 @@
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Item, RelatedItems
+from .search import tokenize
+
+import numpy as np
+
+
+RELATED_ITEMS_COUNT = 8
+MAX_FEATURES = 2000
+CHUNK_SIZE = 1000
+
+
+def get_document_tokens(item):
+    tokens = tokenize(item.title or "", item.description or "")
+    for slug, value in (item.attributes or {}).items():
+        values = value if isinstance(value, list) else [value]
+        for value in values:
+            if value not in (None, "", False):
+                tokens.add("%s=%s" % (slug, value))
+    return tokens
+
+
+def build_vectors(documents):
+    """
+    Returns the L2-normalized TF-IDF matrix of the token sets, one row per
+    document. Tokens that occur in a single document cannot relate two items
+    and are dropped, and the vocabulary is capped at the MAX_FEATURES most
+    common of the rest.
+    """
+    document_frequencies = {}
+    for tokens in documents:
+        for token in tokens:
+            document_frequencies[token] = document_frequencies.get(token, 0) + 1
+    vocabulary = sorted(
+        (token for token, count in document_frequencies.items() if count > 1),
+        key=lambda token: -document_frequencies[token],
+    )[:MAX_FEATURES]
+    columns = {token: column for column, token in enumerate(vocabulary)}
+
+    matrix = np.zeros((len(documents), len(vocabulary)), dtype=np.float32)
+    for row, tokens in enumerate(documents):
+        for token in tokens:
+            column = columns.get(token)
+            if column is not None:
+                matrix[row, column] = 1
+    counts = np.array(
+        [document_frequencies[token] for token in vocabulary], dtype=np.float32
+    )
+    matrix *= np.log((1 + len(documents)) / (1 + counts)) + 1
+
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return matrix / norms
+
+
+def get_neighbours(matrix, k):
+    """
+    Returns the row indexes of the k most similar rows of every row by cosine
+    similarity. Rows are expected in order of recency so that a small bonus
+    breaks ties (and fills rows without any similar item) with newer items.
+    """
+    count = len(matrix)
+    k = min(k, count - 1)
+    if k <= 0:
+        return [[] for row in range(count)]
+
+    bonus = np.arange(count, dtype=np.float32) / count * 1e-3
+    neighbours = []
+    for start in range(0, count, CHUNK_SIZE):
+        scores = matrix[start : start + CHUNK_SIZE] @ matrix.T + bonus
+        rows = np.arange(len(scores))
+        scores[rows, rows + start] = -np.inf
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        order = np.argsort(-scores[rows[:, None], top], axis=1)
+        neighbours.extend(top[rows[:, None], order].tolist())
+    return neighbours
+
+
+def update_partition(category_id, location_id):
+    """
+    Recomputes the related items of every item whose parent category and
+    parent location are the given ones.
+    """
+    computed_at = timezone.now()
+    items = list(
+        Item.objects.filter(
+            category__parent_id=category_id, location__parent_id=location_id
+        )
+        .order_by("updated_at", "id")
+        .only("id", "title", "description", "attributes")
+    )
+    matrix = build_vectors([get_document_tokens(item) for item in items])
+    neighbours = get_neighbours(matrix, RELATED_ITEMS_COUNT)
+
+    with transaction.atomic():
+        RelatedItems.objects.filter(item__in=[item.id for item in items]).delete()
+        RelatedItems.objects.bulk_create(
+            [
+                RelatedItems(
+                    item=item,
+                    item_ids=[items[index].id for index in indexes],
+                    computed_at=computed_at,
+                )
+                for item, indexes in zip(items, neighbours)
+            ],
+            batch_size=1000,
+        )
+    return len(items)
+
+
+def update_related_items(full=False):
+    """
+    Recomputes the partitions that contain items without related items or
+    updated since they were computed, or every partition with full=True.
+    Returns the number of items computed.
+    """
+    items = Item.objects.filter(
+        category__parent__isnull=False, location__parent__isnull=False
+    )
+    if not full:
+        items = items.filter(
+            Q(related__isnull=True) | Q(updated_at__gt=F("related__computed_at"))
+        )
+    partitions = (
+        items.order_by()
+        .values_list("category__parent_id", "location__parent_id")
+        .distinct()
+    )
+    return sum(
+        update_partition(category_id, location_id)
+        for category_id, location_id in list(partitions)
+    )
@@ -0,0 +1,147 @@
+from decimal import Decimal, InvalidOperation
+
+from django.utils.dateparse import parse_date
+
+from .models import Attribute, is_attribute_value_in_range
+
+import copy
+
+
+OPTION_FIELD_TYPES = (
+    Attribute.FieldType.OPTION,
+    Attribute.FieldType.MULTIPLE_CHECKBOX,
+    Attribute.FieldType.RADIO,
+)
+
+EMPTY_VALUES = (None, "", [])
+
+
+def get_default(attribute):
+    if attribute.slug == "rent_type":
+        return 1
+    elif attribute.field_type == Attribute.FieldType.BOOLEAN:
+        return False
+    elif attribute.field_type == Attribute.FieldType.MULTIPLE_CHECKBOX:
+        return []
+    return ""
+
+
+def compile_schema(attributes):
+    """
+    Compiles the field attributes of a category (with their options
+    prefetched) into a {slug: field} dict with the field type, the required
+    flag, the allowed option values and the default value of each, and
+    whether its value is materialized into AttributeValue rows.
+    """
+    schema = {}
+    for attribute in attributes:
+        options = None
+        if attribute.field_type in OPTION_FIELD_TYPES:
+            options = frozenset(
+                str(option.value) for option in attribute.option_set.all()
+            )
+        schema[attribute.slug] = {
+            "field_type": attribute.field_type,
+            "required": attribute.required,
+            "options": options or None,
+            "default": get_default(attribute),
+            "materialized": (
+                attribute.filter_type == Attribute.FilterType.RANGE_INPUT
+                or attribute.field_type == Attribute.FieldType.BOOLEAN
+            ),
+        }
+    return schema
+
+
+def is_integer(value):
+    if isinstance(value, bool):
+        return False
+    if isinstance(value, int):
+        return True
+    return isinstance(value, str) and value.strip().lstrip("-").isdigit()
+
+
+def is_decimal(value):
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        return False
+    try:
+        return Decimal(str(value)).is_finite()
+    except InvalidOperation:
+        return False
+
+
+def get_error(field, value):
+    field_type = field["field_type"]
+    if field_type == Attribute.FieldType.TEXT:
+        if not isinstance(value, str):
+            return "文字列を入力してください。"
+    elif field_type == Attribute.FieldType.INTEGER:
+        if not is_integer(value):
+            return "整数を入力してください。"
+        if not is_attribute_value_in_range(Decimal(str(value).strip())):
+            return "値が大きすぎます。"
+    elif field_type == Attribute.FieldType.DECIMAL:
+        if not is_decimal(value):
+            return "数値を入力してください。"
+        if not is_attribute_value_in_range(Decimal(str(value))):
+            return "値が大きすぎます。"
+    elif field_type == Attribute.FieldType.BOOLEAN:
+        if not isinstance(value, bool):
+            return "真偽値を指定してください。"
+    elif field_type == Attribute.FieldType.DATE:
+        try:
+            if not isinstance(value, str) or parse_date(value) is None:
+                return "日付を入力してください。"
+        except ValueError:
+            return "日付を入力してください。"
+    elif field_type == Attribute.FieldType.MULTIPLE_CHECKBOX:
+        if not isinstance(value, list):
+            return "選択肢のリストを指定してください。"
+        if field["options"] and not {str(v) for v in value} <= field["options"]:
+            return "選択肢にない値が含まれています。"
+    elif field["options"] and str(value) not in field["options"]:
+        return "選択肢にない値です。"
+    return None
+
+
+def clean_attributes(schema, attributes):
+    """
+    Validates the attributes against the compiled schema in one pass and
+    returns ({slug: value}, {slug: error}). Keys outside the schema are
+    dropped. A required attribute may be left empty when its "no_<slug>"
+    companion is set, like price with no_price.
+    """
+    cleaned = {}
+    errors = {}
+    for slug, field in schema.items():
+        value = attributes.get(slug)
+        if value in EMPTY_VALUES:
+            if field["required"] and not attributes.get("no_%s" % slug):
+                errors[slug] = ["この項目は必須です。"]
+            elif slug in attributes:
+                cleaned[slug] = value
+            continue
+        error = get_error(field, value)
+        if error:
+            errors[slug] = [error]
+        else:
+            cleaned[slug] = value
+    return cleaned, errors
+
+
+def get_default_attributes(schema):
+    return {slug: copy.copy(field["default"]) for slug, field in schema.items()}
+
+
+def fill_default_attributes(schema, attributes):
+    """
+    Fills the attributes missing from a saved item with their defaults, and
+    blanks the empty decimal ones, for the edit form.
+    """
+    for slug, field in schema.items():
+        if slug not in attributes:
+            attributes[slug] = copy.copy(field["default"])
+        elif field["field_type"] == Attribute.FieldType.DECIMAL:
+            if not attributes[slug]:
+                attributes[slug] = ""
+    return attributes
@@ -0,0 +1,99 @@
+import re
+import unicodedata
+
+
+TOKEN_MAX_LENGTH = 32
+# Latin words are indexed as the WORD_GRAM_LENGTH characters starting at
+# each position, so the index grows linearly with the word length.
+WORD_GRAM_LENGTH = 8
+
+CJK_PATTERN = r"[ぁ-ゟ゠-ヿ㐀-䶿一-鿿豈-﫿]"
+WORD_PATTERN = r"[0-9a-z]+"
+
+RUN_RE = re.compile(r"(%s+)|(%s)" % (CJK_PATTERN, WORD_PATTERN))
+
+
+def normalize(text):
+    return unicodedata.normalize("NFKC", text or "").lower()
+
+
+def split_runs(text, max_length=TOKEN_MAX_LENGTH):
+    for match in RUN_RE.finditer(normalize(text)):
+        cjk, word = match.groups()
+        if cjk:
+            yield cjk, True
+        else:
+            yield word[:max_length], False
+
+
+def get_cover_positions(length, size):
+    """
+    Returns the start positions of windows of the given size that cover a
+    run of the given length with as few windows as possible.
+    """
+    positions = list(range(0, length - size + 1, size))
+    if positions[-1] != length - size:
+        positions.append(length - size)
+    return positions
+
+
+def tokenize(*texts):
+    """
+    Returns the set of tokens stored in the search index for the given texts.
+
+    Japanese runs are split into overlapping bigrams (a run of a single
+    character is kept as is), Latin and digit runs are kept as whole words.
+    """
+    tokens = set()
+    for text in texts:
+        for run, is_cjk in split_runs(text):
+            if is_cjk and len(run) > 1:
+                for i in range(len(run) - 1):
+                    tokens.add(run[i : i + 2])
+            else:
+                tokens.add(run)
+    return tokens
+
+
+def index_tokens(*texts):
+    """
+    Returns the tokens stored in the search index: Japanese bigrams as in
+    tokenize(), and for Latin words the grams of up to WORD_GRAM_LENGTH
+    characters starting at every position, so that keywords are also found
+    in the middle of a word, like icontains did.
+    """
+    tokens = set()
+    for text in texts:
+        for run, is_cjk in split_runs(text, max_length=None):
+            if not is_cjk:
+                for i in range(len(run)):
+                    tokens.add(run[i : i + WORD_GRAM_LENGTH])
+            elif len(run) > 1:
+                for i in range(len(run) - 1):
+                    tokens.add(run[i : i + 2])
+            else:
+                tokens.add(run)
+    return tokens
+
+
+def query_tokens(keyword):
+    """
+    Returns a list of (token, is_prefix) pairs that an item has to contain to
+    match the keyword. Japanese runs only need the bigrams that cover every
+    character once. Latin words up to WORD_GRAM_LENGTH characters are matched
+    as prefixes of the indexed grams, longer ones by the grams that cover
+    them. Single Japanese characters can't be looked up in a bigram index
+    and are left to the caller's substring filter.
+    """
+    tokens = []
+    for run, is_cjk in split_runs(keyword, max_length=None):
+        if is_cjk:
+            if len(run) > 1:
+                for i in get_cover_positions(len(run), 2):
+                    tokens.append((run[i : i + 2], False))
+        elif len(run) <= WORD_GRAM_LENGTH:
+            tokens.append((run, True))
+        else:
+            for i in get_cover_positions(len(run), WORD_GRAM_LENGTH):
+                tokens.append((run[i : i + WORD_GRAM_LENGTH], False))
+    return tokens
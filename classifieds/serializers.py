@@ -1,21 +1,38 @@
 from django.contrib.humanize.templatetags.humanize import intcomma
+from django.db import transaction
+from django.db.models import Q
 from django.utils.translation import ugettext_lazy as _
 
 from rest_framework import serializers
 
-from .models import Option, Attribute, Category, Item, Promotion, Image
+from .counters import add_pending_views
+from .models import (
+    Option,
+    Attribute,
+    Category,
+    Item,
+    ItemStat,
+    Promotion,
+    Image,
+    ImageUpload,
+    update_item_image,
+)
+from .schemas import clean_attributes
 
 from authentication.models import User, Image as AuthImage
 
+from backend.images import RenditionsField
 from locations.serializers import LocationLSerializer
 
 from promotion.serializers import TypeRSerializer, TypeLSerializer
 
 
 class AuthorImageSerializer(serializers.ModelSerializer):
+    renditions = RenditionsField()
+
     class Meta:
         model = AuthImage
-        fields = ("file",)
+        fields = ("file", "renditions")
 
 
 class AuthorSerializer(serializers.ModelSerializer):
@@ -127,15 +144,25 @@ class CategoryRFilterAttributeSerializer(CategoryRSerializer):
 
 
 class ImageSerializer(serializers.ModelSerializer):
+    renditions = RenditionsField()
+
     class Meta:
         model = Image
         fields = (
             "id",
             "file",
             "temp_id",
+            "renditions",
         )
 
 
+class ImageUploadSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ImageUpload
+        fields = ("id", "filename", "size", "offset")
+        read_only_fields = ("offset",)
+
+
 class AttributeMixin:
     def get_formatted_price(self, value, no_price=False):
         if not no_price:
@@ -190,29 +217,17 @@ class ItemLSerializer(AttributeMixin, serializers.ModelSerializer):
         return "%s, %s" % (obj.location.name, obj.location.state_code)
 
     def get_image(self, obj):
-        image_set = obj.image_set.all()
-        if image_set.exists():
-            return image_set.first().file.url
-        return None
+        return obj.list_image_url
 
 
 class ItemLPromotionSerializer(ItemLSerializer):
-    promotions = serializers.SerializerMethodField()
-
     class Meta(ItemLSerializer.Meta):
         fields = ItemLSerializer.Meta.fields + ("promotions",)
 
-    def get_promotions(self, obj):
-        promotions = []
-        for promotion in obj.promotion_set.all():
-            promotions.append(promotion.type.slug)
-        return promotions
-
 
 class ManageItemLSerializer(serializers.ModelSerializer):
     image = serializers.SerializerMethodField()
-    bookmarks = serializers.SerializerMethodField()
-    promotions = serializers.SerializerMethodField()
+    views = serializers.SerializerMethodField()
 
     class Meta:
         model = Item
@@ -226,20 +241,17 @@ class ManageItemLSerializer(serializers.ModelSerializer):
             "promotions",
         )
 
-    def get_bookmarks(self, obj):
-        return obj.bookmark_set.count()
+    def get_image(self, obj):
+        return obj.list_image_url
 
-    def get_promotions(self, obj):
-        promotions = []
-        for promotion in obj.promotion_set.all():
-            promotions.append(promotion.type.slug)
-        return promotions
+    def get_views(self, obj):
+        return add_pending_views(obj)
 
-    def get_image(self, obj):
-        image_set = obj.image_set.all()
-        if image_set.exists():
-            return image_set.first().file.url
-        return None
+
+class ItemStatSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ItemStat
+        fields = ("started_at", "views", "bookmarks", "contacts")
 
 
 class PromotionSerializer(serializers.ModelSerializer):
@@ -277,31 +289,51 @@ class ItemRSerializer(AttributeMixin, serializers.ModelSerializer):
 
 class SaveImageMixin:
     def save_image(self, instance):
+        """
+        Applies the deleted images and the order of the images in one fetch,
+        one bulk delete and one bulk update. Only unattached images and the
+        images of the item itself are touched, and only this item's images
+        can be deleted; unattached ones are left to the garbage collector.
+        """
         request_data = self.context.get("request").data
+        deleted_ids = [str(id) for id in request_data.get("deleted_images") or []]
+        image_ids = [str(image["id"]) for image in request_data.get("images") or []]
+
+        images = {
+            str(image.id): image
+            for image in Image.objects.filter(
+                Q(item__isnull=True) | Q(item=instance),
+                id__in=deleted_ids + image_ids,
+            ).only("id", "item", "index")
+        }
+        deleted = {
+            id
+            for id in deleted_ids
+            if id in images and images[id].item_id == instance.id
+        }
 
-        deleted_images = request_data.get("deleted_images")
-        if deleted_images and len(deleted_images) > 0:
-            for deleted_image in deleted_images:
-                try:
-                    image = Image.objects.get(id=deleted_image)
-                except Image.DoesNotExist:
-                    pass
-                else:
-                    image.delete()
-
-        images = request_data.get("images")
-        if images and len(images) > 0:
-            image_index = 1
-            for image in images:
-                try:
-                    image = Image.objects.get(id=image["id"])
-                except Image.DoesNotExist:
-                    pass
-                else:
-                    image.item = instance
-                    image.index = image_index
-                    image.save()
-                    image_index += 1
+        changed = []
+        image_index = 1
+        for id in image_ids:
+            if id not in images or id in deleted:
+                continue
+            image = images[id]
+            if image.item_id != instance.id or image.index != image_index:
+                image.item = instance
+                image.index = image_index
+                changed.append(image)
+            image_index += 1
+
+        with transaction.atomic():
+            if deleted:
+                Image.objects.filter(id__in=deleted).delete()
+            Image.objects.bulk_update(changed, ["item", "index"])
+            update_item_image(instance.id)
+
+        if changed:
+            from .documents import schedule_documents
+
+            schedule_documents([instance.id])
 
 
 class ItemPSerializer(SaveImageMixin, serializers.ModelSerializer):
@@ -324,32 +356,37 @@ class ItemPSerializer(SaveImageMixin, serializers.ModelSerializer):
         )
 
     def get_category_object(self, obj):
-        return CategoryRFieldAttributeSerializer(obj.category).data
+        from .snapshot import get_category
+
+        category = get_category(obj.category_id)
+        if category is None:
+            return CategoryRFieldAttributeSerializer(obj.category).data
+        return category["field_data"]
 
     def modify_attributes_value(self, attributes):
         if "no_price" in attributes and attributes["no_price"]:
             attributes["price"] = None
 
-    def create(self, validated_data):
-        self.modify_attributes_value(validated_data["attributes"])
+    def validate(self, data):
+        from .snapshot import get_schema
+
+        if "attributes" in data:
+            category = data.get("category", getattr(self.instance, "category", None))
+            attributes, errors = clean_attributes(
+                get_schema(category), data["attributes"] or {}
+            )
+            if errors:
+                raise serializers.ValidationError({"attributes": errors})
+            self.modify_attributes_value(attributes)
+            data["attributes"] = attributes
+        return data
 
+    def create(self, validated_data):
         item = Item.objects.create(**validated_data)
         self.save_image(item)
         return item
 
     def update(self, instance, validated_data):
-        attributes = validated_data["attributes"]
-
-        category_attributes_slug_list = instance.category.field_attributes.values_list(
-            "slug", flat=True
-        )
-
-        for key in list(attributes):
-            if key not in category_attributes_slug_list:
-                attributes.pop(key)
-
-        self.modify_attributes_value(attributes)
-
         super().update(instance, validated_data)
         self.save_image(instance)
         return instance
@@ -0,0 +1,145 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.http import Http404
+
+from .models import Attribute, Category
+from .schemas import compile_schema
+from .serializers import (
+    CategorySerializer,
+    CategoryLSerializer,
+    CategoryRFieldAttributeSerializer,
+    CategoryRFilterAttributeSerializer,
+)
+
+from backend.cache import get_tag_versions
+
+import threading
+import time
+
+
+CATEGORY_SNAPSHOT_MAX_AGE = getattr(settings, "CATEGORY_SNAPSHOT_MAX_AGE", 60 * 60)
+
+DEFAULT_SORTS = [
+    {"value": "", "name": "新しい順"},
+    {"value": "recommended", "name": "おすすめ順"},
+]
+
+lock = threading.Lock()
+snapshot = None
+
+
+def get_sorts(category):
+    sorts = list(DEFAULT_SORTS)
+    for attribute in category.filter_attributes.all():
+        if attribute.filter_type == Attribute.FilterType.RANGE_INPUT:
+            sorts.append(
+                {
+                    "value": "%s_asc" % attribute.slug,
+                    "name": "%sが低い順" % attribute.name,
+                }
+            )
+            sorts.append(
+                {
+                    "value": "%s_desc" % attribute.slug,
+                    "name": "%sが高い順" % attribute.name,
+                }
+            )
+    return sorts
+
+
+def build_snapshot(version):
+    """
+    Loads the whole category tree with its field and filter attributes, their
+    options and the promotion types in a fixed number of queries, serializes
+    every representation the category endpoints serve and compiles the
+    attribute schema of every category.
+    """
+    categories = (
+        Category.objects.select_related("parent")
+        .prefetch_related(
+            "children",
+            "field_attributes__option_set",
+            "filter_attributes",
+            "promotions__option_set",
+        )
+        .order_by("id")
+    )
+
+    entries = {}
+    levels = defaultdict(list)
+    for category in categories:
+        entries[category.id] = {
+            "category": category,
+            "data": CategorySerializer(category).data,
+            "list_data": CategoryLSerializer(category).data,
+            "filter_data": CategoryRFilterAttributeSerializer(category).data,
+            "field_data": CategoryRFieldAttributeSerializer(category).data,
+            "field_attributes": list(category.field_attributes.all()),
+            "schema": compile_schema(category.field_attributes.all()),
+            "promotions": list(category.promotions.all()),
+            "sorts": get_sorts(category),
+        }
+        levels[category.level].append(category.id)
+
+    return {
+        "version": version,
+        "built_at": time.monotonic(),
+        "categories": entries,
+        "levels": dict(levels),
+    }
+
+
+def is_current(current, version):
+    return (
+        current is not None
+        and current["version"] == version
+        and time.monotonic() - current["built_at"] < CATEGORY_SNAPSHOT_MAX_AGE
+    )
+
+
+def get_snapshot():
+    """
+    Returns this process's snapshot of the categories, reloading it when the
+    shared "categories" tag has been bumped since it was built. The snapshot
+    is shared between requests and must not be modified.
+    """
+    global snapshot
+
+    version = get_tag_versions(["categories"])[0]
+    current = snapshot
+    if not is_current(current, version):
+        with lock:
+            if not is_current(snapshot, version):
+                snapshot = build_snapshot(version)
+            current = snapshot
+    return current
+
+
+def get_categories(level):
+    current = get_snapshot()
+    return [current["categories"][id] for id in current["levels"].get(level, [])]
+
+
+def get_category(category_id):
+    try:
+        category_id = int(category_id)
+    except (TypeError, ValueError):
+        return None
+    return get_snapshot()["categories"].get(category_id)
+
+
+def get_category_or_404(category_id):
+    category = get_category(category_id)
+    if category is None:
+        raise Http404
+    return category
+
+
+def get_schema(category):
+    if category is None:
+        return {}
+    entry = get_category(category.id)
+    if entry is None:
+        return compile_schema(category.field_attributes.prefetch_related("option_set"))
+    return entry["schema"]
@@ -0,0 +1,88 @@
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from classifieds.counters import flush_views
+from classifieds.documents import build_documents, schedule_documents
+from classifieds.engagement import aggregate_events
+from classifieds.garbage import collect_garbage
+from classifieds.models import Image, Item, update_item_image
+from classifieds.related import update_related_items
+
+from authentication.models import Bookmark
+from backend.images import process_image
+
+from celery import shared_task
+
+
+@shared_task
+def reconcile_bookmark_counts(batch_size=1000):
+    counts = (
+        Bookmark.objects.filter(item=OuterRef("pk"))
+        .order_by()
+        .values("item")
+        .annotate(count=Count("id"))
+        .values("count")
+    )
+
+    updated = 0
+    last_id = 0
+    while True:
+        ids = list(
+            Item.objects.filter(id__gt=last_id)
+            .order_by("id")
+            .values_list("id", flat=True)[:batch_size]
+        )
+        if not ids:
+            break
+        updated += (
+            Item.objects.filter(id__in=ids)
+            .annotate(
+                actual=Coalesce(Subquery(counts, output_field=IntegerField()), Value(0))
+            )
+            .exclude(bookmarks=F("actual"))
+            .update(
+                bookmarks=Coalesce(
+                    Subquery(counts, output_field=IntegerField()), Value(0)
+                )
+            )
+        )
+        last_id = ids[-1]
+    return updated
+
+
+@shared_task
+def flush_view_counts():
+    return flush_views()
+
+
+@shared_task
+def aggregate_item_events():
+    return aggregate_events()
+
+
+@shared_task
+def update_related_item_lists():
+    return update_related_items()
+
+
+@shared_task
+def build_item_documents(item_ids):
+    return build_documents(item_ids)
+
+
+@shared_task
+def process_item_image(image_id, force=False):
+    if process_image(Image, image_id, force) is None:
+        return False
+    item_id = (
+        Image.objects.filter(id=image_id).values_list("item_id", flat=True).first()
+    )
+    if item_id:
+        update_item_image(item_id)
+        schedule_documents([item_id])
+    return True
+
+
+@shared_task
+def collect_media_garbage(dry_run=False):
+    return collect_garbage(dry_run=dry_run)
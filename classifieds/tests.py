@@ -1,3 +1,932 @@
-from django.test import TestCase
+import importlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from django.test import TestCase, override_settings
+
+from rest_framework.exceptions import NotFound
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from authentication.models import Bookmark
+from backend.cache import check_shared_cache
+from backend.utils import rebuild_closure
+from backend.images import ORIENTATION, process_image
+from backend.pagination import (
+    COUNT_ESTIMATE,
+    COUNT_EXACT,
+    COUNT_NONE,
+    get_count,
+    get_generation,
+)
+from locations.models import Location
+from promotion.models import Type
+
+from .counters import (
+    VIEW_FLUSH_INTERVAL,
+    add_pending_views,
+    flush_views,
+    record_view,
+)
+from .documents import build_documents, get_document
+from .engagement import aggregate_events, get_item_stats, record_event
+from .facets import get_facets, rebuild_facets
+from .garbage import collect_garbage
+from .models import (
+    Attribute,
+    AttributeFacet,
+    AttributeValue,
+    Category,
+    CategoryClosure,
+    Image,
+    Item,
+    ItemEvent,
+    ItemFacet,
+    ImageUpload,
+    ItemStat,
+    Option,
+    Promotion,
+    SearchToken,
+    to_attribute_value,
+    update_item_image,
+)
+from .tasks import reconcile_bookmark_counts
+from .uploads import (
+    IMAGE_UPLOAD_MAX_SIZE,
+    UploadError,
+    append_chunk,
+    create_upload,
+    finalize_upload,
+    get_part_path,
+)
+from .views import (
+    CategoryViewSet,
+    ItemViewSet,
+    KeysetPagination,
+    get_facet_result_tags,
+)
+from .related import update_related_items
+from .search import WORD_GRAM_LENGTH, index_tokens, query_tokens
+from .schemas import clean_attributes, compile_schema, get_error
+from .serializers import ItemPSerializer
+
+from PIL import Image as PILImage
+
+User = get_user_model()
+
+TESTDATA_DIR = os.path.join(os.path.dirname(__file__), "testdata")
+
+
+def create_item(**kwargs):
+    if "author" not in kwargs:
+        kwargs["author"] = User.objects.create_user(
+            "user%s@example.com" % User.objects.count(), "user"
+        )
+    kwargs.setdefault("category", Category.objects.create(name="category"))
+    kwargs.setdefault("location", Location.objects.create(name="location"))
+    kwargs.setdefault("title", "title")
+    kwargs.setdefault("description", "description")
+    kwargs.setdefault("attributes", {})
+    return Item.objects.create(**kwargs)
+
+
+class SearchTokenTests(TestCase):
+    def test_index_tokens_grows_linearly(self):
+        word = "a" * 10 + "b" * 100
+        tokens = index_tokens(word)
+        self.assertLessEqual(len(tokens), len(word))
+        self.assertTrue(all(len(t) <= WORD_GRAM_LENGTH for t in tokens))
+
+    def test_query_tokens_of_long_word_are_indexed(self):
+        tokens = index_tokens("supercalifragilistic")
+        for token, is_prefix in query_tokens("califragilis"):
+            self.assertFalse(is_prefix)
+            self.assertIn(token, tokens)
+
+    def test_query_tokens_of_japanese(self):
+        self.assertEqual(query_tokens("東京都"), [("東京", False), ("京都", False)])
+        self.assertEqual(query_tokens("東"), [])
+
+
+class KeywordSearchTests(TestCase):
+    def search(self, keyword):
+        return list(
+            Item.objects.filter_by_query({"keyword": keyword}).values_list(
+                "title", flat=True
+            )
+        )
+
+    def test_matches_in_the_middle_of_words(self):
+        create_item(title="iPhone12 Pro")
+        create_item(title="Android phone")
+        self.assertEqual(
+            sorted(self.search("PHONE")), ["Android phone", "iPhone12 Pro"]
+        )
+        self.assertEqual(self.search("hone12"), ["iPhone12 Pro"])
+
+    def test_matches_long_words(self):
+        create_item(title="Antidisestablishmentarianism")
+        self.assertEqual(len(self.search("establishmentarian")), 1)
+        self.assertEqual(self.search("establishmentarians"), [])
+
+    def test_matches_japanese(self):
+        create_item(title="東京都の部屋")
+        self.assertEqual(len(self.search("京都")), 1)
+        self.assertEqual(self.search("大阪"), [])
+
+    def test_tokens_follow_title_changes(self):
+        item = create_item(title="sofa")
+        item.title = "table"
+        item.save()
+        self.assertEqual(self.search("sofa"), [])
+        self.assertEqual(self.search("table"), ["table"])
+        self.assertFalse(SearchToken.objects.filter(item=item, token="sofa").exists())
+
+
+class AttributeValueTests(TestCase):
+    def setUp(self):
+        # The category snapshot is invalidated once the changes commit.
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category = Category.objects.create(name="category")
+            self.category.field_attributes.add(
+                Attribute.objects.create(
+                    slug="price",
+                    field_type=Attribute.FieldType.INTEGER,
+                    filter_type=Attribute.FilterType.RANGE_INPUT,
+                ),
+                Attribute.objects.create(slug="no_price", field_type="boolean"),
+                Attribute.objects.create(slug="color", field_type="text"),
+            )
+
+    def filter(self, **query):
+        return list(Item.objects.filter_by_query(query).values_list("title", flat=True))
+
+    def test_to_attribute_value(self):
+        self.assertEqual(to_attribute_value("12.346"), Decimal("12.35"))
+        self.assertEqual(to_attribute_value(True), 1)
+        self.assertIsNone(to_attribute_value(""))
+        self.assertIsNone(to_attribute_value("abc"))
+        self.assertIsNone(to_attribute_value("1e20"))
+        self.assertIsNone(to_attribute_value("999999999999.999"))
+
+    def test_materializes_range_and_boolean_attributes(self):
+        item = create_item(
+            category=self.category,
+            attributes={"price": 500, "no_price": False, "color": "red"},
+        )
+        self.assertEqual(
+            dict(AttributeValue.objects.filter(item=item).values_list("slug", "value")),
+            {"price": Decimal("500.00"), "no_price": Decimal("0.00")},
+        )
+
+    def test_filters_by_price_range(self):
+        create_item(category=self.category, title="cheap", attributes={"price": 100})
+        create_item(category=self.category, title="dear", attributes={"price": 900})
+        self.assertEqual(self.filter(min_price="500"), ["dear"])
+        self.assertEqual(self.filter(max_price="500"), ["cheap"])
+
+    def test_migration_backfills_attribute_values(self):
+        item = create_item(category=self.category, attributes={"price": 100})
+        AttributeValue.objects.all().delete()
+        migration = importlib.import_module(
+            "classifieds.migrations.0004_attributevalue"
+        )
+        migration.build_attribute_values(apps, None)
+        self.assertEqual(
+            list(AttributeValue.objects.filter(item=item).values_list("slug", "value")),
+            [("price", Decimal("100.00"))],
+        )
+
+
+class CountTests(TestCase):
+    def test_count_modes(self):
+        create_item()
+        queryset = Item.objects.all()
+        self.assertEqual(get_count(queryset, COUNT_EXACT), (1, "exact"))
+        self.assertEqual(get_count(queryset, COUNT_NONE), (None, None))
+        # Without table statistics the estimate falls back to an exact count.
+        self.assertEqual(get_count(queryset, COUNT_ESTIMATE), (1, "exact"))
+
+    def test_cached_count_follows_item_changes(self):
+        item = create_item()
+        queryset = Item.objects.filter(category=item.category)
+        self.assertEqual(get_count(queryset, COUNT_EXACT)[0], 1)
+        create_item(category=item.category)
+        self.assertEqual(get_count(queryset, COUNT_EXACT)[0], 2)
+        item.delete()
+        self.assertEqual(get_count(queryset, COUNT_EXACT)[0], 1)
+
+    def test_only_paginated_models_bump_generations(self):
+        item = create_item()
+        generation = get_generation("classifieds.item")
+        Category.objects.create(name="other")
+        self.assertEqual(get_generation("classifieds.item"), generation)
+        Bookmark.objects.create(user=item.author, item=item)
+        self.assertEqual(get_generation("classifieds.item"), generation)
+        item.save()
+        self.assertEqual(get_generation("classifieds.item"), generation + 1)
+
+
+class SharedCacheCheckTests(TestCase):
+    def test_shared_cache(self):
+        self.assertEqual(check_shared_cache(None), [])
+
+    @override_settings(
+        CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+    )
+    def test_local_cache(self):
+        self.assertEqual([e.id for e in check_shared_cache(None)], ["backend.E001"])
+        with self.settings(DEBUG=True):
+            self.assertEqual([e.id for e in check_shared_cache(None)], ["backend.W001"])
+
+
+class FacetTests(TestCase):
+    def setUp(self):
+        # The category snapshot is invalidated once the changes commit.
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category = Category.objects.create(name="category")
+            self.category.field_attributes.add(
+                Attribute.objects.create(
+                    slug="price",
+                    field_type=Attribute.FieldType.INTEGER,
+                    filter_type=Attribute.FilterType.RANGE_INPUT,
+                )
+            )
+        self.location = Location.objects.create(name="location")
+
+    def get_counts(self):
+        return (
+            {
+                (facet.category_id, facet.location_id): facet.count
+                for facet in ItemFacet.objects.all()
+                if facet.count
+            },
+            {
+                (facet.slug, facet.bucket): facet.count
+                for facet in AttributeFacet.objects.all()
+                if facet.count
+            },
+        )
+
+    def test_counts_follow_item_changes(self):
+        other = Location.objects.create(name="other")
+        item = create_item(
+            category=self.category, location=self.location, attributes={"price": 150}
+        )
+        create_item(
+            category=self.category, location=self.location, attributes={"price": 50}
+        )
+        self.assertEqual(
+            self.get_counts(),
+            (
+                {(self.category.id, self.location.id): 2},
+                {("price", 1): 1, ("price", 0): 1},
+            ),
+        )
+
+        item.location = other
+        item.attributes = {"price": 600}
+        item.save()
+        self.assertEqual(
+            self.get_counts(),
+            (
+                {
+                    (self.category.id, self.location.id): 1,
+                    (self.category.id, other.id): 1,
+                },
+                {("price", 4): 1, ("price", 0): 1},
+            ),
+        )
+
+        item.delete()
+        self.assertEqual(
+            self.get_counts(),
+            ({(self.category.id, self.location.id): 1}, {("price", 0): 1}),
+        )
+
+    def test_counts_match_rebuild(self):
+        for price in (10, 150, 150, 20000):
+            create_item(
+                category=self.category,
+                location=self.location,
+                attributes={"price": price},
+            )
+        create_item(category=self.category, location=None)
+        counts = self.get_counts()
+        rebuild_facets()
+        self.assertEqual(self.get_counts(), counts)
+
+    def test_duplicate_rows_are_summed(self):
+        create_item(category=self.category, location=None)
+        ItemFacet.objects.create(category=self.category, location=None, count=1)
+        facets = get_facets({})
+        self.assertEqual(facets["categories"], [{"id": self.category.id, "count": 2}])
+
+    def test_migration_backfills_facets(self):
+        create_item(category=self.category, location=self.location)
+        counts = self.get_counts()
+        ItemFacet.objects.all().delete()
+        AttributeFacet.objects.all().delete()
+        importlib.import_module("classifieds.migrations.0008_facets").build_facets(
+            apps, None
+        )
+        self.assertEqual(self.get_counts(), counts)
+
+    def test_result_tags_ignore_the_tree_filters(self):
+        self.assertEqual(get_facet_result_tags({"category_id": "1"}), ["items"])
+
+
+class EngagementTests(TestCase):
+    def test_aggregate_events(self):
+        item = create_item()
+        record_event(item.id, ItemEvent.Type.VIEW, 3)
+        record_event(item.id, ItemEvent.Type.VIEW)
+        record_event(item.id, ItemEvent.Type.CONTACT)
+
+        self.assertEqual(aggregate_events(batch_size=2), 3)
+        self.assertFalse(ItemEvent.objects.exists())
+        stats = get_item_stats(item)
+        for period in ("hourly", "daily"):
+            self.assertEqual(
+                list(stats[period].values_list("views", "bookmarks", "contacts")),
+                [(4, 0, 1)],
+            )
+
+        record_event(item.id, ItemEvent.Type.BOOKMARK)
+        self.assertEqual(aggregate_events(), 1)
+        self.assertEqual(
+            ItemStat.objects.filter(item=item).values_list("bookmarks", flat=True)[0],
+            1,
+        )
+
+    def test_overlapping_run_is_skipped(self):
+        record_event(create_item().id, ItemEvent.Type.VIEW)
+        cache.add("item-events:aggregate-lock", 1)
+        try:
+            self.assertEqual(aggregate_events(), 0)
+        finally:
+            cache.delete("item-events:aggregate-lock")
+        self.assertEqual(ItemEvent.objects.count(), 1)
+
+
+class ImageProcessingTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.settings_override = self.settings(MEDIA_ROOT=media_root)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+    def create_image(self, name):
+        image = Image(item=create_item())
+        with open(os.path.join(TESTDATA_DIR, name), "rb") as f:
+            image.file.save(name, ContentFile(f.read()))
+        return image
+
+    def assert_stripped(self, name):
+        image = self.create_image(name)
+        source = image.file.name
+        self.assertIsNotNone(process_image(Image, image.id))
+
+        image.refresh_from_db()
+        self.assertNotEqual(image.file.name, source)
+        self.assertTrue(image.file.name.endswith(".jpg"))
+        self.assertFalse(image.file.storage.exists(source))
+        self.assertLessEqual({"thumb", "detail", "full"}, set(image.renditions))
+        with image.file.open("rb"), PILImage.open(image.file) as stripped:
+            self.assertEqual(stripped.format, "JPEG")
+            self.assertEqual(dict(stripped.getexif()), {ORIENTATION: 6})
+
+    def test_strips_jpeg_metadata(self):
+        self.assert_stripped("photo.jpg")
+
+    def test_strips_mpo_metadata(self):
+        self.assert_stripped("photo_mpo.jpg")
+
+
+class CategorySetTests(TestCase):
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.parent = Category.objects.create(name="parent", level=1)
+            self.child = Category.objects.create(
+                name="child", level=2, parent=self.parent
+            )
+        self.view = CategoryViewSet.as_view({"get": "set"})
+
+    def get(self, **params):
+        return self.view(APIRequestFactory().get("/", params)).data
+
+    def test_set_is_served_from_the_snapshot(self):
+        self.get(selected_id=self.child.id)
+        with self.assertNumQueries(0):
+            data = self.get(selected_id=self.child.id)
+        self.assertEqual(data["l1_value"], self.parent.id)
+        self.assertEqual(data["l2_value"], self.child.id)
+        self.assertEqual([c["id"] for c in data["l2_options"]], [self.child.id])
+
+    def test_set_follows_category_changes(self):
+        self.get(selected_id=self.parent.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            other = Category.objects.create(name="other", level=2, parent=self.parent)
+        data = self.get(selected_id=self.parent.id)
+        self.assertEqual(
+            [c["id"] for c in data["l2_options"]], [self.child.id, other.id]
+        )
+
+
+class ClosureTests(TestCase):
+    def get_closure(self):
+        return set(
+            CategoryClosure.objects.values_list("ancestor_id", "descendant_id", "depth")
+        )
+
+    def test_closure_follows_moves(self):
+        root = Category.objects.create(name="root")
+        child = Category.objects.create(name="child", parent=root)
+        leaf = Category.objects.create(name="leaf", parent=child)
+        other = Category.objects.create(name="other")
+        self.assertEqual(
+            self.get_closure(),
+            {
+                (root.id, root.id, 0),
+                (child.id, child.id, 0),
+                (leaf.id, leaf.id, 0),
+                (other.id, other.id, 0),
+                (root.id, child.id, 1),
+                (child.id, leaf.id, 1),
+                (root.id, leaf.id, 2),
+            },
+        )
+
+        child.parent = other
+        child.save()
+        closure = self.get_closure()
+        self.assertIn((other.id, leaf.id, 2), closure)
+        self.assertNotIn((root.id, leaf.id, 2), closure)
+
+        rebuild_closure(Category, CategoryClosure)
+        self.assertEqual(self.get_closure(), closure)
+
+    def test_filter_by_tree(self):
+        root = Category.objects.create(name="root")
+        child = Category.objects.create(name="child", parent=root)
+        location = Location.objects.create(name="state")
+        suburb = Location.objects.create(name="suburb", parent=location)
+        create_item(title="root", category=root, location=location)
+        create_item(title="child", category=child, location=suburb)
+
+        def filter(**query):
+            return sorted(
+                Item.objects.filter_by_query(query).values_list("title", flat=True)
+            )
+
+        self.assertEqual(filter(category_id=root.id), ["child", "root"])
+        self.assertEqual(filter(category_id=child.id), ["child"])
+        self.assertEqual(filter(location_id=location.id), ["child", "root"])
+        self.assertEqual(filter(location_id=suburb.id), ["child"])
+
+
+class KeysetPaginationTests(TestCase):
+    def paginate(self, queryset, cursor=""):
+        pagination = KeysetPagination()
+        pagination.page_size = 2
+        request = Request(APIRequestFactory().get("/", {"cursor": cursor}))
+        return pagination.paginate_queryset(queryset, request), pagination
+
+    def test_walks_every_item_once(self):
+        created_at = timezone.now().replace(microsecond=123456)
+        items = [create_item(created_at=created_at) for i in range(3)]
+        items += [create_item(created_at=created_at.replace(microsecond=0))]
+        queryset = Item.objects.order_by("-created_at")
+
+        seen = []
+        cursor = ""
+        while True:
+            page, pagination = self.paginate(queryset, cursor)
+            seen += [item.id for item in page]
+            cursor = pagination.next_cursor
+            if not cursor:
+                break
+        self.assertEqual(seen, [item.id for item in items[2::-1]] + [items[3].id])
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(NotFound):
+            self.paginate(Item.objects.order_by("-created_at"), "invalid")
+
+
+class BookmarkCountTests(TestCase):
+    def test_reconcile_bookmark_counts(self):
+        item = create_item()
+        other = create_item()
+        Bookmark.objects.create(user=item.author, item=item)
+        Bookmark.objects.create(user=other.author, item=item)
+        Item.objects.filter(id=other.id).update(bookmarks=5)
+
+        self.assertEqual(reconcile_bookmark_counts(batch_size=1), 2)
+        self.assertEqual(
+            dict(Item.objects.values_list("id", "bookmarks")), {item.id: 2, other.id: 0}
+        )
+        self.assertEqual(reconcile_bookmark_counts(), 0)
+
+    def test_recommended_sort(self):
+        item = create_item(title="popular")
+        create_item(title="new")
+        Item.objects.filter(id=item.id).update(bookmarks=3)
+        self.assertEqual(
+            list(
+                Item.objects.filter_by_query({"sort": "recommended"}).values_list(
+                    "title", flat=True
+                )
+            ),
+            ["popular", "new"],
+        )
+
+
+class ResultCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name="category")
+        self.item = create_item(title="first", category=self.category)
+
+    def list(self, user=None, **params):
+        request = APIRequestFactory().get("/", params)
+        if user:
+            force_authenticate(request, user)
+        response = ItemViewSet.as_view({"get": "list"})(request)
+        if hasattr(response, "render"):
+            response.render()
+        return json.loads(response.content)
+
+    def get_titles(self, data):
+        return [item["title"] for item in data["results"]]
+
+    def test_anonymous_results_are_cached_until_items_change(self):
+        query = {"category_id": self.category.id, "keyword": " first "}
+        self.assertEqual(self.get_titles(self.list(**query)), ["first"])
+        with self.assertNumQueries(0):
+            data = self.list(category_id=self.category.id, keyword="first")
+        self.assertEqual(self.get_titles(data), ["first"])
+
+        self.item.title = "first edited"
+        self.item.save()
+        self.assertEqual(self.get_titles(self.list(**query)), ["first edited"])
+
+    def test_other_categories_keep_their_entries(self):
+        other = Category.objects.create(name="other")
+        self.list(category_id=self.category.id)
+        create_item(category=other)
+        with self.assertNumQueries(0):
+            self.list(category_id=self.category.id)
+
+    def test_authenticated_requests_bypass_the_cache(self):
+        self.list()
+        Item.objects.filter(id=self.item.id).update(title="changed")
+        self.assertEqual(self.get_titles(self.list()), ["first"])
+        self.assertEqual(self.get_titles(self.list(self.item.author)), ["changed"])
+
+
+class PromotionTests(TestCase):
+    def setUp(self):
+        self.item = create_item()
+        self.fixed = Type.objects.create(
+            slug=Type.SlugType.FIXED, name="fixed", description="", index=0
+        )
+        self.highlight = Type.objects.create(
+            slug=Type.SlugType.HIGHLIGHT, name="highlight", description="", index=1
+        )
+
+    def test_promotions_are_copied_to_the_item(self):
+        Promotion.objects.create(item=self.item, type=self.highlight)
+        fixed = Promotion.objects.create(item=self.item, type=self.fixed)
+        Promotion.objects.create(item=self.item, type=self.fixed)
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.promotions, ["fixed", "highlight"])
+        self.assertTrue(self.item.is_fixed)
+        self.assertTrue(self.item.is_highlighted)
+        self.assertEqual(list(Item.objects.filter_by_fixed()), [self.item])
+        self.assertEqual(list(Item.objects.filter_by_unfixed()), [])
+
+        fixed.delete()
+        self.item.refresh_from_db()
+        self.assertTrue(self.item.is_fixed)
+        Promotion.objects.filter(type=self.fixed).first().delete()
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.promotions, ["highlight"])
+        self.assertFalse(self.item.is_fixed)
+        self.assertEqual(list(Item.objects.filter_by_unfixed()), [self.item])
+
+
+class ViewCountTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.item = create_item()
+
+    def flush_next_slot(self):
+        now = time.time() + VIEW_FLUSH_INTERVAL
+        with mock.patch("classifieds.counters.time.time", return_value=now):
+            return flush_views()
+
+    def test_views_are_buffered_until_flushed(self):
+        record_view(self.item.id)
+        record_view(self.item.id)
+        self.assertEqual(add_pending_views(self.item), 2)
+        self.assertEqual(flush_views(), 0)
+        self.assertEqual(Item.objects.get(id=self.item.id).views, 0)
+
+        self.assertEqual(self.flush_next_slot(), 2)
+        item = Item.objects.get(id=self.item.id)
+        self.assertEqual(item.views, 2)
+        self.assertEqual(add_pending_views(item), 2)
+        event = ItemEvent.objects.get()
+        self.assertEqual((event.type, event.count), (ItemEvent.Type.VIEW, 2))
+        self.assertEqual(self.flush_next_slot(), 0)
+
+    def test_full_saves_keep_flushed_views(self):
+        record_view(self.item.id)
+        self.flush_next_slot()
+        self.item.title = "edited"
+        self.item.save()
+        self.assertEqual(Item.objects.get(id=self.item.id).views, 1)
+
+
+class RelatedItemsTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name="category")
+        location = Location.objects.create(name="state")
+        self.tree = {
+            "category": Category.objects.create(name="child", parent=category),
+            "location": Location.objects.create(name="suburb", parent=location),
+        }
+
+    def test_items_are_ranked_by_similarity(self):
+        bike = create_item(title="red mountain bike", **self.tree)
+        sofa = create_item(title="leather sofa", **self.tree)
+        other_bike = create_item(title="blue mountain bike", **self.tree)
+        create_item(title="red mountain bike")
+
+        self.assertEqual(update_related_items(), 3)
+        self.assertEqual(list(Item.objects.filter_by_related(bike)), [other_bike, sofa])
+        self.assertEqual(update_related_items(), 0)
+
+        sofa.updated_at = timezone.now()
+        sofa.save(update_fields=["updated_at"])
+        self.assertEqual(update_related_items(), 3)
+        self.assertEqual(update_related_items(full=True), 3)
+
+    def test_uncomputed_items_fall_back_to_the_tree(self):
+        item = create_item(**self.tree)
+        other = create_item(**self.tree)
+        self.assertEqual(list(Item.objects.filter_by_related(item)), [other])
+
+
+class ItemDocumentTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.item = create_item(title="title")
+
+    def retrieve(self, pk):
+        request = APIRequestFactory().get("/")
+        return ItemViewSet.as_view({"get": "retrieve"})(request, pk=pk)
+
+    def test_retrieve_serves_the_stored_document(self):
+        self.assertEqual(self.retrieve(self.item.id).data["title"], "title")
+        self.assertEqual(build_documents([self.item.id]), 1)
+        Item.objects.filter(id=self.item.id).update(title="changed", views=5)
+
+        response = self.retrieve(self.item.id)
+        self.assertEqual(response.data["title"], "title")
+        self.assertEqual(response.data["views"], 6)
+        self.assertEqual(get_document(self.item.id)["views"], 7)
+
+    def test_retrieve_checks_the_lookup(self):
+        build_documents([self.item.id])
+        self.assertEqual(self.retrieve("abc").status_code, 404)
+        self.assertEqual(self.retrieve(self.item.id + 1).status_code, 404)
+
+    def test_changes_schedule_a_rebuild(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.item.save()
+        self.assertEqual(len(callbacks), 1)
+        with self.captureOnCommitCallbacks() as callbacks:
+            Item.objects.filter(id=self.item.id).update(title="changed")
+        self.assertEqual(callbacks, [])
+
+
+class ItemImageTests(TestCase):
+    def test_primary_image_and_thumbnail_are_copied_to_the_item(self):
+        item = create_item()
+        thumb = {"thumb": {"jpg": "second_thumb.jpg"}}
+        Image.objects.create(item=item, index=1, file="second.jpg", renditions=thumb)
+        Image.objects.create(item=item, index=0, file="first.jpg")
+        update_item_image(item.id)
+
+        item.refresh_from_db()
+        self.assertEqual(item.primary_image.name, "first.jpg")
+        self.assertIsNone(item.thumbnail.name)
+        self.assertEqual(item.list_image_url, "/media/first.jpg")
+        self.assertEqual(item.image_count, 2)
+
+        Image.objects.filter(index=0).delete()
+        update_item_image(item.id)
+        item.refresh_from_db()
+        self.assertEqual(item.list_image_url, "/media/second_thumb.jpg")
+
+        item.primary_image = None
+        item.save()
+        item.refresh_from_db()
+        self.assertEqual(item.primary_image.name, "second.jpg")
+
+        Image.objects.all().delete()
+        update_item_image(item.id)
+        item.refresh_from_db()
+        self.assertIsNone(item.list_image_url)
+        self.assertEqual(item.image_count, 0)
+
+
+class ImageUploadTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.settings_override = self.settings(MEDIA_ROOT=media_root)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        patcher = mock.patch(
+            "classifieds.uploads.IMAGE_UPLOAD_TEMP_DIR",
+            os.path.join(media_root, "uploads"),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = User.objects.create_user("user@example.com", "user")
+
+    def test_chunks_are_appended_and_finalized(self):
+        with open(os.path.join(TESTDATA_DIR, "photo.jpg"), "rb") as f:
+            content = f.read()
+        upload = create_upload(self.user, "photo.png", len(content))
+        half = len(content) // 2
+        append_chunk(upload, 0, io.BytesIO(content[:half]), half)
+        with self.assertRaises(UploadError):
+            finalize_upload(upload)
+        with self.assertRaises(UploadError):
+            append_chunk(upload, 0, io.BytesIO(content[:half]), half)
+
+        rest = len(content) - half
+        append_chunk(upload, half, io.BytesIO(content[half:]), rest)
+        self.assertEqual(ImageUpload.objects.get().offset, len(content))
+        image = finalize_upload(upload)
+        self.assertTrue(image.file.name.endswith(".jpg"))
+        with image.file.open("rb"):
+            self.assertEqual(image.file.read(), content)
+        self.assertFalse(ImageUpload.objects.exists())
+        self.assertFalse(os.path.exists(get_part_path(upload)))
+
+    def test_rejects_files_that_are_not_images(self):
+        with self.assertRaises(UploadError):
+            create_upload(self.user, "photo.jpg", IMAGE_UPLOAD_MAX_SIZE + 1)
+        content = b"not an image"
+        upload = create_upload(self.user, "photo.jpg", len(content))
+        with self.assertRaises(UploadError):
+            append_chunk(upload, 0, io.BytesIO(content), len(content))
+        self.assertFalse(ImageUpload.objects.exists())
+        self.assertFalse(os.path.exists(get_part_path(upload)))
+
+
+class GarbageCollectionTests(TestCase):
+    def setUp(self):
+        cache.delete("media-gc:lock")
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        self.settings_override = self.settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        patcher = mock.patch(
+            "classifieds.garbage.IMAGE_UPLOAD_TEMP_DIR",
+            os.path.join(self.media_root, "uploads"),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create_image(self, **kwargs):
+        image = Image(**kwargs)
+        image.file.save("photo.jpg", ContentFile(b"image"))
+        self.make_old(image.file.name)
+        return image
+
+    def make_old(self, name):
+        old = time.time() - 2 * 60 * 60
+        os.utime(os.path.join(self.media_root, name), (old, old))
+
+    def test_collects_unreferenced_images_and_files(self):
+        old = timezone.now() - timedelta(hours=2)
+        orphan = self.create_image(created_at=old)
+        recent = self.create_image()
+        attached = self.create_image(item=create_item(), created_at=old)
+        stray = default_storage.save("stray.jpg", ContentFile(b"stray"))
+        self.make_old(stray)
+        default_storage.save("recent.jpg", ContentFile(b"recent"))
+
+        report = collect_garbage(dry_run=True, age=60 * 60, pause=0)
+        self.assertEqual(
+            report,
+            {"images": 1, "uploads": 0, "thumbnails": 0, "files": 1, "bytes": 10},
+        )
+        self.assertTrue(default_storage.exists(stray))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            report = collect_garbage(age=60 * 60, pause=0)
+        self.assertEqual(report["images"], 1)
+        self.assertEqual(list(Image.objects.order_by("id")), [recent, attached])
+        self.assertFalse(default_storage.exists(orphan.file.name))
+        self.assertFalse(default_storage.exists(stray))
+        self.assertTrue(default_storage.exists("recent.jpg"))
+        self.assertTrue(default_storage.exists(attached.file.name))
+        self.assertEqual(collect_garbage(age=60 * 60, pause=0)["files"], 0)
+
+
+class SaveImageTests(TestCase):
+    def save_image(self, item, images, deleted_images):
+        data = {
+            "images": [{"id": image.id} for image in images],
+            "deleted_images": [image.id for image in deleted_images],
+        }
+        serializer = ItemPSerializer(context={"request": SimpleNamespace(data=data)})
+        serializer.save_image(item)
+
+    def test_images_are_attached_reordered_and_deleted(self):
+        item = create_item()
+        other = create_item()
+        first = Image.objects.create(item=item, index=1, file="first.jpg")
+        second = Image.objects.create(item=item, index=2, file="second.jpg")
+        upload = Image.objects.create(file="upload.jpg")
+        foreign = Image.objects.create(item=other, index=1, file="foreign.jpg")
+
+        self.save_image(item, [upload, foreign, second, first], [first, foreign])
+
+        self.assertEqual(
+            list(Image.objects.filter(item=item).values_list("id", "index")),
+            [(upload.id, 1), (second.id, 2)],
+        )
+        self.assertEqual(
+            Image.objects.values_list("item_id", "index").get(id=foreign.id),
+            (other.id, 1),
+        )
+        item.refresh_from_db()
+        self.assertEqual(item.primary_image.name, "upload.jpg")
+        self.assertEqual(item.image_count, 2)
+
+
+class SchemaTests(TestCase):
+    def setUp(self):
+        Attribute.objects.create(
+            slug="price", field_type=Attribute.FieldType.INTEGER, required=True
+        )
+        color = Attribute.objects.create(slug="color", field_type="option")
+        Option.objects.create(attribute=color, name="red", value="red")
+        Attribute.objects.create(slug="extras", field_type="multiple_checkbox")
+        Attribute.objects.create(slug="date", field_type="date")
+        self.schema = compile_schema(Attribute.objects.prefetch_related("option_set"))
+
+    def test_compile_schema(self):
+        self.assertEqual(self.schema["color"]["options"], frozenset(["red"]))
+        self.assertIsNone(self.schema["extras"]["options"])
+        self.assertEqual(self.schema["extras"]["default"], [])
+        self.assertTrue(self.schema["price"]["required"])
+
+    def test_get_error(self):
+        def get(slug, value):
+            return get_error(self.schema[slug], value)
+
+        self.assertIsNone(get("price", " 100 "))
+        self.assertIsNotNone(get("price", True))
+        self.assertIsNotNone(get("price", "1.5"))
+        self.assertIsNotNone(get("price", "1" * 20))
+        self.assertIsNone(get("color", "red"))
+        self.assertIsNotNone(get("color", "blue"))
+        self.assertIsNone(get("extras", ["any"]))
+        self.assertIsNotNone(get("extras", "any"))
+        self.assertIsNone(get("date", "2022-02-28"))
+        self.assertIsNotNone(get("date", "2022-02-30"))
+        self.assertIsNotNone(get("date", "tomorrow"))
+
+    def test_clean_attributes(self):
+        attributes = {"price": "", "no_price": True, "color": "red", "other": 1}
+        self.assertEqual(
+            clean_attributes(self.schema, attributes),
+            ({"price": "", "color": "red"}, {}),
+        )
+        cleaned, errors = clean_attributes(self.schema, {"color": "blue"})
+        self.assertEqual(cleaned, {})
+        self.assertEqual(set(errors), {"price", "color"})
@@ -0,0 +1,142 @@
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+
+from .models import Image, ImageUpload
+
+from PIL import Image as PILImage
+
+import os
+
+
+IMAGE_UPLOAD_TEMP_DIR = getattr(
+    settings, "IMAGE_UPLOAD_TEMP_DIR", os.path.join(settings.MEDIA_ROOT, "uploads")
+)
+IMAGE_UPLOAD_MAX_SIZE = getattr(settings, "IMAGE_UPLOAD_MAX_SIZE", 20 * 1024 * 1024)
+IMAGE_UPLOAD_CHUNK_SIZE = getattr(settings, "IMAGE_UPLOAD_CHUNK_SIZE", 1024 * 1024)
+IMAGE_UPLOAD_MAX_PIXELS = getattr(settings, "IMAGE_UPLOAD_MAX_PIXELS", 50000000)
+IMAGE_UPLOAD_FORMATS = {
+    "JPEG": "jpg",
+    "MPO": "jpg",
+    "PNG": "png",
+    "WEBP": "webp",
+    "GIF": "gif",
+}
+
+STREAM_BLOCK_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    pass
+
+
+def get_part_path(upload):
+    return os.path.join(IMAGE_UPLOAD_TEMP_DIR, "%s.part" % upload.id)
+
+
+def create_upload(user, filename, size):
+    if size <= 0 or size > IMAGE_UPLOAD_MAX_SIZE:
+        raise UploadError(
+            "画像のサイズは%sMB以下にしてください。" % (IMAGE_UPLOAD_MAX_SIZE // 1024 // 1024)
+        )
+    upload = ImageUpload.objects.create(user=user, filename=filename, size=size)
+    os.makedirs(IMAGE_UPLOAD_TEMP_DIR, exist_ok=True)
+    open(get_part_path(upload), "wb").close()
+    return upload
+
+
+def check_header(path):
+    """
+    Reads only the image header and rejects unsupported formats and images
+    with too many pixels before anything is decoded. Returns the detected
+    format, or None when the header has not been fully received yet.
+    """
+    try:
+        with PILImage.open(path) as image:
+            format = image.format
+            width, height = image.size
+    except (OSError, SyntaxError):
+        return None
+    except PILImage.DecompressionBombError:
+        raise UploadError("画像の解像度が大きすぎます。")
+    if format not in IMAGE_UPLOAD_FORMATS:
+        raise UploadError("対応していない画像形式です。")
+    if width * height > IMAGE_UPLOAD_MAX_PIXELS:
+        raise UploadError("画像の解像度が大きすぎます。")
+    return format
+
+
+def append_chunk(upload, offset, stream, length):
+    """
+    Streams a chunk of the request body to the part file at the given offset
+    and advances the upload. Only a chunk written at the current offset is
+    accepted, so a client resumes by asking for the offset and retrying.
+    """
+    if offset != upload.offset:
+        raise UploadError("オフセットが一致しません。")
+    if length <= 0 or length > IMAGE_UPLOAD_CHUNK_SIZE:
+        raise UploadError("チャンクのサイズが不正です。")
+    if offset + length > upload.size:
+        raise UploadError("画像のサイズが宣言と一致しません。")
+
+    path = get_part_path(upload)
+    received = 0
+    with open(path, "r+b") as part:
+        part.seek(offset)
+        while received < length:
+            block = stream.read(min(STREAM_BLOCK_SIZE, length - received))
+            if not block:
+                break
+            part.write(block)
+            received += len(block)
+    if received != length:
+        raise UploadError("チャンクを最後まで受信できませんでした。")
+
+    if offset == 0:
+        try:
+            if not check_header(path) and (
+                length == upload.size or length >= STREAM_BLOCK_SIZE
+            ):
+                raise UploadError("画像を読み込めませんでした。")
+        except UploadError:
+            delete_upload(upload)
+            raise
+    if not ImageUpload.objects.filter(id=upload.id, offset=offset).update(
+        offset=offset + length
+    ):
+        raise UploadError("オフセットが一致しません。")
+    upload.offset = offset + length
+    return upload
+
+
+def finalize_upload(upload):
+    """
+    Moves the completed part file into an Image and removes the upload.
+    """
+    if upload.offset != upload.size:
+        raise UploadError("アップロードが完了していません。")
+
+    path = get_part_path(upload)
+    format = check_header(path)
+    if not format:
+        raise UploadError("画像を読み込めませんでした。")
+
+    with transaction.atomic():
+        if not ImageUpload.objects.filter(id=upload.id).delete()[0]:
+            raise UploadError("アップロードが見つかりません。")
+        image = Image()
+        with open(path, "rb") as part:
+            # The extension comes from the detected format, never from the
+            # client's filename, so the file is served with an image type.
+            image.file.save(
+                "upload.%s" % IMAGE_UPLOAD_FORMATS[format], File(part), save=False
+            )
+        image.save()
+    os.remove(path)
+    return image
+
+
+def delete_upload(upload):
+    ImageUpload.objects.filter(id=upload.id).delete()
+    if os.path.exists(get_part_path(upload)):
+        os.remove(get_part_path(upload))
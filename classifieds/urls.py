@@ -17,5 +17,6 @@ urlpatterns = [
 router = DefaultRouter()
 router.register("categories", views.CategoryViewSet)
 router.register("items", views.ItemViewSet)
+router.register("image-uploads", views.ImageUploadViewSet)
 
 urlpatterns += router.urls
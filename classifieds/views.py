@@ -1,39 +1,76 @@
 from collections import OrderedDict
+from decimal import Decimal
 
-from django.conf import settings
-from django.core.mail import send_mail
+from django.core.serializers.json import DjangoJSONEncoder
 from django.contrib.sites.shortcuts import get_current_site
+from django.db import transaction
+from django.db.models import Q
 from django.http import JsonResponse
 from django.shortcuts import get_object_or_404, render
 from django.template.loader import render_to_string
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.utils.translation import ugettext_lazy as _
 
-from rest_framework import generics, viewsets, pagination, exceptions, status
+from rest_framework import (
+    exceptions,
+    generics,
+    mixins,
+    pagination,
+    status,
+    viewsets,
+)
 from rest_framework.decorators import action
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
+from .counters import add_pending_views, record_view
+from .documents import build_absolute_urls, get_document, schedule_documents
+from .facets import get_facets
 from .forms import ItemForm
-from .models import Attribute, Category, Item
+from .models import Category, ImageUpload, Item
+from .schemas import fill_default_attributes, get_default_attributes
 from .serializers import (
     CategorySerializer,
     CategoryLSerializer,
-    CategoryRFieldAttributeSerializer,
     CategoryRFilterAttributeSerializer,
     ImageSerializer,
+    ImageUploadSerializer,
     ItemLSerializer,
     ItemLPromotionSerializer,
     ItemRSerializer,
     ItemPSerializer,
 )
+from .snapshot import (
+    DEFAULT_SORTS,
+    get_categories,
+    get_category,
+    get_category_or_404,
+)
+from .uploads import (
+    UploadError,
+    append_chunk,
+    create_upload,
+    delete_upload,
+    finalize_upload,
+)
 
 from locations.serializers import LocationOptionSerializer
 
 from direct.models import Participant
 
+from outbox.mail import queue_mail
+
+from backend.cache import cache_result
+from backend.pagination import PageNumberPagination
+
 from pure_pagination import Paginator, EmptyPage, PageNotAnInteger
 
+import base64
+import datetime
+import json
+
 
 def search(request):
     try:
@@ -87,7 +124,7 @@ def api_upload(request):
     return JsonResponse(data, safe=False)
 
 
-class Pagination(pagination.PageNumberPagination):
+class Pagination(PageNumberPagination):
     page_size = 30
 
     def get_paginated_response(self, data):
@@ -95,6 +132,7 @@ class Pagination(pagination.PageNumberPagination):
             OrderedDict(
                 [
                     ("count", self.page.paginator.count),
+                    ("count_type", self.get_count_type()),
                     ("next", self.get_next_link()),
                     ("previous", self.get_previous_link()),
                     ("results", data),
@@ -104,6 +142,170 @@ class Pagination(pagination.PageNumberPagination):
         )
 
 
+ITEM_QUERY_PARAMS = (
+    "category_id",
+    "location_id",
+    "keyword",
+    "min_deposit",
+    "max_deposit",
+    "min_rent",
+    "max_rent",
+    "min_price",
+    "max_price",
+    "near",
+    "radius_km",
+    "sort",
+)
+
+
+def get_item_result_tags(query_params):
+    tags = []
+    if query_params.get("category_id"):
+        tags.append("category:%s" % query_params["category_id"])
+    if query_params.get("location_id"):
+        tags.append("location:%s" % query_params["location_id"])
+    if not tags:
+        tags.append("items")
+    if query_params.get("near"):
+        tags.append("locations")
+    return tags
+
+
+def get_facet_result_tags(query_params):
+    # The category counts ignore the category filter and the location counts
+    # the location filter, so a change to any item can move them.
+    tags = ["items"]
+    if query_params.get("near"):
+        tags.append("locations")
+    return tags
+
+
+class KeysetPagination(pagination.BasePagination):
+    page_size = 30
+    cursor_query_param = "cursor"
+    datetime_fields = ("created_at", "updated_at")
+    invalid_cursor_message = _("Invalid cursor")
+
+    def get_ordering(self, queryset):
+        ordering = list(queryset.query.order_by or queryset.model._meta.ordering)
+        if "id" not in ordering and "-id" not in ordering:
+            ordering.append("-id" if ordering[0].startswith("-") else "id")
+        return ordering
+
+    def encode_cursor(self, values):
+        # DjangoJSONEncoder drops the microseconds of datetimes, which would
+        # make the cursor fall between rows, so they are encoded in full.
+        values = [
+            value.isoformat() if isinstance(value, datetime.datetime) else value
+            for value in values
+        ]
+        data = json.dumps(values, cls=DjangoJSONEncoder)
+        return base64.urlsafe_b64encode(data.encode()).decode()
+
+    def decode_cursor(self, cursor, ordering):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            if not isinstance(values, list) or len(values) != len(ordering):
+                raise ValueError()
+            for i, field in enumerate(ordering):
+                field = field.lstrip("-")
+                if values[i] is None:
+                    continue
+                if field in self.datetime_fields:
+                    values[i] = parse_datetime(values[i])
+                elif isinstance(values[i], str):
+                    values[i] = Decimal(values[i])
+        except (TypeError, ValueError, ArithmeticError):
+            raise exceptions.NotFound(self.invalid_cursor_message)
+        return values
+
+    def get_after_query(self, field, value):
+        # NULL sorts before any value.
+        if field.startswith("-"):
+            field = field[1:]
+            if value is None:
+                return Q(pk__in=[])
+            return Q(**{"%s__lt" % field: value}) | Q(**{"%s__isnull" % field: True})
+        if value is None:
+            return Q(**{"%s__isnull" % field: False})
+        return Q(**{"%s__gt" % field: value})
+
+    def get_equal_query(self, field, value):
+        field = field.lstrip("-")
+        if value is None:
+            return Q(**{"%s__isnull" % field: True})
+        return Q(**{field: value})
+
+    def filter_after(self, queryset, ordering, values):
+        query = Q()
+        for i, field in enumerate(ordering):
+            condition = self.get_after_query(field, values[i])
+            for j in range(i):
+                condition &= self.get_equal_query(ordering[j], values[j])
+            query |= condition
+        return queryset.filter(query)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        ordering = self.get_ordering(queryset)
+        queryset = queryset.order_by(*ordering)
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            queryset = self.filter_after(
+                queryset, ordering, self.decode_cursor(cursor, ordering)
+            )
+
+        results = list(queryset[: self.page_size + 1])
+        self.has_next = len(results) > self.page_size
+        results = results[: self.page_size]
+
+        self.next_cursor = None
+        if self.has_next:
+            last = results[-1]
+            self.next_cursor = self.encode_cursor(
+                [getattr(last, field.lstrip("-")) for field in ordering]
+            )
+        return results
+
+    def get_next_link(self):
+        if not self.next_cursor:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response(
+            OrderedDict(
+                [
+                    ("next", self.get_next_link()),
+                    ("results", data),
+                ]
+            )
+        )
+
+
+class ItemPagination(Pagination):
+    """
+    Page number pagination, or keyset pagination when the request has a
+    `cursor` parameter (an empty one for the first page).
+    """
+
+    keyset_pagination_class = KeysetPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if KeysetPagination.cursor_query_param in request.query_params:
+            self.keyset = self.keyset_pagination_class()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        self.keyset = None
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
 class CategoryViewSet(viewsets.ModelViewSet):
     queryset = Category.objects.all()
     permission_classes = [
@@ -117,89 +319,62 @@ class CategoryViewSet(viewsets.ModelViewSet):
             return CategoryRFilterAttributeSerializer
         return CategoryLSerializer
 
-    def get_queryset(self):
-        if self.action == "list":
-            level = self.request.query_params.get("level", 1)
-            return self.queryset.prefetch_related("children").filter(level=level)
-        elif self.action == "root":
-            return self.queryset
-        elif self.action == "retrieve":
-            return self.queryset.select_related("parent").prefetch_related("children")
-        return self.queryset
+    def list(self, request, *args, **kwargs):
+        level = str(self.request.query_params.get("level", 1))
+        if not level.isdigit():
+            return Response([])
+        return Response(
+            [category["list_data"] for category in get_categories(int(level))]
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return Response(get_category_or_404(self.kwargs["pk"])["filter_data"])
 
     @action(["get"], detail=False)
     def root(self, request, *args, **kwargs):
-        queryset = self.queryset.filter(level=1)
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        return Response([category["data"] for category in get_categories(1)])
 
+    # Served from the category snapshot without queries, so unlike the item
+    # endpoints it isn't wrapped in cache_result.
     @action(["get"], detail=False)
     def set(self, request, *args, **kwargs):
         data = {
             "selected": None,
             "l1_value": "",
             "l2_value": "",
-            "l1_options": [],
+            "l1_options": [category["data"] for category in get_categories(1)],
             "l2_options": [],
-            "sorts": [],
+            "sorts": DEFAULT_SORTS,
         }
         selected_id = self.request.query_params.get("selected_id", None)
-        categories = Category.objects.select_related("parent").prefetch_related(
-            "children"
-        )
-
-        sorts = [
-            {"value": "", "name": "新しい順"},
-            {"value": "recommended", "name": "おすすめ順"},
-        ]
-
-        l1_categories = categories.filter(level=1)
-        data["l1_options"] = CategorySerializer(l1_categories, many=True).data
 
         if selected_id:
-            selected_category = get_object_or_404(
-                categories.prefetch_related("filter_attributes"), id=selected_id
-            )
-
-            for attribute in selected_category.filter_attributes.all():
-                if attribute.filter_type == Attribute.FilterType.RANGE_INPUT:
-                    sorts.append(
-                        {
-                            "value": "%s_asc" % attribute.slug,
-                            "name": "%sが低い順" % attribute.name,
-                        }
-                    )
-                    sorts.append(
-                        {
-                            "value": "%s_desc" % attribute.slug,
-                            "name": "%sが高い順" % attribute.name,
-                        }
-                    )
+            selected = get_category_or_404(selected_id)
+            selected_category = selected["category"]
+            data["sorts"] = selected["sorts"]
 
             if selected_category.level == 1:
                 l2_categories = selected_category.children.all()
-                data["selected"] = CategoryRFilterAttributeSerializer(
-                    selected_category
-                ).data
+                data["selected"] = selected["filter_data"]
                 data["l1_value"] = int(selected_id)
-                data["l2_options"] = CategorySerializer(l2_categories, many=True).data
             elif selected_category.level == 2:
-                l2_categories = selected_category.parent.children.all()
-                data["selected"] = CategoryRFilterAttributeSerializer(
-                    selected_category
-                ).data
+                parent = get_category(selected_category.parent_id)["category"]
+                l2_categories = parent.children.all()
+                data["selected"] = selected["filter_data"]
                 data["l1_value"] = selected_category.parent_id
                 data["l2_value"] = int(selected_id)
-                data["l2_options"] = CategorySerializer(l2_categories, many=True).data
-
-        data["sorts"] = sorts
+            else:
+                l2_categories = []
+            data["l2_options"] = [
+                get_category(category.id)["data"] for category in l2_categories
+            ]
 
         return Response(data)
 
 
 class ItemViewSet(viewsets.ModelViewSet):
     queryset = Item.objects.all()
-    pagination_class = Pagination
+    pagination_class = ItemPagination
 
     def get_permissions(self):
         if self.action == "list":
@@ -218,19 +393,22 @@ class ItemViewSet(viewsets.ModelViewSet):
             self.permission_classes = [
                 AllowAny,
             ]
+        elif self.action == "facets":
+            self.permission_classes = [
+                AllowAny,
+            ]
         return super().get_permissions()
 
     def get_queryset(self):
         if self.action == "list":
             return (
                 self.queryset.select_related("category", "location")
-                .prefetch_related("image_set", "promotion_set")
                 .filter_by_query(self.request.query_params)
                 .filter_by_unfixed()
             )
         elif self.action == "fixed":
             return (
-                self.queryset.prefetch_related("promotion_set__type")
+                self.queryset.select_related("category", "location")
                 .filter_by_query(self.request.query_params)
                 .filter_by_fixed()
             )
@@ -246,12 +424,9 @@ class ItemViewSet(viewsets.ModelViewSet):
             return self.queryset.select_related("category", "location")
         elif self.action == "form_data":
             return self.queryset.select_related(
-                "category",
                 "location__parent",
                 "author",
             ).prefetch_related(
-                "category__field_attributes__option_set",
-                "category__promotions__option_set",
                 "promotion_set__type",
             )
         return self.queryset
@@ -273,23 +448,49 @@ class ItemViewSet(viewsets.ModelViewSet):
             return ItemPSerializer
         return ItemLSerializer
 
+    @cache_result(
+        "items",
+        ITEM_QUERY_PARAMS + ("page", "cursor", "count"),
+        get_item_result_tags,
+    )
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    def get_visible_item(self):
+        """
+        Runs the lookup and permission checks of get_object() against a bare
+        queryset, so that a stored document is only served for an item the
+        request could retrieve.
+        """
+        lookup = str(self.kwargs[self.lookup_url_kwarg or self.lookup_field])
+        if not lookup.isdigit():
+            raise exceptions.NotFound()
+        queryset = self.filter_queryset(Item.objects.only("id", "author_id"))
+        item = get_object_or_404(queryset, pk=lookup)
+        self.check_object_permissions(self.request, item)
+        return item
+
     def retrieve(self, request, *args, **kwargs):
-        instance = self.get_object()
-        instance.views += 1
-        instance.save()
-        serializer = self.get_serializer(instance)
-        return Response(serializer.data)
+        data = get_document(self.get_visible_item().id)
+        if data is None:
+            instance = self.get_object()
+            schedule_documents([instance.id])
+            data = self.get_serializer(instance).data
+            data["views"] = add_pending_views(instance)
+        record_view(data["id"])
+        return Response(build_absolute_urls(data, request))
 
     def perform_create(self, serializer):
-        item = serializer.save()
-        context = {
-            "item": item,
-            "protocol": self.request.scheme,
-            "domain": get_current_site(self.request).domain,
-        }
-        subject = "投稿が完了しました"
-        message = render_to_string("email/post_completed_message.txt", context)
-        send_mail(subject, message, settings.DEFAULT_FROM_EMAIL, [item.author.email])
+        with transaction.atomic():
+            item = serializer.save()
+            context = {
+                "item": item,
+                "protocol": self.request.scheme,
+                "domain": get_current_site(self.request).domain,
+            }
+            subject = "投稿が完了しました"
+            message = render_to_string("email/post_completed_message.txt", context)
+            queue_mail(subject, message, [item.author.email])
 
     def perform_update(self, serializer):
         serializer.save(updated_at=timezone.now())
@@ -298,28 +499,28 @@ class ItemViewSet(viewsets.ModelViewSet):
     def renew(self, request, *args, **kwargs):
         instance = self.get_object()
         instance.updated_at = timezone.now()
-        instance.save()
+        instance.save(update_fields=["updated_at"])
         return Response(status=status.HTTP_200_OK)
 
     @action(["get"], detail=False)
+    @cache_result("fixed-items", ITEM_QUERY_PARAMS, get_item_result_tags)
     def fixed(self, request, *args, **kwargs):
         queryset = self.get_queryset()
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
 
+    @action(["get"], detail=False)
+    @cache_result("facets", ITEM_QUERY_PARAMS, get_facet_result_tags)
+    def facets(self, request, *args, **kwargs):
+        return Response(get_facets(self.request.query_params))
+
     @action(["get"], detail=True)
     def related(self, request, *args, **kwargs):
         instance = self.get_object()
-        queryset = (
-            Item.objects.select_related(
-                "category",
-                "location",
-            )
-            .prefetch_related(
-                "image_set",
-            )
-            .filter_by_related(instance)
-        )
+        queryset = Item.objects.select_related(
+            "category",
+            "location",
+        ).filter_by_related(instance)
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
 
@@ -337,16 +538,6 @@ class ItemViewSet(viewsets.ModelViewSet):
             participant_id = participant.id
         return Response(participant_id)
 
-    def add_default_value_to_attribute(self, data, attribute):
-        if attribute.slug == "rent_type":
-            data["attributes"][attribute.slug] = 1
-        elif attribute.field_type == Attribute.FieldType.BOOLEAN:
-            data["attributes"][attribute.slug] = False
-        elif attribute.field_type == Attribute.FieldType.MULTIPLE_CHECKBOX:
-            data["attributes"][attribute.slug] = []
-        else:
-            data["attributes"][attribute.slug] = ""
-
     def add_default_value_to_promotions(self, data, promotions):
         data["promotions"] = {"types": {}, "options": {}}
         for promotion in promotions:
@@ -359,26 +550,20 @@ class ItemViewSet(viewsets.ModelViewSet):
     def empty_form_data(self, request, *args, **kwargs):
         data = self.get_serializer().data
 
+        promotions = []
         category_id = self.request.query_params.get("category_id")
         if category_id:
-            category = get_object_or_404(
-                Category.objects.select_related("parent").prefetch_related(
-                    "field_attributes__option_set", "promotions__option_set"
-                ),
-                id=category_id,
-            )
+            category = get_category_or_404(category_id)
 
             data["category"] = category_id
-            data["category_object"] = CategoryRFieldAttributeSerializer(category).data
-            data["attributes"] = {}
-
-            for attribute in category.field_attributes.all():
-                self.add_default_value_to_attribute(data, attribute)
+            data["category_object"] = category["field_data"]
+            data["attributes"] = get_default_attributes(category["schema"])
+            promotions = category["promotions"]
 
         data["location"] = None
 
         data["active_promotions"] = {}
-        self.add_default_value_to_promotions(data, category.promotions.all())
+        self.add_default_value_to_promotions(data, promotions)
         return Response(data)
 
     @action(["get"], detail=True, url_path="form-data")
@@ -388,6 +573,7 @@ class ItemViewSet(viewsets.ModelViewSet):
         if instance.author != self.request.user:
             raise exceptions.PermissionDenied()
 
+        category = get_category_or_404(instance.category_id)
         data = self.get_serializer(instance).data
 
         for key in data:
@@ -395,20 +581,16 @@ class ItemViewSet(viewsets.ModelViewSet):
                 if not data[key]:
                     data[key] = ""
 
-        for attribute in instance.category.field_attributes.all():
-            if attribute.slug not in instance.attributes.keys():
-                self.add_default_value_to_attribute(data, attribute)
-            else:
-                if attribute.field_type == Attribute.FieldType.DECIMAL:
-                    if not data["attributes"][attribute.slug]:
-                        data["attributes"][attribute.slug] = ""
+        data["attributes"] = fill_default_attributes(
+            category["schema"], dict(instance.attributes or {})
+        )
 
         data["location"] = LocationOptionSerializer(instance.location).data
 
         data["active_promotions"] = {}
         for promotion in instance.promotion_set.all():
             data["active_promotions"][promotion.type.slug] = promotion.disabled_at
-        self.add_default_value_to_promotions(data, instance.category.promotions.all())
+        self.add_default_value_to_promotions(data, category["promotions"])
         return Response(data)
 
 
@@ -417,3 +599,71 @@ class ImageCreateView(generics.CreateAPIView):
     permission_classes = [
         IsAuthenticated,
     ]
+
+
+class ImageUploadViewSet(
+    mixins.CreateModelMixin,
+    mixins.RetrieveModelMixin,
+    mixins.DestroyModelMixin,
+    viewsets.GenericViewSet,
+):
+    """
+    Resumable image uploads: create an upload with the filename and size,
+    PUT the raw bytes in chunks to chunk/?offset=N, and finalize it into an
+    Image. A client that lost a chunk reads the upload to get its offset.
+    """
+
+    queryset = ImageUpload.objects.all()
+    serializer_class = ImageUploadSerializer
+    permission_classes = [
+        IsAuthenticated,
+    ]
+
+    def get_queryset(self):
+        return self.queryset.filter(user=self.request.user)
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            upload = create_upload(
+                self.request.user,
+                serializer.validated_data["filename"],
+                serializer.validated_data["size"],
+            )
+        except UploadError as e:
+            raise exceptions.ValidationError({"non_field_errors": [str(e)]})
+        return Response(
+            self.get_serializer(upload).data, status=status.HTTP_201_CREATED
+        )
+
+    def perform_destroy(self, instance):
+        delete_upload(instance)
+
+    @action(["put"], detail=True, parser_classes=[])
+    def chunk(self, request, *args, **kwargs):
+        upload = self.get_object()
+        offset = request.query_params.get("offset", "")
+        if not offset.isdigit():
+            raise exceptions.ValidationError({"offset": ["オフセットが不正です。"]})
+        try:
+            length = int(request.META.get("CONTENT_LENGTH") or 0)
+        except ValueError:
+            length = 0
+        try:
+            append_chunk(upload, int(offset), request.stream, length)
+        except UploadError as e:
+            raise exceptions.ValidationError({"non_field_errors": [str(e)]})
+        return Response(self.get_serializer(upload).data)
+
+    @action(["post"], detail=True)
+    def finalize(self, request, *args, **kwargs):
+        upload = self.get_object()
+        try:
+            image = finalize_upload(upload)
+        except UploadError as e:
+            raise exceptions.ValidationError({"non_field_errors": [str(e)]})
+        return Response(
+            ImageSerializer(image, context=self.get_serializer_context()).data,
+            status=status.HTTP_201_CREATED,
+        )
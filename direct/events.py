@@ -0,0 +1,82 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+
+DIRECT_EVENT_TIMEOUT = getattr(settings, "DIRECT_EVENT_TIMEOUT", 60 * 10)
+DIRECT_EVENT_POLL_INTERVAL = getattr(settings, "DIRECT_EVENT_POLL_INTERVAL", 1)
+DIRECT_LONG_POLL_TIMEOUT = getattr(settings, "DIRECT_LONG_POLL_TIMEOUT", 25)
+DIRECT_SHORT_POLL_INTERVAL = getattr(settings, "DIRECT_SHORT_POLL_INTERVAL", 10)
+MAX_EVENTS = 100
+
+# Streams in this process are woken as soon as an event is published here;
+# events published by other processes are picked up by polling the sequence
+# in the cache every DIRECT_EVENT_POLL_INTERVAL seconds. The log itself lives
+# in the default cache, which the backend.E001 check requires to be shared by
+# all processes.
+listeners = defaultdict(set)
+
+
+def get_sequence_key(user_id):
+    return "direct-events:%s:sequence" % user_id
+
+
+def get_event_key(user_id, sequence):
+    return "direct-events:%s:%s" % (user_id, sequence)
+
+
+def get_sequence(user_id):
+    return cache.get(get_sequence_key(user_id), 0)
+
+
+def get_sequences(user_ids):
+    keys = {get_sequence_key(user_id): user_id for user_id in user_ids}
+    sequences = cache.get_many(list(keys))
+    return {user_id: sequences.get(key, 0) for key, user_id in keys.items()}
+
+
+def publish(user_id, event):
+    """
+    Appends the event to the user's log in the cache under the next sequence
+    number and wakes the streams of this process.
+    """
+    key = get_sequence_key(user_id)
+    cache.add(key, 0, None)
+    sequence = cache.incr(key)
+    cache.set(
+        get_event_key(user_id, sequence),
+        dict(event, sequence=sequence),
+        DIRECT_EVENT_TIMEOUT,
+    )
+
+    for callback in list(listeners.get(user_id, ())):
+        callback()
+    return sequence
+
+
+def publish_on_commit(user_id, event):
+    if user_id:
+        transaction.on_commit(lambda: publish(user_id, event))
+
+
+def get_events(user_id, since):
+    """
+    Returns (sequence, events) with the user's events after the since
+    sequence, or none when since is None. When some of them are gone
+    (expired, evicted or the log was reset) a single "reset" event tells the
+    client to reload instead.
+    """
+    sequence = get_sequence(user_id)
+    if since is None or since == sequence:
+        return sequence, []
+
+    reset = [{"type": "reset", "sequence": sequence}]
+    if since > sequence or sequence - since > MAX_EVENTS:
+        return sequence, reset
+    keys = [get_event_key(user_id, number) for number in range(since + 1, sequence + 1)]
+    events = cache.get_many(keys)
+    if len(events) < len(keys):
+        return sequence, reset
+    return sequence, [events[key] for key in keys]
@@ -0,0 +1,45 @@
+# Generated by Django 3.2.7 on 2026-10-18 11:12
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def create_unread_counters(apps, schema_editor):
+    User = apps.get_model("authentication", "User")
+    Participant = apps.get_model("direct", "Participant")
+    UnreadCounter = apps.get_model("direct", "UnreadCounter")
+
+    counters = []
+    for user in User.objects.filter(
+        id__in=Participant.objects.values("user_id")
+    ).only("direct_confirmed_at"):
+        count = (
+            Participant.objects.filter(user=user)
+            .filter(is_deleted=False)
+            .filter(is_read=False)
+            .filter(updated_at__gt=user.direct_confirmed_at)
+            .count()
+        )
+        counters.append(UnreadCounter(user=user, count=count))
+    UnreadCounter.objects.bulk_create(counters, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('direct', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UnreadCounter',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='unread_counter', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('sequence', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_unread_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.7 on 2026-10-18 11:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('direct', '0002_unreadcounter'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='response',
+            index=models.Index(fields=['thread', 'created_at', 'id'], name='direct_resp_thread__c8945e_idx'),
+        ),
+    ]
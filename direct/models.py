@@ -29,6 +29,7 @@ class Response(models.Model):
 
     class Meta:
         ordering = ["created_at"]
+        indexes = [models.Index(fields=["thread", "created_at", "id"])]
 
 
 class Participant(models.Model):
@@ -54,3 +55,14 @@ class Participant(models.Model):
 
     def __str__(self):
         return self.user.username
+
+
+class UnreadCounter(models.Model):
+    user = models.OneToOneField(
+        "authentication.User",
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="unread_counter",
+    )
+    count = models.PositiveIntegerField(default=0)
+    sequence = models.PositiveIntegerField(default=0)
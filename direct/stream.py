@@ -0,0 +1,239 @@
+from collections import defaultdict
+from types import SimpleNamespace
+from urllib.parse import parse_qs
+
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections
+from django.http.cookie import parse_cookie
+
+from asgiref.sync import sync_to_async
+
+from .events import (
+    DIRECT_EVENT_POLL_INTERVAL,
+    DIRECT_LONG_POLL_TIMEOUT,
+    get_events,
+    get_sequence,
+    get_sequences,
+    listeners,
+)
+
+from importlib import import_module
+
+import asyncio
+import json
+import time
+
+
+DIRECT_EVENTS_PATH = getattr(settings, "DIRECT_EVENTS_PATH", "/api/v1/direct/events/")
+HEARTBEAT_INTERVAL = 15
+
+
+class Hub:
+    """
+    Wakes the streams of this process: immediately for events published in
+    this process, and otherwise when one shared poll of the sequences of
+    every connected user sees a user's sequence move.
+    """
+
+    def __init__(self):
+        self.subscribers = defaultdict(set)
+        self.callbacks = {}
+        self.sequences = {}
+        self.task = None
+
+    def wake(self, user_id):
+        for event in self.subscribers.get(user_id, ()):
+            event.set()
+
+    def subscribe(self, user_id, event):
+        if user_id not in self.subscribers:
+            loop = asyncio.get_running_loop()
+            self.callbacks[user_id] = self.get_callback(loop, user_id)
+            listeners[user_id].add(self.callbacks[user_id])
+        self.subscribers[user_id].add(event)
+        if self.task is None:
+            self.task = asyncio.ensure_future(self.poll())
+
+    def unsubscribe(self, user_id, event):
+        self.subscribers[user_id].discard(event)
+        if not self.subscribers[user_id]:
+            del self.subscribers[user_id]
+            self.sequences.pop(user_id, None)
+            listeners[user_id].discard(self.callbacks.pop(user_id))
+            if not listeners[user_id]:
+                del listeners[user_id]
+
+    def get_callback(self, loop, user_id):
+        return lambda: loop.call_soon_threadsafe(self.wake, user_id)
+
+    async def poll(self):
+        try:
+            while self.subscribers:
+                sequences = await run_sync(get_sequences, list(self.subscribers))
+                for user_id, sequence in sequences.items():
+                    if self.sequences.get(user_id, sequence) != sequence:
+                        self.wake(user_id)
+                    self.sequences[user_id] = sequence
+                await asyncio.sleep(DIRECT_EVENT_POLL_INTERVAL)
+        finally:
+            self.task = None
+
+
+hub = Hub()
+
+
+async def run_sync(func, *args):
+    def call():
+        try:
+            return func(*args)
+        finally:
+            close_old_connections()
+
+    return await sync_to_async(call)()
+
+
+def get_user_id(cookies):
+    engine = import_module(settings.SESSION_ENGINE)
+    session = engine.SessionStore(cookies.get(settings.SESSION_COOKIE_NAME))
+    user = get_user(SimpleNamespace(session=session))
+    return user.id if user.is_authenticated else None
+
+
+def get_cors_headers(headers):
+    origin = headers.get(b"origin", b"").decode("latin-1")
+    if origin not in settings.CORS_ALLOWED_ORIGINS:
+        return []
+    return [
+        (b"access-control-allow-origin", origin.encode("latin-1")),
+        (b"access-control-allow-credentials", b"true"),
+        (b"vary", b"Origin"),
+    ]
+
+
+def get_since(headers, query):
+    since = headers.get(b"last-event-id", b"").decode("latin-1")
+    since = since or query.get("since", [""])[0]
+    return int(since) if since.isdigit() else None
+
+
+async def next_events(user_id, since, wake, disconnected, timeout):
+    deadline = time.monotonic() + timeout
+    while True:
+        wake.clear()
+        sequence, events = await run_sync(get_events, user_id, since)
+        remaining = deadline - time.monotonic()
+        if events or remaining <= 0 or disconnected.is_set():
+            return sequence, events
+        try:
+            await asyncio.wait_for(wake.wait(), remaining)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def send_json(send, status, data, headers):
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"application/json")] + headers,
+        }
+    )
+    await send(
+        {
+            "type": "http.response.body",
+            "body": json.dumps(data, cls=DjangoJSONEncoder).encode(),
+        }
+    )
+
+
+def format_event(event):
+    return (
+        "id: %s\nevent: %s\ndata: %s\n\n"
+        % (
+            event["sequence"],
+            event["type"],
+            json.dumps(event, cls=DjangoJSONEncoder, ensure_ascii=False),
+        )
+    ).encode()
+
+
+async def stream(send, user_id, since, wake, disconnected, headers):
+    await send(
+        {
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"text/event-stream"),
+                (b"cache-control", b"no-cache"),
+                (b"x-accel-buffering", b"no"),
+            ]
+            + headers,
+        }
+    )
+    if since is None:
+        since = await run_sync(get_sequence, user_id)
+        events = [{"type": "ready", "sequence": since}]
+    else:
+        since, events = await run_sync(get_events, user_id, since)
+
+    while not disconnected.is_set():
+        body = b"".join(format_event(event) for event in events)
+        await send(
+            {
+                "type": "http.response.body",
+                "body": body or b": heartbeat\n\n",
+                "more_body": True,
+            }
+        )
+        since, events = await next_events(
+            user_id, since, wake, disconnected, HEARTBEAT_INTERVAL
+        )
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def application(scope, receive, send):
+    """
+    Streams the direct message events of the signed-in user as server-sent
+    events, resuming after the Last-Event-ID (or ?since=) sequence. With
+    ?transport=poll it long-polls instead and returns the events as JSON.
+    """
+    headers = dict(scope["headers"])
+    query = parse_qs(scope["query_string"].decode("latin-1"))
+    cors_headers = get_cors_headers(headers)
+
+    cookies = parse_cookie(headers.get(b"cookie", b"").decode("latin-1"))
+    user_id = await run_sync(get_user_id, cookies)
+    if user_id is None:
+        await send_json(send, 403, {"detail": "認証が必要です。"}, cors_headers)
+        return
+
+    since = get_since(headers, query)
+    wake = asyncio.Event()
+    disconnected = asyncio.Event()
+
+    async def watch():
+        while (await receive())["type"] != "http.disconnect":
+            pass
+        disconnected.set()
+        wake.set()
+
+    watcher = asyncio.ensure_future(watch())
+    hub.subscribe(user_id, wake)
+    try:
+        if query.get("transport", [""])[0] == "poll":
+            if since is None:
+                sequence, events = await run_sync(get_sequence, user_id), []
+            else:
+                sequence, events = await next_events(
+                    user_id, since, wake, disconnected, DIRECT_LONG_POLL_TIMEOUT
+                )
+            await send_json(
+                send, 200, {"sequence": sequence, "events": events}, cors_headers
+            )
+        else:
+            await stream(send, user_id, since, wake, disconnected, cors_headers)
+    finally:
+        hub.unsubscribe(user_id, wake)
+        watcher.cancel()
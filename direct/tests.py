@@ -1,3 +1,245 @@
-from django.test import TestCase
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from .events import (
+    MAX_EVENTS,
+    get_event_key,
+    get_events,
+    get_sequence_key,
+    publish,
+    publish_on_commit,
+)
+from .models import Participant, Response as DirectResponse, Thread
+from .unread import get_unread
+from .views import ParticipantViewSet, ResponsePagination, ResponseViewSet
+
+from authentication.views import UserViewSet
+from classifieds.models import Category, Item
+from locations.models import Location
+
+User = get_user_model()
+
+
+def create_user():
+    return User.objects.create_user("user%s@example.com" % User.objects.count(), "user")
+
+
+class EventTests(TestCase):
+    def setUp(self):
+        self.user = create_user()
+        cache.delete(get_sequence_key(self.user.id))
+
+    def test_events_after_since(self):
+        self.assertEqual(get_events(self.user.id, None), (0, []))
+        publish(self.user.id, {"type": "a"})
+        publish(self.user.id, {"type": "b"})
+        sequence, events = get_events(self.user.id, 0)
+        self.assertEqual(sequence, 2)
+        self.assertEqual([e["type"] for e in events], ["a", "b"])
+        self.assertEqual(get_events(self.user.id, 1)[1], [{"type": "b", "sequence": 2}])
+        self.assertEqual(get_events(self.user.id, 2), (2, []))
+
+    def test_reset_when_events_are_gone(self):
+        publish(self.user.id, {"type": "a"})
+        publish(self.user.id, {"type": "b"})
+        cache.delete(get_event_key(self.user.id, 1))
+        self.assertEqual(
+            get_events(self.user.id, 0), (2, [{"type": "reset", "sequence": 2}])
+        )
+        self.assertEqual(get_events(self.user.id, 5)[1][0]["type"], "reset")
+        for i in range(MAX_EVENTS + 1):
+            publish(self.user.id, {"type": "c"})
+        self.assertEqual(get_events(self.user.id, 2)[1][0]["type"], "reset")
+
+    def test_publish_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            publish_on_commit(self.user.id, {"type": "a"})
+            publish_on_commit(None, {"type": "b"})
+            self.assertEqual(get_events(self.user.id, 0), (0, []))
+        self.assertEqual(get_events(self.user.id, 0)[0], 1)
+
+    @override_settings(
+        CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+    )
+    def test_publish_does_not_fail_the_write_on_a_local_cache(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            publish_on_commit(self.user.id, {"type": "a"})
+
+    def test_events_endpoint(self):
+        publish(self.user.id, {"type": "a"})
+        request = APIRequestFactory().get("/", {"since": "0"})
+        force_authenticate(request, self.user)
+        response = ParticipantViewSet.as_view({"get": "events"})(request)
+        self.assertEqual(response.data["sequence"], 1)
+        self.assertEqual(response.data["events"], [{"type": "a", "sequence": 1}])
+        self.assertIn("Retry-After", response)
+
+
+class UnreadTests(TestCase):
+    def setUp(self):
+        self.author = create_user()
+        self.buyer = create_user()
+        self.item = Item.objects.create(
+            author=self.author,
+            category=Category.objects.create(name="category"),
+            location=Location.objects.create(name="location"),
+            title="title",
+            description="description",
+            attributes={},
+        )
+
+    def call(self, viewset, actions, user, method="get", data=None, **kwargs):
+        request = getattr(APIRequestFactory(), method)("/", data or {}, format="json")
+        force_authenticate(request, user)
+        return viewset.as_view(actions)(request, **kwargs)
+
+    def count(self, user):
+        user.refresh_from_db()
+        return Participant.objects.filter(
+            user=user,
+            is_deleted=False,
+            is_read=False,
+            updated_at__gt=user.direct_confirmed_at,
+        ).count()
+
+    def assert_unread(self, user, count):
+        self.assertEqual(self.count(user), count)
+        self.assertEqual(get_unread(user)[0], count)
+
+    def contact(self):
+        self.call(
+            ParticipantViewSet,
+            {"post": "create"},
+            self.buyer,
+            "post",
+            {"item_id": self.item.id, "receiver_id": self.author.id, "content": "hi"},
+        )
+        return Participant.objects.get(user=self.author)
+
+    def reply(self, sender, receiver, participant):
+        self.call(
+            ResponseViewSet,
+            {"post": "create"},
+            sender,
+            "post",
+            {
+                "thread_id": participant.thread_id,
+                "receiver_id": receiver.id,
+                "content": "reply",
+            },
+        )
+
+    def test_counter_follows_thread_changes(self):
+        participant = self.contact()
+        self.assert_unread(self.author, 1)
+        self.assert_unread(self.buyer, 0)
+
+        self.reply(self.buyer, self.author, participant)
+        self.assert_unread(self.author, 1)
+
+        self.call(
+            ParticipantViewSet, {"get": "retrieve"}, self.author, pk=participant.id
+        )
+        self.call(
+            ParticipantViewSet, {"get": "retrieve"}, self.author, pk=participant.id
+        )
+        self.assert_unread(self.author, 0)
+
+        self.reply(self.author, self.buyer, participant)
+        self.assert_unread(self.buyer, 1)
+        self.assert_unread(self.author, 0)
+
+        buyer_participant = Participant.objects.get(user=self.buyer)
+        self.call(
+            ParticipantViewSet,
+            {"post": "mark_delete"},
+            self.buyer,
+            "post",
+            pk=buyer_participant.id,
+        )
+        self.assert_unread(self.buyer, 0)
+
+    def test_confirm_resets_the_counter(self):
+        self.contact()
+        sequence = get_unread(self.author)[1]
+        self.call(UserViewSet, {"post": "confirm_direct"}, self.author, "post")
+        self.assert_unread(self.author, 0)
+        self.assertEqual(get_unread(self.author)[1], sequence + 1)
+
+    def test_unconfirmed(self):
+        view = {"get": "unconfirmed"}
+        with self.assertNumQueries(1):
+            response = self.call(ParticipantViewSet, view, self.author)
+        self.assertEqual(response.data, [])
+        participant = self.contact()
+        response = self.call(ParticipantViewSet, view, self.author)
+        self.assertEqual(response.data, [participant.id])
+
+        request = APIRequestFactory().get("/", HTTP_IF_NONE_MATCH=response["ETag"])
+        force_authenticate(request, self.author)
+        with self.assertNumQueries(1):
+            response = ParticipantViewSet.as_view(view)(request)
+        self.assertEqual(response.status_code, 304)
+
+
+class ResponsePaginationTests(TestCase):
+    def setUp(self):
+        self.user = create_user()
+        thread = Thread.objects.create()
+        now = timezone.now()
+        self.participant = Participant.objects.create(
+            thread=thread, user=self.user, deleted_at=now - timedelta(days=1)
+        )
+        self.responses = [
+            DirectResponse.objects.create(
+                thread=thread,
+                sender=self.user,
+                receiver=self.user,
+                content="content",
+                created_at=now - timedelta(minutes=minutes),
+            )
+            for minutes in [3, 2, 2, 2, 1]
+        ]
+
+    def list(self, **params):
+        request = APIRequestFactory().get(
+            "/", {"participant_id": self.participant.id, **params}
+        )
+        force_authenticate(request, self.user)
+        with mock.patch.object(ResponsePagination, "page_size", 2):
+            return ResponseViewSet.as_view({"get": "list"})(request)
+
+    def get_ids(self, response):
+        return [message["id"] for message in response.data["results"]]
+
+    def test_pages_by_keyset_across_ties(self):
+        ids = [response.id for response in self.responses]
+        response = self.list()
+        self.assertEqual(self.get_ids(response), [ids[4], ids[3]])
+        self.assertIsNone(response.data["previous"])
+        self.assertIn("before_id=%s" % ids[3], response.data["next"])
+
+        response = self.list(before_id=ids[3])
+        self.assertEqual(self.get_ids(response), [ids[2], ids[1]])
+        self.assertIn("after_id=%s" % ids[2], response.data["previous"])
+        response = self.list(before_id=ids[1])
+        self.assertEqual(self.get_ids(response), [ids[0]])
+        self.assertIsNone(response.data["next"])
+
+        response = self.list(after_id=ids[1])
+        self.assertEqual(self.get_ids(response), [ids[3], ids[2]])
+        self.assertIsNotNone(response.data["previous"])
+        response = self.list(after_id=ids[3])
+        self.assertEqual(self.get_ids(response), [ids[4]])
+        self.assertIsNone(response.data["previous"])
+
+    def test_invalid_cursors(self):
+        self.assertEqual(self.list(before_id="abc").status_code, 404)
+        self.assertEqual(self.list(after_id=self.responses[-1].id + 1).status_code, 404)
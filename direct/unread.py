@@ -0,0 +1,70 @@
+from django.db.models import Case, F, Value, When
+
+from .events import publish_on_commit
+from .models import Participant, UnreadCounter
+
+
+def is_unconfirmed(participant):
+    return (
+        not participant.is_deleted
+        and not participant.is_read
+        and participant.updated_at > participant.user.direct_confirmed_at
+    )
+
+
+def lock_participant(participant):
+    """
+    Re-reads the state of the participant under a row lock, so that when
+    concurrent requests change the same thread only one of them sees it
+    unconfirmed and counts the change.
+    """
+    participant.is_read, participant.is_deleted, participant.updated_at = (
+        Participant.objects.select_for_update()
+        .filter(id=participant.id)
+        .values_list("is_read", "is_deleted", "updated_at")
+        .get()
+    )
+
+
+def change_unread(user_id, count):
+    """
+    Sets the user's count of unconfirmed threads to the given expression in
+    a single UPDATE, bumps the sequence and publishes the new count once the
+    transaction commits.
+    """
+    UnreadCounter.objects.get_or_create(user_id=user_id)
+    UnreadCounter.objects.filter(user_id=user_id).update(
+        count=count, sequence=F("sequence") + 1
+    )
+    count = UnreadCounter.objects.filter(user_id=user_id).values_list(
+        "count", flat=True
+    )[0]
+    publish_on_commit(user_id, {"type": "unread", "count": count})
+
+
+def update_unread(participant, was_unconfirmed):
+    """
+    Adds one to the counter of the participant's user when the thread just
+    became unconfirmed, or subtracts one when it stopped being unconfirmed.
+    """
+    if is_unconfirmed(participant) == was_unconfirmed:
+        return
+    if was_unconfirmed:
+        count = Case(When(count__gt=0, then=F("count") - 1), default=Value(0))
+    else:
+        count = F("count") + 1
+    change_unread(participant.user_id, count)
+
+
+def reset_unread(user_id):
+    change_unread(user_id, 0)
+
+
+def get_unread(user):
+    """
+    Returns (count, sequence) of the user's unconfirmed threads.
+    """
+    counter = (
+        UnreadCounter.objects.filter(user=user).values_list("count", "sequence").first()
+    )
+    return counter or (0, 0)
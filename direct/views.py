@@ -1,12 +1,12 @@
 from collections import OrderedDict
 
-from django.conf import settings
-from django.core.mail import send_mail
 from django.contrib.sites.shortcuts import get_current_site
+from django.db import transaction
 from django.db.models import Q
 from django.shortcuts import get_object_or_404, render
 from django.template.loader import render_to_string
 from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
 
 from rest_framework import (
     generics,
@@ -19,7 +19,9 @@ from rest_framework import (
 from rest_framework.decorators import action
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
+from .events import DIRECT_SHORT_POLL_INTERVAL, get_events, publish_on_commit
 from .models import Participant, Thread, Response as DirectResponse
 from .serializers import (
     ParticipantLSerializer,
@@ -27,8 +29,19 @@ from .serializers import (
     ResponseLSerializer,
     ResponsePSerializer,
 )
+from .unread import (
+    get_unread,
+    is_unconfirmed,
+    lock_participant,
+    update_unread,
+)
 
 from authentication.models import Block
+from classifieds.engagement import record_event
+from classifieds.models import ItemEvent
+from outbox.mail import queue_mail
+
+from backend.pagination import PageNumberPagination
 
 from pure_pagination import Paginator, EmptyPage, PageNotAnInteger
 
@@ -55,7 +68,33 @@ def detail(request, id):
     return render(request, 'accounts/direct/detail.html')
 
 
-class Pagination(pagination.PageNumberPagination):
+def publish_message(response, *participants):
+    data = dict(ResponseLSerializer(response).data)
+    for participant in participants:
+        publish_on_commit(
+            participant.user_id,
+            {
+                "type": "message",
+                "participant_id": participant.id,
+                "thread_id": response.thread_id,
+                "response": data,
+            },
+        )
+
+
+def publish_read(participant):
+    event = {
+        "type": "read",
+        "thread_id": participant.thread_id,
+        "user_id": participant.user_id,
+    }
+    publish_on_commit(participant.user_id, dict(event, participant_id=participant.id))
+    # The opponent only learns that the thread was read, not the reader's
+    # participant.
+    publish_on_commit(participant.opponent_id, event)
+
+
+class Pagination(PageNumberPagination):
     page_size = 30
 
     def get_paginated_response(self, data):
@@ -63,6 +102,7 @@ class Pagination(pagination.PageNumberPagination):
             OrderedDict(
                 [
                     ("count", self.page.paginator.count),
+                    ("count_type", self.get_count_type()),
                     ("next", self.get_next_link()),
                     ("previous", self.get_previous_link()),
                     ("results", data),
@@ -72,8 +112,91 @@ class Pagination(pagination.PageNumberPagination):
         )
 
 
-class ResponsePagination(pagination.PageNumberPagination):
+class ResponsePagination(pagination.BasePagination):
+    """
+    Pages the messages of a thread by (created_at, id) from a known message
+    instead of an offset: `?before_id=` returns the page_size messages before
+    it and `?after_id=` the ones after it, newest first either way. Messages
+    added meanwhile never shift the pages, and each page is a range scan of
+    the (thread, created_at, id) index.
+    """
+
     page_size = 30
+    ordering = "created_at"
+    before_query_param = "before_id"
+    after_query_param = "after_id"
+    invalid_cursor_message = pagination.CursorPagination.invalid_cursor_message
+
+    def get_cursor(self, request, query_param):
+        cursor = request.query_params.get(query_param)
+        if cursor is None:
+            return None
+        if not cursor.isdigit():
+            raise exceptions.NotFound(self.invalid_cursor_message)
+        return int(cursor)
+
+    def get_position(self, queryset, cursor):
+        position = queryset.filter(id=cursor).values_list(self.ordering, flat=True)
+        if not position:
+            raise exceptions.NotFound(self.invalid_cursor_message)
+        return position[0]
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        before_id = self.get_cursor(request, self.before_query_param)
+        after_id = self.get_cursor(request, self.after_query_param)
+
+        if after_id is not None:
+            position = self.get_position(queryset, after_id)
+            queryset = queryset.filter(
+                Q(**{"%s__gt" % self.ordering: position})
+                | Q(**{self.ordering: position, "id__gt": after_id})
+            ).order_by(self.ordering, "id")
+            results = list(queryset[: self.page_size + 1])
+            self.has_newer = len(results) > self.page_size
+            self.has_older = True
+            self.results = results[: self.page_size][::-1]
+            return self.results
+
+        if before_id is not None:
+            position = self.get_position(queryset, before_id)
+            queryset = queryset.filter(
+                Q(**{"%s__lt" % self.ordering: position})
+                | Q(**{self.ordering: position, "id__lt": before_id})
+            )
+        queryset = queryset.order_by("-%s" % self.ordering, "-id")
+        results = list(queryset[: self.page_size + 1])
+        self.has_older = len(results) > self.page_size
+        self.has_newer = before_id is not None
+        self.results = results[: self.page_size]
+        return self.results
+
+    def get_link(self, query_param, cursor):
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.before_query_param)
+        url = remove_query_param(url, self.after_query_param)
+        return replace_query_param(url, query_param, cursor)
+
+    def get_next_link(self):
+        if not self.has_older or not self.results:
+            return None
+        return self.get_link(self.before_query_param, self.results[-1].id)
+
+    def get_previous_link(self):
+        if not self.has_newer or not self.results:
+            return None
+        return self.get_link(self.after_query_param, self.results[0].id)
+
+    def get_paginated_response(self, data):
+        return Response(
+            OrderedDict(
+                [
+                    ("next", self.get_next_link()),
+                    ("previous", self.get_previous_link()),
+                    ("results", data),
+                ]
+            )
+        )
 
 
 class ParticipantViewSet(viewsets.ModelViewSet):
@@ -92,7 +215,6 @@ class ParticipantViewSet(viewsets.ModelViewSet):
                     "opponent__image",
                     "last_response",
                 )
-                .prefetch_related("thread__item__image_set")
                 .filter(user=self.request.user)
                 .filter(is_deleted=False)
                 .order_by("-updated_at")
@@ -108,16 +230,23 @@ class ParticipantViewSet(viewsets.ModelViewSet):
             return ParticipantRSerializer
         return ParticipantRSerializer
 
+    @transaction.atomic
     def retrieve(self, request, *args, **kwargs):
         instance = self.get_object()
         if instance.user != self.request.user:
             raise exceptions.PermissionDenied()
-        if not instance.is_deleted:
-            instance.is_read = True
-            instance.save()
+        if not instance.is_deleted and not instance.is_read:
+            lock_participant(instance)
+            if not instance.is_deleted and not instance.is_read:
+                was_unconfirmed = is_unconfirmed(instance)
+                instance.is_read = True
+                instance.save()
+                publish_read(instance)
+                update_unread(instance, was_unconfirmed)
         serializer = self.get_serializer(instance)
         return Response(serializer.data)
 
+    @transaction.atomic
     def create(self, request, *args, **kwargs):
         blocked = (
             Block.objects.filter(user=self.request.user)
@@ -143,6 +272,7 @@ class ParticipantViewSet(viewsets.ModelViewSet):
             raise exceptions.ValidationError({"non_field_errors": ["エラーが発生しました。"]})
 
         thread = Thread.objects.create(item_id=self.request.data["item_id"])
+        record_event(thread.item_id, ItemEvent.Type.CONTACT)
 
         response = DirectResponse.objects.create(
             thread=thread,
@@ -176,33 +306,83 @@ class ParticipantViewSet(viewsets.ModelViewSet):
             "domain": get_current_site(self.request).domain,
         }
         message = render_to_string("email/contact_author_message.txt", context)
-        send_mail(
-            "お問い合わせがありました", message, settings.DEFAULT_FROM_EMAIL, [response.receiver]
-        )
+        queue_mail("お問い合わせがありました", message, [response.receiver.email])
+        publish_message(response, participant_sender, participant_receiver)
+        update_unread(participant_receiver, False)
 
         return Response(
             ParticipantLSerializer(participant_sender).data,
             status=status.HTTP_201_CREATED,
         )
 
+    def get_unread_response(self, request, get_data):
+        """
+        Answers If-None-Match from the sequence of the user's counter, which
+        changes whenever the unconfirmed threads do, and only builds the data
+        when the client's copy is stale.
+        """
+        count, sequence = get_unread(self.request.user)
+        etag = '"unread-%s-%s"' % (self.request.user.id, sequence)
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = Response(get_data(count, sequence))
+        response["ETag"] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
     @action(["get"], detail=False)
     def unconfirmed(self, request, *args, **kwargs):
-        return Response(
-            list(
+        def get_data(count, sequence):
+            # The counter already says when there is nothing to list.
+            if not count:
+                return []
+            return list(
                 Participant.objects.filter(user=self.request.user)
                 .filter(is_deleted=False)
                 .filter(is_read=False)
                 .filter(updated_at__gt=self.request.user.direct_confirmed_at)
                 .values_list("id", flat=True)
             )
+
+        return self.get_unread_response(request, get_data)
+
+    @action(["get"], detail=False, url_path="unconfirmed-count")
+    def unconfirmed_count(self, request, *args, **kwargs):
+        """
+        Returns the number of unconfirmed threads for the header badge from
+        the user's counter, without touching the participants.
+        """
+        return self.get_unread_response(
+            request, lambda count, sequence: {"count": count, "sequence": sequence}
+        )
+
+    @action(["get"], detail=False)
+    def events(self, request, *args, **kwargs):
+        """
+        Short-polling fallback of the direct message event stream for clients
+        that can't reach it: returns the events after ?since= right away,
+        with Retry-After telling the client when to ask again. Without since
+        it returns the current sequence.
+        """
+        since = self.request.query_params.get("since", "")
+        sequence, events = get_events(
+            self.request.user.id, int(since) if since.isdigit() else None
+        )
+        return Response(
+            {"sequence": sequence, "events": events},
+            headers={"Retry-After": str(DIRECT_SHORT_POLL_INTERVAL)},
         )
 
     @action(["post"], detail=True, url_path="mark-delete")
+    @transaction.atomic
     def mark_delete(self, request, *args, **kwargs):
         instance = self.get_object()
+        lock_participant(instance)
+        was_unconfirmed = is_unconfirmed(instance)
         instance.is_deleted = True
         instance.deleted_at = timezone.now()
         instance.save()
+        update_unread(instance, was_unconfirmed)
         return Response(status=status.HTTP_200_OK)
 
 
@@ -212,6 +392,11 @@ class ResponseViewSet(viewsets.ModelViewSet):
     pagination_class = ResponsePagination
 
     def list(self, request, *args, **kwargs):
+        """
+        Lists the messages of the participant's thread newest first, 30 at a
+        time. ?before_id= scrolls back from a message, and ?after_id= fetches
+        the messages newer than one, e.g. when the client reconnects.
+        """
         participant_id = self.request.query_params.get("participant_id", None)
         participant = get_object_or_404(
             Participant.objects.select_related("thread"), id=participant_id
@@ -222,7 +407,7 @@ class ResponseViewSet(viewsets.ModelViewSet):
             .filter(thread=participant.thread)
             .filter(created_at__gte=participant.deleted_at)
             .exclude(~Q(sender=self.request.user), receiver__isnull=True)
-            .reverse()
+            .order_by("-created_at", "-id")
         )
 
         page = self.paginate_queryset(queryset)
@@ -246,14 +431,28 @@ class ResponseViewSet(viewsets.ModelViewSet):
         )
         return response
 
+    def lock_participants(self, response):
+        """
+        Returns the participants of the response's thread by user id, locked
+        in one query so that the two sides replying at once don't deadlock.
+        """
+        participants = response.thread.participant_set.select_for_update()
+        return {
+            participant.user_id: participant
+            for participant in participants.order_by("id")
+        }
+
     def update_participant(self, participant, response):
+        was_unconfirmed = is_unconfirmed(participant)
         participant.last_response = response
         participant.updated_at = response.created_at
         participant.is_deleted = False
         if participant.user != self.request.user:
             participant.is_read = False
         participant.save()
+        update_unread(participant, was_unconfirmed)
 
+    @transaction.atomic
     def create(self, request, *args, **kwargs):
         blocked = (
             Block.objects.filter(user=self.request.user)
@@ -272,19 +471,20 @@ class ResponseViewSet(viewsets.ModelViewSet):
         if not is_blocked:
             response = self.save_response(is_blocked=False)
 
-            participants = response.thread.participant_set.all()
-            participant_sender = participants.get(user=self.request.user)
-            participant_receiver = participants.get(user=response.receiver)
+            participants = self.lock_participants(response)
+            participant_sender = participants[self.request.user.id]
+            participant_receiver = participants[response.receiver_id]
 
             self.update_participant(participant_sender, response)
             self.update_participant(participant_receiver, response)
+            publish_message(response, participant_sender, participant_receiver)
         else:
             response = self.save_response(is_blocked=True)
 
-            participants = response.thread.participant_set.all()
-            participant_sender = participants.get(user=self.request.user)
+            participant_sender = self.lock_participants(response)[self.request.user.id]
 
             self.update_participant(participant_sender, response)
+            publish_message(response, participant_sender)
 
         data = {
             "response": ResponseLSerializer(response).data,
@@ -0,0 +1,86 @@
+import math
+
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def encode(latitude, longitude, precision=9):
+    latitude_range = [-90.0, 90.0]
+    longitude_range = [-180.0, 180.0]
+    geohash = []
+    bits = 0
+    bit_count = 0
+    is_longitude = True
+    while len(geohash) < precision:
+        if is_longitude:
+            value, value_range = longitude, longitude_range
+        else:
+            value, value_range = latitude, latitude_range
+        middle = (value_range[0] + value_range[1]) / 2
+        if value >= middle:
+            bits = bits * 2 + 1
+            value_range[0] = middle
+        else:
+            bits = bits * 2
+            value_range[1] = middle
+        is_longitude = not is_longitude
+        bit_count += 1
+        if bit_count == 5:
+            geohash.append(BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return "".join(geohash)
+
+
+def get_cell_size(precision):
+    """
+    Returns the (height, width) of a geohash cell in degrees.
+    """
+    longitude_bits = math.ceil(precision * 5 / 2)
+    latitude_bits = precision * 5 // 2
+    return 180.0 / 2**latitude_bits, 360.0 / 2**longitude_bits
+
+
+def get_covering_cells(latitude, longitude, radius_km):
+    """
+    Returns the geohash prefixes of the 3x3 block of cells around a point,
+    using the finest precision whose cells are still larger than the radius,
+    so that every point within the radius falls in one of them.
+    """
+    latitude_km = KM_PER_DEGREE
+    longitude_km = KM_PER_DEGREE * max(math.cos(math.radians(latitude)), 0.01)
+
+    precision = 1
+    for candidate in range(1, 10):
+        height, width = get_cell_size(candidate)
+        if height * latitude_km < radius_km or width * longitude_km < radius_km:
+            break
+        precision = candidate
+
+    height, width = get_cell_size(precision)
+    cells = set()
+    for latitude_offset in (-height, 0, height):
+        for longitude_offset in (-width, 0, width):
+            neighbour_latitude = min(max(latitude + latitude_offset, -90.0), 90.0)
+            neighbour_longitude = (longitude + longitude_offset + 180.0) % 360.0 - 180.0
+            cells.add(encode(neighbour_latitude, neighbour_longitude, precision))
+    return sorted(cells)
+
+
+def get_distance(latitude1, longitude1, latitude2, longitude2):
+    """
+    Returns the great-circle distance between two points in kilometres.
+    """
+    latitude1, longitude1, latitude2, longitude2 = map(
+        math.radians, (latitude1, longitude1, latitude2, longitude2)
+    )
+    a = (
+        math.sin((latitude2 - latitude1) / 2) ** 2
+        + math.cos(latitude1)
+        * math.cos(latitude2)
+        * math.sin((longitude2 - longitude1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
@@ -0,0 +1,30 @@
+# Generated by Django 3.2.7 on 2026-10-18 10:48
+
+from django.db import migrations, models
+
+from locations.geohash import encode
+
+
+def set_geohashes(apps, schema_editor):
+    Location = apps.get_model("locations", "Location")
+    locations = []
+    for location in Location.objects.exclude(latitude=None).exclude(longitude=None):
+        location.geohash = encode(float(location.latitude), float(location.longitude))
+        locations.append(location)
+    Location.objects.bulk_update(locations, ["geohash"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('locations', '0002_locationclosure'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, max_length=12, null=True),
+        ),
+        migrations.RunPython(set_geohashes, migrations.RunPython.noop),
+    ]
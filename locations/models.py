@@ -1,4 +1,20 @@
+from django.conf import settings
 from django.db import models
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from backend.cache import invalidate_tags
+from backend.utils import update_closure
+
+from .geohash import encode, get_covering_cells, get_distance
+
+from functools import reduce
+import operator
+
+
+DEFAULT_RADIUS_KM = 10
+MAX_RADIUS_KM = getattr(settings, "MAX_RADIUS_KM", 100)
 
 
 class Location(models.Model):
@@ -23,9 +39,85 @@ class Location(models.Model):
         max_digits=9, decimal_places=6, null=True, blank=True
     )
     level = models.IntegerField(default=1, null=True, blank=True)
+    geohash = models.CharField(max_length=12, null=True, blank=True, db_index=True)
 
     class Meta:
         ordering = ["id"]
 
     def __str__(self):
         return self.name
+
+    def save(self, *args, **kwargs):
+        self.geohash = get_geohash(self.latitude, self.longitude)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and (
+            "latitude" in update_fields or "longitude" in update_fields
+        ):
+            kwargs["update_fields"] = set(update_fields) | {"geohash"}
+        super().save(*args, **kwargs)
+
+
+def get_geohash(latitude, longitude):
+    if latitude is None or longitude is None:
+        return None
+    return encode(float(latitude), float(longitude))
+
+
+def get_nearby_locations(location_id, radius_km):
+    """
+    Returns a {location_id: distance_km} dict of the located places within
+    radius_km of the given location. Candidates come from a geohash prefix
+    scan, so only the places in the surrounding cells are measured.
+    """
+    center = (
+        Location.objects.filter(id=location_id, latitude__isnull=False)
+        .exclude(longitude=None)
+        .values("latitude", "longitude")
+        .first()
+    )
+    if center is None:
+        return {}
+
+    latitude = float(center["latitude"])
+    longitude = float(center["longitude"])
+    radius_km = min(radius_km, MAX_RADIUS_KM)
+    cells = get_covering_cells(latitude, longitude, radius_km)
+    candidates = Location.objects.filter(
+        reduce(operator.or_, [Q(geohash__istartswith=cell) for cell in cells])
+    ).values_list("id", "latitude", "longitude")
+
+    nearby = {}
+    for id, candidate_latitude, candidate_longitude in candidates:
+        distance = get_distance(
+            latitude,
+            longitude,
+            float(candidate_latitude),
+            float(candidate_longitude),
+        )
+        if distance <= radius_km:
+            nearby[id] = distance
+    return nearby
+
+
+class LocationClosure(models.Model):
+    ancestor = models.ForeignKey(
+        Location, on_delete=models.CASCADE, related_name="descendant_closures"
+    )
+    descendant = models.ForeignKey(
+        Location, on_delete=models.CASCADE, related_name="ancestor_closures"
+    )
+    depth = models.IntegerField()
+
+    class Meta:
+        unique_together = ["ancestor", "descendant"]
+
+
+@receiver(post_save, sender=Location)
+def save_location(sender, instance, **kwargs):
+    update_closure(instance, LocationClosure)
+
+
+@receiver(post_save, sender=Location)
+@receiver(post_delete, sender=Location)
+def invalidate_location_results(sender, **kwargs):
+    invalidate_tags(["locations"])
@@ -1,3 +1,46 @@
 from django.test import TestCase
 
-# Create your tests here.
+from .geohash import encode, get_cell_size, get_covering_cells, get_distance
+from .models import Location, get_nearby_locations
+
+
+class GeohashTests(TestCase):
+    def test_encode(self):
+        self.assertEqual(encode(57.64911, 10.40744, 11), "u4pruydqqvj")
+        self.assertEqual(encode(-33.8688, 151.2093, 5), "r3gx2")
+
+    def test_cell_size(self):
+        self.assertEqual(get_cell_size(1), (45.0, 45.0))
+        self.assertEqual(get_cell_size(2), (5.625, 11.25))
+
+    def test_covering_cells_contain_points_within_the_radius(self):
+        cells = get_covering_cells(-33.8688, 151.2093, 25)
+        # Parramatta is about 20 km west of the Sydney CBD.
+        self.assertTrue(any(encode(-33.8150, 151.0011).startswith(c) for c in cells))
+        self.assertLessEqual(len(cells), 9)
+
+    def test_distance(self):
+        self.assertAlmostEqual(
+            get_distance(-33.8688, 151.2093, -37.8136, 144.9631), 713.4, delta=1
+        )
+
+
+class NearbyLocationTests(TestCase):
+    def test_nearby_locations(self):
+        sydney = Location.objects.create(
+            name="Sydney", latitude="-33.868800", longitude="151.209300"
+        )
+        parramatta = Location.objects.create(
+            name="Parramatta", latitude="-33.815000", longitude="151.001100"
+        )
+        Location.objects.create(
+            name="Melbourne", latitude="-37.813600", longitude="144.963100"
+        )
+        Location.objects.create(name="Unknown")
+
+        self.assertEqual(sydney.geohash, encode(-33.8688, 151.2093))
+        self.assertEqual(set(get_nearby_locations(sydney.id, 10)), {sydney.id})
+        self.assertEqual(
+            set(get_nearby_locations(sydney.id, 30)), {sydney.id, parramatta.id}
+        )
+        self.assertEqual(get_nearby_locations(0, 10), {})
@@ -14,7 +14,15 @@ from .serializers import (
     LocationOptionSerializer,
 )
 
-from classifieds.models import Item
+from backend.cache import cache_result
+
+from classifieds.models import Item, ItemFacet
+
+
+def get_location_set_tags(query_params):
+    if query_params.get("selected_id"):
+        return ["locations", "items"]
+    return ["locations"]
 
 
 def api_autocomplete(request):
@@ -80,6 +88,7 @@ class LocationViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
     @action(["get"], detail=False)
+    @cache_result("location-set", ("selected_id",), get_location_set_tags)
     def set(self, request, *args, **kwargs):
         data = {
             "selected": None,
@@ -100,8 +109,8 @@ class LocationViewSet(viewsets.ModelViewSet):
             selected_location = get_object_or_404(locations, id=selected_id)
             if selected_location.level == 1:
                 l2_locations = selected_location.children.filter(
-                    item__isnull=False
-                ).distinct()
+                    id__in=ItemFacet.objects.values("location_id")
+                )
                 data["selected"] = LocationSerializer(selected_location).data
                 data["l1_value"] = int(selected_id)
                 data["l2_options"] = LocationOptionSerializer(
@@ -109,8 +118,8 @@ class LocationViewSet(viewsets.ModelViewSet):
                 ).data
             elif selected_location.level == 2:
                 l2_locations = selected_location.parent.children.filter(
-                    item__isnull=False
-                ).distinct()
+                    id__in=ItemFacet.objects.values("location_id")
+                )
                 data["selected"] = LocationSerializer(selected_location).data
                 data["l1_value"] = selected_location.parent_id
                 data["l2_value"] = int(selected_id)
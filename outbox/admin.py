@@ -0,0 +1,20 @@
+from django.contrib import admin
+from django.utils import timezone
+from .models import Email
+
+
+@admin.action(description="選択したメールを再送する")
+def retry(modeladmin, request, queryset):
+    queryset.exclude(status=Email.Status.SENT).update(
+        status=Email.Status.PENDING, attempts=0, next_attempt_at=timezone.now()
+    )
+
+
+class EmailAdmin(admin.ModelAdmin):
+    list_display = ("subject", "status", "attempts", "created_at", "sent_at")
+    list_filter = ("status",)
+    search_fields = ("subject", "key")
+    actions = [retry]
+
+
+admin.site.register(Email, EmailAdmin)
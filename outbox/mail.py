@@ -0,0 +1,160 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Email
+
+import hashlib
+
+
+OUTBOX_BATCH_SIZE = getattr(settings, "OUTBOX_BATCH_SIZE", 100)
+OUTBOX_MAX_ATTEMPTS = getattr(settings, "OUTBOX_MAX_ATTEMPTS", 8)
+OUTBOX_RETRY_DELAY = getattr(settings, "OUTBOX_RETRY_DELAY", 60)
+OUTBOX_MAX_RETRY_DELAY = getattr(settings, "OUTBOX_MAX_RETRY_DELAY", 60 * 60 * 6)
+OUTBOX_DEDUPE_WINDOW = getattr(settings, "OUTBOX_DEDUPE_WINDOW", 60 * 10)
+OUTBOX_RETENTION = getattr(settings, "OUTBOX_RETENTION", 60 * 60 * 24 * 30)
+# How long a claimed email is left to its worker before another one may pick
+# it up again, in case the first died while sending it.
+OUTBOX_CLAIM_TIMEOUT = getattr(settings, "OUTBOX_CLAIM_TIMEOUT", 60 * 10)
+
+
+def get_key(subject, message, recipients):
+    return hashlib.sha256(
+        ("%s\n%s\n%s" % (",".join(recipients), subject, message)).encode()
+    ).hexdigest()
+
+
+def queue_mail(subject, message, recipient_list, from_email=None, key=None):
+    """
+    Writes the email to the outbox in the current transaction, and wakes the
+    sender up once it commits. An email with the same key queued within
+    OUTBOX_DEDUPE_WINDOW is not queued again; without a key the recipients,
+    subject and message make the key, so only identical repeats are dropped.
+    Returns the queued Email, or None for a duplicate.
+    """
+    from .tasks import send_queued_emails
+
+    recipients = [str(recipient) for recipient in recipient_list]
+    key = key or get_key(subject, message, recipients)
+    duplicates = Email.objects.filter(
+        key=key,
+        created_at__gte=timezone.now() - timedelta(seconds=OUTBOX_DEDUPE_WINDOW),
+    ).exclude(status=Email.Status.FAILED)
+    if duplicates.exists():
+        return None
+
+    email = Email.objects.create(
+        key=key,
+        subject=subject,
+        message=message,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        recipients=recipients,
+    )
+    transaction.on_commit(lambda: send_queued_emails.delay())
+    return email
+
+
+def get_retry_delay(attempts):
+    return min(OUTBOX_RETRY_DELAY * 2 ** (attempts - 1), OUTBOX_MAX_RETRY_DELAY)
+
+
+def defer(email, error, now):
+    email.last_error = "%s: %s" % (type(error).__name__, error)
+    if email.attempts >= OUTBOX_MAX_ATTEMPTS:
+        email.status = Email.Status.FAILED
+    else:
+        email.next_attempt_at = now + timedelta(seconds=get_retry_delay(email.attempts))
+
+
+def send_batch(emails, connection):
+    now = timezone.now()
+    try:
+        connection.open()
+    except Exception as e:
+        for email in emails:
+            defer(email, e, now)
+        return
+
+    for email in emails:
+        try:
+            connection.send_messages(
+                [
+                    EmailMessage(
+                        email.subject,
+                        email.message,
+                        email.from_email,
+                        email.recipients,
+                    )
+                ]
+            )
+        except Exception as e:
+            # The connection may be broken; the next message opens a new one.
+            connection.close()
+            defer(email, e, now)
+        else:
+            email.status = Email.Status.SENT
+            email.sent_at = timezone.now()
+            email.last_error = ""
+
+
+def claim_emails(batch_size):
+    """
+    Claims a batch of due emails by counting the attempt and moving their
+    next attempt OUTBOX_CLAIM_TIMEOUT ahead, so that no other worker picks
+    them up while they are being sent. The rows are selected with
+    SELECT ... FOR UPDATE SKIP LOCKED (MySQL 8.0.1 or later) and only stay
+    locked until the claim commits.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        emails = list(
+            Email.objects.select_for_update(skip_locked=True)
+            .filter(status=Email.Status.PENDING, next_attempt_at__lte=now)
+            .order_by("next_attempt_at", "id")[:batch_size]
+        )
+        for email in emails:
+            email.attempts += 1
+            email.next_attempt_at = now + timedelta(seconds=OUTBOX_CLAIM_TIMEOUT)
+        Email.objects.bulk_update(emails, ["attempts", "next_attempt_at"])
+    return emails
+
+
+def deliver_emails(batch_size=OUTBOX_BATCH_SIZE):
+    """
+    Sends the due emails of the outbox over one SMTP connection per batch.
+    Each batch is claimed and committed before it is sent, so no database
+    transaction or row lock is held while talking to the SMTP server.
+    Failed sends are retried with exponential backoff and given up after
+    OUTBOX_MAX_ATTEMPTS. Returns the number of emails sent.
+    """
+    sent = 0
+    while True:
+        emails = claim_emails(batch_size)
+        if not emails:
+            break
+
+        connection = get_connection()
+        try:
+            send_batch(emails, connection)
+        finally:
+            connection.close()
+
+        Email.objects.bulk_update(
+            emails, ["status", "last_error", "next_attempt_at", "sent_at"]
+        )
+        sent += sum(email.status == Email.Status.SENT for email in emails)
+    return sent
+
+
+def purge_emails():
+    """
+    Deletes the sent emails older than OUTBOX_RETENTION. Failed ones are
+    kept for the admin to retry.
+    """
+    return Email.objects.filter(
+        status=Email.Status.SENT,
+        sent_at__lt=timezone.now() - timedelta(seconds=OUTBOX_RETENTION),
+    ).delete()[0]
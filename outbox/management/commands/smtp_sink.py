@@ -0,0 +1,91 @@
+from django.core.management.base import BaseCommand
+
+import socketserver
+import threading
+import time
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    """
+    Speaks just enough SMTP for Django's SMTP backend: every message is
+    accepted, counted and thrown away.
+    """
+
+    def reply(self, line):
+        self.wfile.write(("%s\r\n" % line).encode())
+
+    def handle(self):
+        self.reply("220 smtp-sink ready")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode("utf-8", "replace").strip().split(" ")[0].upper()
+            if command == "EHLO":
+                self.reply("250-smtp-sink")
+                self.reply("250 8BITMIME")
+            elif command == "DATA":
+                self.reply("354 end data with <CR><LF>.<CR><LF>")
+                size = 0
+                for line in iter(self.rfile.readline, b""):
+                    if line in (b".\r\n", b".\n"):
+                        break
+                    size += len(line)
+                time.sleep(self.server.delay)
+                self.server.received(size)
+                self.reply("250 OK")
+            elif command == "QUIT":
+                self.reply("221 bye")
+                return
+            else:
+                # HELO, MAIL, RCPT, RSET and NOOP
+                self.reply("250 OK")
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address, delay, stdout):
+        super().__init__(address, SMTPHandler)
+        self.delay = delay
+        self.stdout = stdout
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def received(self, size):
+        with self.lock:
+            self.count += 1
+            self.stdout.write("Received message %s (%s bytes)." % (self.count, size))
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs a local SMTP server that accepts and discards every message, for "
+        "testing and benchmarking the outbox. Point EMAIL_URL at "
+        "smtp://localhost:<port>."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=1025)
+        parser.add_argument(
+            "--delay",
+            type=float,
+            default=0,
+            help="Seconds to wait before accepting each message.",
+        )
+
+    def handle(self, *args, **options):
+        server = SMTPSink(
+            (options["host"], options["port"]), options["delay"], self.stdout
+        )
+        self.stdout.write(
+            "SMTP sink listening on %s:%s." % (options["host"], options["port"])
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
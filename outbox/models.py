@@ -0,0 +1,30 @@
+from django.db import models
+from django.utils import timezone
+
+
+class Email(models.Model):
+    class Status(models.TextChoices):
+        PENDING = "pending", "PENDING"
+        SENT = "sent", "SENT"
+        FAILED = "failed", "FAILED"
+
+    key = models.CharField(max_length=255, db_index=True)
+    subject = models.CharField(max_length=255)
+    message = models.TextField()
+    from_email = models.CharField(max_length=255)
+    recipients = models.JSONField()
+    status = models.CharField(
+        max_length=20, choices=Status.choices, default=Status.PENDING
+    )
+    attempts = models.IntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(default=timezone.now)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+        indexes = [models.Index(fields=["status", "next_attempt_at"])]
+
+    def __str__(self):
+        return "%s (%s)" % (self.subject, ", ".join(self.recipients))
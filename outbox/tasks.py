@@ -0,0 +1,13 @@
+from outbox.mail import deliver_emails, purge_emails
+
+from celery import shared_task
+
+
+@shared_task
+def send_queued_emails():
+    return deliver_emails()
+
+
+@shared_task
+def purge_sent_emails():
+    return purge_emails()
@@ -0,0 +1,86 @@
+from datetime import timedelta
+from smtplib import SMTPException
+
+from django.core import mail
+from django.core.mail.backends.base import BaseEmailBackend
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from .mail import OUTBOX_MAX_ATTEMPTS, claim_emails, deliver_emails, queue_mail
+from .models import Email
+
+
+class FailingBackend(BaseEmailBackend):
+    def send_messages(self, email_messages):
+        raise SMTPException("unavailable")
+
+
+class RecordingBackend(BaseEmailBackend):
+    in_atomic_block = []
+
+    def send_messages(self, email_messages):
+        self.in_atomic_block.append(connection.in_atomic_block)
+        return len(email_messages)
+
+
+class QueueMailTests(TestCase):
+    def test_identical_emails_are_queued_once(self):
+        self.assertIsNotNone(queue_mail("subject", "message", ["a@example.com"]))
+        self.assertIsNone(queue_mail("subject", "message", ["a@example.com"]))
+        self.assertIsNotNone(queue_mail("subject", "other", ["a@example.com"]))
+        self.assertEqual(Email.objects.count(), 2)
+
+    def test_failed_emails_can_be_queued_again(self):
+        queue_mail("subject", "message", ["a@example.com"])
+        Email.objects.update(status=Email.Status.FAILED)
+        self.assertIsNotNone(queue_mail("subject", "message", ["a@example.com"]))
+
+
+class DeliverEmailsTests(TestCase):
+    def test_sends_due_emails(self):
+        queue_mail("subject", "message", ["a@example.com"])
+        queue_mail("later", "message", ["b@example.com"])
+        Email.objects.filter(subject="later").update(
+            next_attempt_at=timezone.now() + timedelta(hours=1)
+        )
+
+        self.assertEqual(deliver_emails(), 1)
+        self.assertEqual([message.subject for message in mail.outbox], ["subject"])
+        email = Email.objects.get(subject="subject")
+        self.assertEqual(email.status, Email.Status.SENT)
+        self.assertEqual(email.attempts, 1)
+        self.assertEqual(deliver_emails(), 0)
+
+    def test_claimed_emails_are_not_claimed_again(self):
+        queue_mail("subject", "message", ["a@example.com"])
+        self.assertEqual(len(claim_emails(10)), 1)
+        self.assertEqual(claim_emails(10), [])
+        self.assertEqual(deliver_emails(), 0)
+
+    @override_settings(EMAIL_BACKEND="outbox.tests.FailingBackend")
+    def test_failed_sends_are_retried_and_given_up(self):
+        queue_mail("subject", "message", ["a@example.com"])
+        for attempt in range(1, OUTBOX_MAX_ATTEMPTS + 1):
+            self.assertEqual(deliver_emails(), 0)
+            email = Email.objects.get()
+            self.assertEqual(email.attempts, attempt)
+            self.assertIn("SMTPException", email.last_error)
+            Email.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(email.status, Email.Status.FAILED)
+
+
+class DeliverEmailsTransactionTests(TransactionTestCase):
+    @override_settings(EMAIL_BACKEND="outbox.tests.RecordingBackend")
+    def test_sends_outside_the_claim_transaction(self):
+        RecordingBackend.in_atomic_block.clear()
+        # Created directly, since queue_mail would wake the Celery worker.
+        Email.objects.create(
+            key="key",
+            subject="subject",
+            message="message",
+            from_email="from@example.com",
+            recipients=["a@example.com"],
+        )
+        self.assertEqual(deliver_emails(), 1)
+        self.assertEqual(RecordingBackend.in_atomic_block, [False])